@@ -1,9 +1,11 @@
 from http import HTTPStatus
+from typing import Any
 
 from aiohttp.web import Response
 
 from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
 from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.resources import ResourceContainer
 from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
 
 
@@ -13,10 +15,24 @@ class MyAppNotionOAuthConsumer(DefaultNotionOAuthConsumer):
     where it is saved, etc.
     """
 
-    async def _connect_to_database(self) -> None:  # Not a mandatory method - just as an example
-        # Connect somewhere or something
+    _db_pool: Any = None
+
+    async def _create_database_pool(self) -> Any:  # Not a mandatory method - just as an example
+        # Create a connection pool, e.g.:
+        # return await asyncpg.create_pool(dsn=self.custom_settings['database_dsn'])
         print(f'MyApp settings: {self.custom_settings}')
-        # return something here?
+
+    async def on_startup(self, resources: ResourceContainer) -> None:
+        """
+        Optional - called once when the app starts.
+
+        Connect here rather than in `consume_token_info`,
+        so that the connections are reused across redirects.
+        Resources added to the container are closed when the app stops.
+        """
+
+        # With a real pool, also pass the function that closes it: `close=lambda pool: pool.close()`
+        self._db_pool = await resources.get_or_create('db_pool', self._create_database_pool)
 
     async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
         """
@@ -26,8 +42,8 @@ class MyAppNotionOAuthConsumer(DefaultNotionOAuthConsumer):
         - save `access_token` to database
         """
 
-        await self._connect_to_database()  # maybe?
-        # Do something
+        # async with self._db_pool.acquire() as connection:
+        #     ...  # Do something
 
 
 class MyAppNotionOAuthRedirectView(DefaultNotionOAuthRedirectView):
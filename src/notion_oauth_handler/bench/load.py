@@ -0,0 +1,269 @@
+"""
+Load-testing benchmark.
+
+Starts the Notion mock and the OAuth handling server locally (in this process),
+points the server's `NotionOAuthHandler` at the mock
+and drives the auth and document endpoints with a fixed concurrency (closed loop)
+or at a fixed request rate (open loop).
+In the open loop, latency is measured from the time each request was scheduled to be sent,
+so the time it waits behind the concurrency limit is counted too.
+
+Since the load generator shares the process (and the event loop) with the server,
+absolute numbers are lower than those of a standalone server;
+the results are meant for comparison between runs and versions.
+"""
+
+import asyncio
+import json
+import platform
+import socket
+import tempfile
+import time
+import uuid
+from importlib import metadata
+from typing import Any, Awaitable, Callable, Optional
+
+import aiohttp
+import attr
+from aiohttp import web
+
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+from notion_oauth_handler.server.app import make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+from notion_oauth_handler.server.config import DocumentConfig
+
+
+AUTH_TARGET = 'auth'
+DOCUMENT_TARGET = 'document'
+TARGETS = (AUTH_TARGET, DOCUMENT_TARGET)
+
+_AUTH_PATH = '/auth'
+_DOCUMENT_PATH = '/privacy'
+_CLIENT_ID = 'bench-client-id'
+_CLIENT_SECRET = 'bench-client-secret'
+
+
+class _BenchNotionOAuthConsumer(DefaultNotionOAuthConsumer):
+    async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
+        pass
+
+
+@attr.s(frozen=True)
+class LoadSettings:
+    targets: tuple[str, ...] = attr.ib(kw_only=True, default=TARGETS)
+    concurrency: int = attr.ib(kw_only=True, default=32)
+    requests: int = attr.ib(kw_only=True, default=2000)  # Per target
+    duration: float = attr.ib(kw_only=True, default=0.0)  # Per target; overrides `requests` if set
+    rate: float = attr.ib(kw_only=True, default=0.0)  # Requests per second; 0 means as fast as possible
+    upstream_delay: float = attr.ib(kw_only=True, default=0.0)
+    upstream_error_rate: float = attr.ib(kw_only=True, default=0.0)
+    document_size: int = attr.ib(kw_only=True, default=32 * 1024)
+    accept_encoding: str = attr.ib(kw_only=True, default='gzip, br')
+
+
+@attr.s
+class TargetResult:
+    target: str = attr.ib(kw_only=True)
+    latencies: list[float] = attr.ib(kw_only=True, factory=list)
+    statuses: dict[str, int] = attr.ib(kw_only=True, factory=dict)
+    errors: int = attr.ib(kw_only=True, default=0)
+    elapsed: float = attr.ib(kw_only=True, default=0.0)
+
+    def record(self, status: str, latency: float) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def to_dict(self) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        total = len(latencies)
+
+        def percentile(fraction: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(total - 1, int(fraction * total))] * 1000
+
+        return {
+            'requests': total,
+            'errors': self.errors,
+            'statuses': self.statuses,
+            'elapsed_s': round(self.elapsed, 3),
+            'throughput_rps': round(total / self.elapsed, 1) if self.elapsed else 0.0,
+            'latency_ms': {
+                'min': round(percentile(0.0), 3),
+                'mean': round(sum(latencies) / total * 1000, 3) if total else 0.0,
+                'p50': round(percentile(0.50), 3),
+                'p90': round(percentile(0.90), 3),
+                'p99': round(percentile(0.99), 3),
+                'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            },
+        }
+
+
+def _bind_local_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+async def _start_app(app: web.Application) -> tuple[web.AppRunner, str]:
+    sock = _bind_local_socket()
+    host, port = sock.getsockname()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    return runner, f'http://{host}:{port}'
+
+
+def get_package_version() -> str:
+    try:
+        return metadata.version('notion-oauth-handler')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def write_report(report: dict[str, Any], output_file: str) -> None:
+    with open(output_file, 'w') as output:
+        json.dump(report, output, indent=2)
+
+
+@attr.s
+class LoadBenchmark:
+    _settings: LoadSettings = attr.ib(kw_only=True, factory=LoadSettings)
+
+    async def _drive(
+            self, session: aiohttp.ClientSession, target: str, make_request: Callable[[], Awaitable[str]],
+    ) -> TargetResult:
+        settings = self._settings
+        result = TargetResult(target=target)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        stop_at = start + settings.duration if settings.duration else None
+        issued = 0
+
+        def has_more() -> bool:
+            if stop_at is not None:
+                return loop.time() < stop_at
+            return issued < settings.requests
+
+        async def send_one(scheduled_at: Optional[float] = None) -> None:
+            request_start = time.perf_counter() if scheduled_at is None else scheduled_at
+            try:
+                status = await make_request()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                result.errors += 1
+                status = 'error'
+            result.record(status, time.perf_counter() - request_start)
+
+        if settings.rate > 0:
+            # Open loop: requests are issued on schedule regardless of how fast they complete
+            semaphore = asyncio.Semaphore(settings.concurrency)
+            tasks: set[asyncio.Task] = set()
+
+            async def send_limited(scheduled_at: float) -> None:
+                async with semaphore:
+                    await send_one(scheduled_at)
+
+            interval = 1 / settings.rate
+            perf_start = time.perf_counter()
+            while has_more():
+                task = asyncio.create_task(send_limited(perf_start + issued * interval))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                issued += 1
+                await asyncio.sleep(max(0.0, start + issued * interval - loop.time()))
+            if tasks:
+                await asyncio.gather(*tasks)
+        else:
+            # Closed loop: each worker sends its next request as soon as the previous one completes
+            async def worker() -> None:
+                nonlocal issued
+                while has_more():
+                    issued += 1
+                    await send_one()
+
+            await asyncio.gather(*(worker() for _ in range(settings.concurrency)))
+
+        result.elapsed = loop.time() - start
+        return result
+
+    async def run(self) -> dict[str, Any]:
+        settings = self._settings
+        mock_runner, mock_url = await _start_app(make_mock_app(MockSettings(
+            client_id=_CLIENT_ID,
+            client_secret=_CLIENT_SECRET,
+            delay=settings.upstream_delay,
+            error_rate=settings.upstream_error_rate,
+        )))
+
+        with tempfile.NamedTemporaryFile(suffix='.html') as doc_file:
+            # Somewhat compressible content, similar to a real HTML document
+            words = [uuid.uuid4().hex[:8] for _ in range(200)]
+            doc_text = '<p>' + ' '.join(words[i % len(words)] for i in range(settings.document_size // 9)) + '</p>'
+            doc_file.write(doc_text.encode())
+            doc_file.flush()
+
+            server_app = make_app(
+                consumer=_BenchNotionOAuthConsumer(custom_settings={}),
+                auth_view_cls=DefaultNotionOAuthRedirectView,
+                notion_client_id=_CLIENT_ID,
+                notion_client_secret=_CLIENT_SECRET,
+                notion_base_url=mock_url,
+                auth_path=_AUTH_PATH,
+                documents={_DOCUMENT_PATH: DocumentConfig(filename=doc_file.name, content_type='text/html')},
+                custom_settings={},
+            )
+            server_runner, server_url = await _start_app(server_app)
+
+        results: dict[str, Any] = {}
+        connector = aiohttp.TCPConnector(limit=settings.concurrency)
+        try:
+            async with aiohttp.ClientSession(connector=connector, auto_decompress=False) as session:
+                async def request_auth() -> str:
+                    params = {'code': uuid.uuid4().hex, 'state': 'bench'}
+                    async with session.get(f'{server_url}{_AUTH_PATH}', params=params) as response:
+                        await response.read()
+                        return str(response.status)
+
+                async def request_document() -> str:
+                    headers = {'Accept-Encoding': settings.accept_encoding}
+                    async with session.get(f'{server_url}{_DOCUMENT_PATH}', headers=headers) as response:
+                        await response.read()
+                        return str(response.status)
+
+                request_funcs = {AUTH_TARGET: request_auth, DOCUMENT_TARGET: request_document}
+                for target in settings.targets:
+                    target_result = await self._drive(session, target=target, make_request=request_funcs[target])
+                    results[target] = target_result.to_dict()
+        finally:
+            await server_runner.cleanup()
+            await mock_runner.cleanup()
+
+        return {
+            'version': get_package_version(),
+            'python': platform.python_version(),
+            'timestamp': time.time(),
+            'settings': {**attr.asdict(self._settings), 'targets': list(settings.targets)},
+            'results': results,
+        }
+
+
+def run_load_benchmark(settings: LoadSettings, output_file: Optional[str] = None) -> dict[str, Any]:
+    report = asyncio.run(LoadBenchmark(settings=settings).run())
+    if output_file:
+        write_report(report, output_file)
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [f'notion-oauth-handler {report["version"]} (Python {report["python"]})']
+    for target, result in report['results'].items():
+        latency = result['latency_ms']
+        lines.append(
+            f'{target:<10} {result["requests"]:>7} req  {result["throughput_rps"]:>9.1f} req/s  '
+            f'p50 {latency["p50"]:.2f} ms  p90 {latency["p90"]:.2f} ms  p99 {latency["p99"]:.2f} ms  '
+            f'errors {result["errors"]}  statuses {result["statuses"]}'
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,152 @@
+"""
+Memory benchmark of the DTOs.
+
+Compares the memory held by many instances of the current DTOs
+with that of their former definitions (plain attrs classes with a per-instance `__dict__`)
+and measures their serialization to bytes and pickling.
+"""
+
+import gc
+import pickle
+import platform
+import time
+import timeit
+import tracemalloc
+import uuid
+from typing import Any, Callable, Optional
+
+import attr
+
+from notion_oauth_handler.bench.load import get_package_version, write_report
+from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+class _LegacyAuthRedirectInfo:
+    redirect_uri: str
+    code: str
+    state: str
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+class _LegacyTokenResponseInfo:
+    access_token: str
+    workspace_id: str
+    workspace_name: str
+    workspace_icon: str
+    bot_id: str
+    owner: dict[str, Any]
+
+
+def _make_owner_payload() -> dict[str, Any]:
+    return {
+        'type': 'user',
+        'user': {
+            'object': 'user',
+            'id': str(uuid.uuid4()),
+            'name': 'Benchmark User',
+            'avatar_url': f'https://s3.example.com/{uuid.uuid4()}.png',
+            'type': 'person',
+            'person': {'email': f'{uuid.uuid4().hex[:12]}@example.com'},
+        },
+    }
+
+
+def _make_token_fields() -> dict[str, Any]:
+    return {
+        'access_token': f'secret_{uuid.uuid4().hex}',
+        'workspace_id': str(uuid.uuid4()),
+        'workspace_name': 'Benchmark Workspace',
+        'workspace_icon': f'https://example.com/{uuid.uuid4()}.png',
+        'bot_id': str(uuid.uuid4()),
+        'owner': _make_owner_payload(),
+    }
+
+
+def _make_redirect_fields() -> dict[str, Any]:
+    return {
+        'redirect_uri': 'https://example.com/auth',
+        'code': str(uuid.uuid4()),
+        'state': uuid.uuid4().hex,
+    }
+
+
+def _measure_memory(factory: Callable[..., Any], make_fields: Callable[[], dict[str, Any]], count: int) -> float:
+    """Return the memory held per instance (bytes), including the payloads that the instances keep"""
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start_size, _ = tracemalloc.get_traced_memory()
+        all_fields = [make_fields() for _ in range(count)]
+        instances = [factory(**fields) for fields in all_fields]
+        # The source payloads are dropped, so only what the instances keep is counted
+        del all_fields
+        gc.collect()
+        end_size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Keep the instances alive until the measurement is done
+    assert len(instances) == count
+    return (end_size - start_size) / count
+
+
+def _measure_time(func: Callable[[], Any], iterations: int) -> float:
+    return min(timeit.repeat(func, number=iterations, repeat=5)) / iterations
+
+
+def run_memory_benchmark(count: int = 10_000, output_file: Optional[str] = None) -> dict[str, Any]:
+    token_fields = _make_token_fields()
+    token_info = TokenResponseInfo(**token_fields)
+    legacy_token_info = _LegacyTokenResponseInfo(**token_fields)
+    token_bytes = token_info.to_bytes()
+    token_pickle = pickle.dumps(token_info, protocol=pickle.HIGHEST_PROTOCOL)
+    iterations = max(1, min(count, 100_000))
+
+    results: dict[str, Any] = {
+        'auth_redirect_info': {
+            'legacy_bytes_per_instance': _measure_memory(_LegacyAuthRedirectInfo, _make_redirect_fields, count),
+            'bytes_per_instance': _measure_memory(AuthRedirectInfo, _make_redirect_fields, count),
+        },
+        'token_response_info': {
+            'legacy_bytes_per_instance': _measure_memory(_LegacyTokenResponseInfo, _make_token_fields, count),
+            'bytes_per_instance': _measure_memory(TokenResponseInfo, _make_token_fields, count),
+        },
+        'token_response_info_serialization': {
+            'size_bytes': len(token_bytes),
+            'to_bytes_us': _measure_time(token_info.to_bytes, iterations) * 1e6,
+            'from_bytes_us': _measure_time(lambda: TokenResponseInfo.from_bytes(token_bytes), iterations) * 1e6,
+        },
+        'token_response_info_pickle': {
+            'legacy_size_bytes': len(pickle.dumps(legacy_token_info, protocol=pickle.HIGHEST_PROTOCOL)),
+            'size_bytes': len(token_pickle),
+            'legacy_round_trip_us': _measure_time(
+                lambda: pickle.loads(pickle.dumps(legacy_token_info, protocol=pickle.HIGHEST_PROTOCOL)), iterations,
+            ) * 1e6,
+            'round_trip_us': _measure_time(
+                lambda: pickle.loads(pickle.dumps(token_info, protocol=pickle.HIGHEST_PROTOCOL)), iterations,
+            ) * 1e6,
+        },
+    }
+    report = {
+        'version': get_package_version(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'settings': {'count': count},
+        'results': {
+            name: {key: round(value, 3) for key, value in result.items()}
+            for name, result in results.items()
+        },
+    }
+    if output_file:
+        write_report(report, output_file)
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [f'notion-oauth-handler {report["version"]} (Python {report["python"]})']
+    for name, result in report['results'].items():
+        lines.append(f'{name}:')
+        for key, value in result.items():
+            lines.append(f'    {key:<28} {value:>12.3f}')
+    return '\n'.join(lines)
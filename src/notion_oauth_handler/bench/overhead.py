@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the per-redirect overhead of `NotionOAuthHandler` outside the network call.
+
+Measures preparation of the token request, parsing of the token response
+and the whole `handle_auth` path (deduplication, concurrency limiting, consumer calls, metrics)
+with the token request replaced by a canned response.
+"""
+
+import asyncio
+import platform
+import time
+import timeit
+import uuid
+from typing import Any, Callable, Optional
+
+from notion_oauth_handler.bench.load import get_package_version, write_report
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler, parse_token_response
+
+
+_TOKEN_RESPONSE_BODY = {
+    'access_token': f'secret_{uuid.uuid4().hex}',
+    'token_type': 'bearer',
+    'workspace_id': str(uuid.uuid4()),
+    'workspace_name': 'Benchmark Workspace',
+    'workspace_icon': 'https://example.com/icon.png',
+    'bot_id': str(uuid.uuid4()),
+    'owner': {'type': 'workspace', 'workspace': True},
+}
+
+
+class _BenchNotionOAuthConsumer(DefaultNotionOAuthConsumer):
+    async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
+        pass
+
+
+class _NoNetworkNotionOAuthHandler(NotionOAuthHandler):
+    async def _make_token_request(
+            self, redirect_info: AuthRedirectInfo, deadline: Optional[float] = None,
+    ) -> TokenResponseInfo:
+        self._make_token_url(redirect_info=redirect_info)
+        self._make_token_body(redirect_info=redirect_info)
+        self._make_token_headers(redirect_info=redirect_info)
+        return parse_token_response(dict(_TOKEN_RESPONSE_BODY))
+
+
+def _make_redirect_info() -> AuthRedirectInfo:
+    return AuthRedirectInfo(redirect_uri='https://example.com/auth', code=uuid.uuid4().hex, state='bench')
+
+
+def _measure_sync(func: Callable[[], Any], iterations: int) -> float:
+    """Return the best per-call time (seconds) of several runs"""
+    return min(timeit.repeat(func, number=iterations, repeat=5)) / iterations
+
+
+async def _measure_handle_auth(handler: NotionOAuthHandler, iterations: int) -> float:
+    redirect_infos = [_make_redirect_info() for _ in range(iterations)]
+    start = time.perf_counter()
+    for redirect_info in redirect_infos:
+        await handler.handle_auth(redirect_info=redirect_info)
+    return (time.perf_counter() - start) / iterations
+
+
+def run_overhead_benchmark(iterations: int = 100_000, output_file: Optional[str] = None) -> dict[str, Any]:
+    handler = _NoNetworkNotionOAuthHandler(
+        consumer=_BenchNotionOAuthConsumer(custom_settings={}),
+        client_id='bench-client-id',
+        client_secret='bench-client-secret',
+    )
+    redirect_info = _make_redirect_info()
+
+    def prepare_token_request() -> None:
+        handler._make_token_url(redirect_info=redirect_info)
+        handler._make_token_body(redirect_info=redirect_info)
+        handler._make_token_headers(redirect_info=redirect_info)
+
+    results = {
+        'prepare_token_request': _measure_sync(prepare_token_request, iterations),
+        'parse_token_response': _measure_sync(lambda: parse_token_response(_TOKEN_RESPONSE_BODY), iterations),
+        'handle_auth': asyncio.run(_measure_handle_auth(handler, iterations)),
+    }
+    report = {
+        'version': get_package_version(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'settings': {'iterations': iterations},
+        'results': {name: {'us_per_op': round(duration * 1e6, 3)} for name, duration in results.items()},
+    }
+    if output_file:
+        write_report(report, output_file)
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [f'notion-oauth-handler {report["version"]} (Python {report["python"]})']
+    for name, result in report['results'].items():
+        lines.append(f'{name:<24} {result["us_per_op"]:>10.3f} us/op')
+    return '\n'.join(lines)
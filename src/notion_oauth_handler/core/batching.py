@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+import attr
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_ITEM_TV = TypeVar('_ITEM_TV')
+
+_STOP = object()
+
+
+@attr.s(frozen=True)
+class BatchSettings:
+    enabled: bool = attr.ib(kw_only=True, default=False)
+    max_batch_size: int = attr.ib(kw_only=True, default=100)
+    flush_interval: float = attr.ib(kw_only=True, default=0.05)  # Max time to wait for a batch to fill up
+    max_queue: int = attr.ib(kw_only=True, default=10000)
+    drain_timeout: float = attr.ib(kw_only=True, default=30.0)  # Max time to drain the queue on shutdown
+
+
+@attr.s
+class TokenBatcher(Generic[_ITEM_TV]):
+    """
+    Bounded queue of token results consumed in batches by a background drainer.
+
+    A batch is flushed once it reaches `max_batch_size`
+    or `flush_interval` after its first item was taken from the queue.
+    `put` waits for free space if the queue is full.
+    On `stop` the queue is drained completely (within `drain_timeout`).
+    Failures of `consume_batch` are logged, since the redirects have already been answered.
+    """
+
+    _settings: BatchSettings = attr.ib(kw_only=True, factory=BatchSettings)
+    _consume_batch: Callable[[list[_ITEM_TV]], Awaitable[None]] = attr.ib(kw_only=True)
+    _queue: Optional[asyncio.Queue] = attr.ib(init=False, default=None)
+    _drainer: Optional[asyncio.Task] = attr.ib(init=False, default=None)
+    _stopped: bool = attr.ib(init=False, default=False)
+
+    @property
+    def settings(self) -> BatchSettings:
+        return self._settings
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """Start the drainer. Should be called once the event loop is running"""
+        if self._drainer is None:
+            self._queue = asyncio.Queue(maxsize=self._settings.max_queue)
+            self._drainer = asyncio.create_task(self._run())
+            self._stopped = False
+
+    async def put(self, item: _ITEM_TV) -> None:
+        if self._stopped:
+            # Late arrivals after shutdown are consumed right away
+            await self._flush([item])
+            return
+        if self._drainer is None:
+            # The batcher is being used outside of an application's lifecycle
+            self.start()
+        assert self._queue is not None
+        await self._queue.put(item)
+
+    async def _collect_batch(self) -> tuple[list[_ITEM_TV], bool]:
+        """Wait for the next batch. Also return whether the batcher is stopping"""
+
+        assert self._queue is not None
+        queue = self._queue
+        item = await queue.get()
+        if item is _STOP:
+            return [], True
+
+        loop = asyncio.get_running_loop()
+        batch = [item]
+        flush_at = loop.time() + self._settings.flush_interval
+        while len(batch) < self._settings.max_batch_size:
+            if queue.empty():
+                remaining = flush_at - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = queue.get_nowait()
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: list[_ITEM_TV]) -> None:
+        try:
+            await self._consume_batch(batch)
+        except Exception:
+            _LOGGER.exception(f'Failed to consume a batch of {len(batch)} token(s)')
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._collect_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def stop(self) -> None:
+        """Flush everything that is queued and stop the drainer"""
+
+        if self._drainer is None:
+            return
+        assert self._queue is not None
+        drainer = self._drainer
+        self._drainer = None
+        self._stopped = True
+        loop = asyncio.get_running_loop()
+        drain_deadline = loop.time() + self._settings.drain_timeout
+        try:
+            await asyncio.wait_for(self._queue.put(_STOP), timeout=self._settings.drain_timeout)
+            await asyncio.wait_for(drainer, timeout=max(0.0, drain_deadline - loop.time()))
+        except asyncio.TimeoutError:
+            _LOGGER.error(f'Failed to drain the token queue in time, dropping {self._queue.qsize()} token(s)')
+            drainer.cancel()
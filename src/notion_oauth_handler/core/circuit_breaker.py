@@ -0,0 +1,200 @@
+"""
+Circuit breaker around the Notion token endpoint.
+
+Each token request attempt is recorded in a rolling window of `window` seconds
+(kept as one-second buckets). Once the window has at least `min_calls` attempts
+and the share of failed ones (or of ones slower than `slow_call_duration`) reaches its threshold,
+the circuit opens: attempts are rejected right away with `CircuitOpen` for `open_duration` seconds,
+instead of waiting out the upstream timeouts.
+Then the circuit is half-open: up to `half_open_max_calls` attempts are let through as probes.
+If all of them succeed (and are not slow), the circuit closes; any failed or slow probe opens it again.
+"""
+
+import collections
+import contextlib
+import enum
+import logging
+import math
+import time
+from http import HTTPStatus
+from typing import Callable, Iterator, Optional
+
+import attr
+
+import notion_oauth_handler.core.exc as exc
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitState(enum.IntEnum):
+    # The values are exported as the state metric
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+@attr.s(frozen=True)
+class CircuitBreakerSettings:
+    enabled: bool = attr.ib(kw_only=True, default=False)
+    window: int = attr.ib(kw_only=True, default=30)  # Seconds
+    min_calls: int = attr.ib(kw_only=True, default=20)  # In the window, before the rates are considered
+    failure_rate: float = attr.ib(kw_only=True, default=0.5)  # Share of failed calls that opens the circuit
+    slow_call_duration: float = attr.ib(kw_only=True, default=5.0)  # Seconds
+    slow_call_rate: float = attr.ib(kw_only=True, default=0.8)  # Share of slow calls that opens the circuit
+    open_duration: float = attr.ib(kw_only=True, default=15.0)  # Seconds before the circuit becomes half-open
+    half_open_max_calls: int = attr.ib(kw_only=True, default=3)
+
+
+def is_failure_status(status: int) -> bool:
+    """Responses that show that the upstream is failing (as opposed to rejecting a bad request)"""
+    return status >= HTTPStatus.INTERNAL_SERVER_ERROR or status == HTTPStatus.TOO_MANY_REQUESTS
+
+
+@attr.s(slots=True)
+class _WindowBucket:
+    second: int = attr.ib()
+    calls: int = attr.ib(default=0)
+    failures: int = attr.ib(default=0)
+    slow_calls: int = attr.ib(default=0)
+
+
+@attr.s
+class CallOutcome:
+    """Set `failed` if the call has completed, but its result shows that the upstream is failing"""
+
+    failed: bool = attr.ib(init=False, default=False)
+
+
+@attr.s
+class CircuitBreaker:
+    _settings: CircuitBreakerSettings = attr.ib(kw_only=True, factory=CircuitBreakerSettings)
+    _on_state_change: Optional[Callable[[CircuitState], None]] = attr.ib(kw_only=True, default=None)
+    _state: CircuitState = attr.ib(init=False, default=CircuitState.CLOSED)
+    _opened_at: float = attr.ib(init=False, default=0.0)
+    # The totals of the buckets are kept up to date, so recording a call does not sum the window
+    _buckets: collections.deque[_WindowBucket] = attr.ib(init=False, factory=collections.deque)
+    _calls: int = attr.ib(init=False, default=0)
+    _failures: int = attr.ib(init=False, default=0)
+    _slow_calls: int = attr.ib(init=False, default=0)
+    _generation: int = attr.ib(init=False, default=0)  # Incremented on each state change
+    _probes_in_flight: int = attr.ib(init=False, default=0)
+    _probe_successes: int = attr.ib(init=False, default=0)
+
+    @property
+    def settings(self) -> CircuitBreakerSettings:
+        return self._settings
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and self._get_open_remaining() <= 0:
+            return CircuitState.HALF_OPEN
+        return self._state
+
+    def _get_open_remaining(self) -> float:
+        return self._opened_at + self._settings.open_duration - time.monotonic()
+
+    def _set_state(self, state: CircuitState) -> None:
+        if state == self._state:
+            return
+        _LOGGER.warning(f'Circuit breaker of the Notion token endpoint is {state.name.lower().replace("_", "-")}')
+        self._state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == CircuitState.OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CircuitState.CLOSED:
+            self._buckets.clear()
+            self._calls = self._failures = self._slow_calls = 0
+        if self._on_state_change is not None:
+            self._on_state_change(state)
+
+    def _make_open_error(self) -> exc.CircuitOpen:
+        return exc.CircuitOpen(
+            'Notion token endpoint is failing, token requests are suspended',
+            retry_after=max(1, math.ceil(self._get_open_remaining())),
+        )
+
+    def _before_call(self) -> None:
+        if self._state == CircuitState.OPEN:
+            if self._get_open_remaining() > 0:
+                raise self._make_open_error()
+            self._set_state(CircuitState.HALF_OPEN)
+        if self._state == CircuitState.HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= self._settings.half_open_max_calls:
+                raise exc.CircuitOpen('Notion token endpoint is being probed', retry_after=1)
+            self._probes_in_flight += 1
+
+    def _record_in_window(self, failed: bool, slow: bool) -> None:
+        second = int(time.monotonic())
+        buckets = self._buckets
+        while buckets and buckets[0].second <= second - self._settings.window:
+            expired = buckets.popleft()
+            self._calls -= expired.calls
+            self._failures -= expired.failures
+            self._slow_calls -= expired.slow_calls
+        if not buckets or buckets[-1].second != second:
+            buckets.append(_WindowBucket(second))
+        bucket = buckets[-1]
+        bucket.calls += 1
+        bucket.failures += failed
+        bucket.slow_calls += slow
+        self._calls += 1
+        self._failures += failed
+        self._slow_calls += slow
+
+    def _should_open(self) -> bool:
+        settings = self._settings
+        if self._calls < settings.min_calls:
+            return False
+        return (
+            self._failures >= settings.failure_rate * self._calls
+            or self._slow_calls >= settings.slow_call_rate * self._calls
+        )
+
+    def _after_call(self, failed: bool, duration: float) -> None:
+        slow = duration >= self._settings.slow_call_duration
+        if self._state == CircuitState.HALF_OPEN:
+            self._probes_in_flight -= 1
+            if failed or slow:
+                self._set_state(CircuitState.OPEN)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self._settings.half_open_max_calls:
+                self._set_state(CircuitState.CLOSED)
+            return
+        self._record_in_window(failed, slow)
+        if self._should_open():
+            self._set_state(CircuitState.OPEN)
+
+    @contextlib.contextmanager
+    def call(self) -> Iterator[CallOutcome]:
+        """
+        Guard a call to the upstream. Raises `CircuitOpen` if the circuit is open.
+        Exceptions raised by the call count as failures, cancellation does not count at all
+        """
+
+        outcome = CallOutcome()
+        if not self._settings.enabled:
+            yield outcome
+            return
+        self._before_call()
+        generation = self._generation
+        cancelled = False
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception:
+            outcome.failed = True
+            raise
+        except BaseException:
+            cancelled = True
+            raise
+        finally:
+            # Results of calls started before the last state change are stale
+            if self._generation == generation:
+                if not cancelled:
+                    self._after_call(outcome.failed, time.monotonic() - start)
+                elif self._state == CircuitState.HALF_OPEN:
+                    self._probes_in_flight -= 1  # Let another probe through instead
@@ -1,9 +1,13 @@
 import abc
-from typing import Generic, TypeVar
+import inspect
+import os
+from typing import Any, Callable, Generic, Optional, TypeVar
 
 import attr
 
 from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+from notion_oauth_handler.core.resources import ResourceContainer
+from notion_oauth_handler.core.state import StateCodec, parse_state_keys
 
 
 _STATE_TV = TypeVar('_STATE_TV')
@@ -20,10 +24,43 @@ class NotionOAuthConsumer(abc.ABC, Generic[_STATE_TV]):
 
     and, optionally:
     - consume_redirect_error
+    - consume_token_info_batch (used instead of consume_token_info in the batch mode)
+    - on_startup/on_cleanup (to keep connection pools and such for the lifetime of the app)
+    - dump_state_info/load_state_info (if the spool is enabled and state_info is not JSON-serializable)
+
+    The `consume_*` hooks may also be implemented as regular (blocking) functions;
+    such hooks are run in an executor (see `core.executor`) instead of the event loop.
     """
 
     custom_settings: dict = attr.ib(kw_only=True)
 
+    async def on_startup(self, resources: ResourceContainer) -> None:
+        """
+        Called once when the app starts, before any redirect is handled.
+        Create connection pools here and add them to `resources` to have them closed on cleanup
+        """
+
+    async def on_cleanup(self, resources: ResourceContainer) -> None:
+        """
+        Called once when the app stops, after all pending token info has been consumed
+        and before `resources` are closed
+        """
+
+    def update_custom_settings(self, custom_settings: dict) -> None:
+        """
+        Called when the configuration is reloaded with changed custom settings.
+        Override this to also reset anything derived from them
+        """
+        self.custom_settings = custom_settings
+
+    def dump_state_info(self, state_info: _STATE_TV) -> Any:
+        """Convert state_info to a JSON-serializable value to be stored in the spool (see `core.spool`)"""
+        return state_info
+
+    def load_state_info(self, data: Any) -> _STATE_TV:
+        """Restore state_info stored in the spool by `dump_state_info`"""
+        return data
+
     async def consume_redirect_error(self, error_text: str) -> None:
         pass
 
@@ -35,6 +72,34 @@ class NotionOAuthConsumer(abc.ABC, Generic[_STATE_TV]):
     async def consume_token_info(self, token_info: TokenResponseInfo, state_info: _STATE_TV) -> None:
         raise NotImplementedError
 
+    async def consume_token_info_batch(self, items: list[tuple[TokenResponseInfo, _STATE_TV]]) -> None:
+        """
+        Consume token info of several redirects at once.
+        Override this to store them in a single round trip.
+        """
+        for token_info, state_info in items:
+            await self.consume_token_info(token_info=token_info, state_info=state_info)
+
+    @classmethod
+    def _has_default_batch_hook(cls) -> bool:
+        return cls.consume_token_info_batch is NotionOAuthConsumer.consume_token_info_batch
+
+    @classmethod
+    def is_sync_hook(cls, hook_name: str) -> bool:
+        """Whether the hook is implemented as a regular function and must be run in an executor"""
+        if hook_name == 'consume_token_info_batch' and cls._has_default_batch_hook():
+            hook_name = 'consume_token_info'  # The default batch hook just calls it
+        return not inspect.iscoroutinefunction(getattr(cls, hook_name))
+
+    def call_sync_hook(self, hook_name: str, **kwargs: Any) -> Any:
+        """Call a sync hook (see `is_sync_hook`); runs in an executor"""
+        if hook_name == 'consume_token_info_batch' and self._has_default_batch_hook():
+            consume_token_info: Callable[..., Any] = self.consume_token_info  # Implemented as a sync function
+            for token_info, state_info in kwargs['items']:
+                consume_token_info(token_info=token_info, state_info=state_info)
+            return None
+        return getattr(self, hook_name)(**kwargs)
+
 
 class DefaultNotionOAuthConsumer(NotionOAuthConsumer[AuthRedirectInfo]):
     """
@@ -46,6 +111,12 @@ class DefaultNotionOAuthConsumer(NotionOAuthConsumer[AuthRedirectInfo]):
     async def consume_redirect_info(self, redirect_info: AuthRedirectInfo) -> AuthRedirectInfo:
         return redirect_info
 
+    def dump_state_info(self, state_info: AuthRedirectInfo) -> Any:
+        return attr.asdict(state_info)
+
+    def load_state_info(self, data: Any) -> AuthRedirectInfo:
+        return AuthRedirectInfo(**data)
+
     @abc.abstractmethod
     async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
         raise NotImplementedError
@@ -54,3 +125,68 @@ class DefaultNotionOAuthConsumer(NotionOAuthConsumer[AuthRedirectInfo]):
 class DummyNotionOAuthConsumer(DefaultNotionOAuthConsumer):
     async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
         print(f'Consumed token info: {token_info}')
+
+
+@attr.s(frozen=True, slots=True)
+class SignedStateInfo:
+    redirect_info: AuthRedirectInfo = attr.ib(kw_only=True)
+    payload: Any = attr.ib(kw_only=True)  # The payload passed to `StateCodec.encode`
+    expires_at: int = attr.ib(kw_only=True)
+
+
+@attr.s
+class SignedStateNotionOAuthConsumer(NotionOAuthConsumer[SignedStateInfo]):
+    """
+    Half-implementation that verifies signed `state` tokens (see `StateCodec`)
+    without any I/O; redirects with an invalid or expired state are rejected with `InvalidState`.
+
+    Uses the following custom settings:
+    - state_keys: `<key ID>:<secret>[, <key ID>:<secret>...]`, the first key signs new tokens
+      (or state_keys_key: name of the env var that contains them);
+    - state_ttl: lifetime of state tokens in seconds (600 by default).
+    """
+
+    _state_codec: Optional[StateCodec] = attr.ib(init=False, default=None)
+
+    @property
+    def state_codec(self) -> StateCodec:
+        """Also use it to mint state tokens, e.g. `make_authorize_url(state=consumer.state_codec.encode(...))`"""
+        if self._state_codec is None:
+            keys = self.custom_settings.get('state_keys', '')
+            if not keys and self.custom_settings.get('state_keys_key'):
+                keys = os.environ[self.custom_settings['state_keys_key']]
+            self._state_codec = StateCodec(
+                keys=parse_state_keys(keys),
+                ttl=int(self.custom_settings.get('state_ttl', 600)),
+            )
+        return self._state_codec
+
+    def update_custom_settings(self, custom_settings: dict) -> None:
+        super().update_custom_settings(custom_settings)
+        self._state_codec = None  # Rebuilt with the new keys on next use
+
+    def dump_state_info(self, state_info: SignedStateInfo) -> Any:
+        return {
+            'redirect_info': attr.asdict(state_info.redirect_info),
+            'payload': state_info.payload,  # Decoded from JSON in the first place
+            'expires_at': state_info.expires_at,
+        }
+
+    def load_state_info(self, data: Any) -> SignedStateInfo:
+        return SignedStateInfo(
+            redirect_info=AuthRedirectInfo(**data['redirect_info']),
+            payload=data['payload'],
+            expires_at=data['expires_at'],
+        )
+
+    async def consume_redirect_info(self, redirect_info: AuthRedirectInfo) -> SignedStateInfo:
+        signed_state = self.state_codec.decode(redirect_info.state)
+        return SignedStateInfo(
+            redirect_info=redirect_info,
+            payload=signed_state.payload,
+            expires_at=signed_state.expires_at,
+        )
+
+    @abc.abstractmethod
+    async def consume_token_info(self, token_info: TokenResponseInfo, state_info: SignedStateInfo) -> None:
+        raise NotImplementedError
@@ -0,0 +1,93 @@
+import asyncio
+import collections
+import functools
+import hashlib
+import time
+from typing import Any, Callable, Coroutine, Generic, Optional, TypeVar
+
+import attr
+
+
+_RESULT_TV = TypeVar('_RESULT_TV')
+
+
+@attr.s(frozen=True)
+class DedupSettings:
+    ttl: float = attr.ib(kw_only=True, default=60.0)  # How long completed results are kept (seconds)
+    max_size: int = attr.ib(kw_only=True, default=1024)  # 0 disables the cache of completed results
+
+
+def make_redirect_key(code: str, state: str) -> str:
+    """
+    Only redirects with the same code and the same state share a result,
+    so that a replay with a forged state does not skip the consumer's check of the state.
+    Authorization codes are not kept in memory as is, only the hashes.
+    """
+    return hashlib.sha256(f'{len(code)}:{code}{state}'.encode()).hexdigest()
+
+
+@attr.s
+class _Flight:
+    task: asyncio.Task = attr.ib()
+    waiters: int = attr.ib(default=0)
+
+
+@attr.s
+class SingleFlight(Generic[_RESULT_TV]):
+    """
+    Coalesces concurrent calls with the same key into a single call
+    and keeps successful results in a size-bounded LRU cache for `ttl` seconds,
+    so that repeated calls get the same result without doing the work again.
+    Failures are shared with concurrent callers, but are not cached.
+
+    The call runs in a task of its own, so a cancelled caller (e.g. whose client has disconnected)
+    does not cancel it for the others; it is cancelled only when all of its callers are.
+    """
+
+    _settings: DedupSettings = attr.ib(kw_only=True, factory=DedupSettings)
+    _in_flight: dict[str, _Flight] = attr.ib(init=False, factory=dict)
+    _completed: collections.OrderedDict = attr.ib(init=False, factory=collections.OrderedDict)
+
+    def _get_completed(self, key: str) -> Optional[_RESULT_TV]:
+        item = self._completed.get(key)
+        if item is None:
+            return None
+        expires_at, result = item
+        if expires_at <= time.monotonic():
+            del self._completed[key]
+            return None
+        self._completed.move_to_end(key)
+        return result
+
+    def _store_completed(self, key: str, result: _RESULT_TV) -> None:
+        if self._settings.max_size <= 0:
+            return
+        self._completed[key] = (time.monotonic() + self._settings.ttl, result)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self._settings.max_size:
+            self._completed.popitem(last=False)
+
+    async def run(self, key: str, func: Callable[[], Coroutine[Any, Any, _RESULT_TV]]) -> _RESULT_TV:
+        result = self._get_completed(key)
+        if result is not None:
+            return result
+
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = self._in_flight[key] = _Flight(asyncio.create_task(func()))
+            flight.task.add_done_callback(functools.partial(self._on_flight_done, key, flight))
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # All the callers have been cancelled, nobody needs the result
+                flight.task.cancel()
+
+    def _on_flight_done(self, key: str, flight: _Flight, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        # Retrieving the exception also avoids "exception was never retrieved" warnings
+        if not task.cancelled() and task.exception() is None:
+            self._store_completed(key, task.result())
@@ -1,20 +1,181 @@
-from typing import Any
+import json
+import struct
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 
 import attr
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+# Length-prefixed binary format of `to_bytes`/`from_bytes`
+_NONE_LENGTH = 0xFFFFFFFF
+
+
+def _pack_fields(*values: Optional[bytes]) -> bytes:
+    lengths = [_NONE_LENGTH if value is None else len(value) for value in values]
+    return struct.pack(f'!{len(values)}I', *lengths) + b''.join(value for value in values if value is not None)
+
+
+def _unpack_fields(data: bytes, count: int) -> list[Optional[bytes]]:
+    header_size = 4 * count
+    offset = header_size
+    values: list[Optional[bytes]] = []
+    for length in struct.unpack_from(f'!{count}I', data):
+        if length == _NONE_LENGTH:
+            values.append(None)
+        else:
+            values.append(data[offset:offset + length])
+            offset += length
+    return values
+
+
+def _encode_str(value: Optional[str]) -> Optional[bytes]:
+    return None if value is None else value.encode()
+
+
+def _decode_str(value: Optional[bytes]) -> Optional[str]:
+    return None if value is None else value.decode()
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True, slots=True)
 class AuthRedirectInfo:
     redirect_uri: str
     code: str
     state: str
 
+    def to_bytes(self) -> bytes:
+        return _pack_fields(self.redirect_uri.encode(), self.code.encode(), self.state.encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'AuthRedirectInfo':
+        redirect_uri, code, state = _unpack_fields(data, 3)
+        assert redirect_uri is not None and code is not None and state is not None
+        return cls(redirect_uri=redirect_uri.decode(), code=code.decode(), state=state.decode())
+
+    def __reduce__(self) -> tuple[Any, tuple[str, str, str]]:
+        # Pickled as a plain tuple (e.g. when passed to an executor process), without attrs' state handling
+        return _make_auth_redirect_info, (self.redirect_uri, self.code, self.state)
+
+
+def _make_auth_redirect_info(redirect_uri: str, code: str, state: str) -> AuthRedirectInfo:
+    return AuthRedirectInfo(redirect_uri=redirect_uri, code=code, state=state)
+
+
+USER_OWNER_TYPE = 'user'
+WORKSPACE_OWNER_TYPE = 'workspace'
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True, slots=True)
+class Owner:
+    """The owner of an integration's access: either a user or the whole workspace"""
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+    type: str
+    user_id: Optional[str] = None
+    user_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    email: Optional[str] = None
+
+    @property
+    def is_workspace(self) -> bool:
+        return self.type == WORKSPACE_OWNER_TYPE
+
+    @classmethod
+    def from_payload(cls, payload: Mapping[str, Any]) -> 'Owner':
+        owner_type = payload.get('type', WORKSPACE_OWNER_TYPE)
+        user = payload.get('user')
+        if owner_type != USER_OWNER_TYPE or not isinstance(user, Mapping):
+            return cls(type=owner_type)
+        person = user.get('person')
+        return cls(
+            type=owner_type,
+            user_id=user.get('id'),
+            user_name=user.get('name'),
+            avatar_url=user.get('avatar_url'),
+            email=person.get('email') if isinstance(person, Mapping) else None,
+        )
+
+
+TOKEN_RESPONSE_FIELDS = ('access_token', 'workspace_id', 'workspace_name', 'workspace_icon', 'bot_id', 'owner')
+
+
+def _freeze_owner(owner: Mapping[str, Any]) -> Mapping[str, Any]:
+    return owner if isinstance(owner, MappingProxyType) else MappingProxyType(owner)
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True, slots=True)
 class TokenResponseInfo:
+    """
+    Token response of Notion.
+
+    The owner payload is kept as it was received, behind a read-only view;
+    `owner_info` parses it into `Owner`.
+    """
+
     access_token: str
     workspace_id: str
-    workspace_name: str
-    workspace_icon: str
+    workspace_name: Optional[str]  # Notion sends null if the workspace has no name or icon
+    workspace_icon: Optional[str]
     bot_id: str
-    owner: dict[str, Any]
+    owner: Mapping[str, Any] = attr.ib(converter=_freeze_owner)
+
+    @property
+    def owner_info(self) -> Owner:
+        return Owner.from_payload(self.owner)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'access_token': self.access_token,
+            'workspace_id': self.workspace_id,
+            'workspace_name': self.workspace_name,
+            'workspace_icon': self.workspace_icon,
+            'bot_id': self.bot_id,
+            'owner': dict(self.owner),
+        }
+
+    def to_bytes(self) -> bytes:
+        return _pack_fields(
+            self.access_token.encode(),
+            self.workspace_id.encode(),
+            _encode_str(self.workspace_name),
+            _encode_str(self.workspace_icon),
+            self.bot_id.encode(),
+            json.dumps(dict(self.owner), separators=(',', ':')).encode(),
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TokenResponseInfo':
+        access_token, workspace_id, workspace_name, workspace_icon, bot_id, owner_data = _unpack_fields(data, 6)
+        assert access_token is not None and workspace_id is not None and bot_id is not None
+        assert owner_data is not None
+        return _make_token_response_info(
+            access_token.decode(),
+            workspace_id.decode(),
+            _decode_str(workspace_name),
+            _decode_str(workspace_icon),
+            bot_id.decode(),
+            json.loads(owner_data),
+        )
+
+    def __reduce__(self) -> tuple[Any, tuple[str, str, Optional[str], Optional[str], str, dict[str, Any]]]:
+        # Pickled as a plain tuple (e.g. when passed to an executor process); the read-only view can not be pickled
+        return _make_token_response_info, (
+            self.access_token, self.workspace_id, self.workspace_name, self.workspace_icon, self.bot_id,
+            dict(self.owner),
+        )
+
+
+def _make_token_response_info(
+        access_token: str,
+        workspace_id: str,
+        workspace_name: Optional[str],
+        workspace_icon: Optional[str],
+        bot_id: str,
+        owner: Mapping[str, Any],
+) -> TokenResponseInfo:
+    return TokenResponseInfo(
+        access_token=access_token,
+        workspace_id=workspace_id,
+        workspace_name=workspace_name,
+        workspace_icon=workspace_icon,
+        bot_id=bot_id,
+        owner=owner,
+    )
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional, Sequence
 
 
 class NotionAccessDenied(Exception):
@@ -6,8 +6,55 @@ class NotionAccessDenied(Exception):
 
 
 class TokenRequestFailed(Exception):
-    def __init__(self, request_data: dict, request_headers: Any, response_status: int, response_body: str):
+    def __init__(
+            self, request_data: dict, request_headers: Any, response_status: int, response_body: str,
+            attempts: int = 1,
+    ):
         self.request_data = request_data
         self.request_headers = request_headers
         self.response_status = response_status
         self.response_body = response_body
+        self.attempts = attempts
+
+
+class InvalidTokenResponse(Exception):
+    """Notion responded with a token response that cannot be parsed"""
+
+    def __init__(self, message: str, missing_fields: Sequence[str] = ()):
+        super().__init__(message)
+        self.missing_fields = list(missing_fields)
+
+
+class NotionUnavailable(Exception):
+    """Notion could not be reached or failed to handle the token request (5xx and 429 responses)"""
+
+    def __init__(self, message: str, attempts: int = 1):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class CircuitOpen(NotionUnavailable):
+    """Token requests are suspended because the Notion token endpoint keeps failing (see `core.circuit_breaker`)"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message, attempts=0)
+        self.retry_after = retry_after
+
+
+class HandlerOverloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OperationTimeout(Exception):
+    """A call to Notion or to the consumer took too long"""
+
+    def __init__(self, message: str, operation: str, timeout: Optional[float]):
+        super().__init__(message)
+        self.operation = operation
+        self.timeout = timeout
+
+
+class InvalidState(Exception):
+    """The `state` of a redirect is malformed, has an invalid signature or has expired"""
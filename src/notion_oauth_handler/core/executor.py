@@ -0,0 +1,132 @@
+"""
+Executor of synchronous consumer hooks.
+
+Consumer hooks may be implemented as regular functions (see `NotionOAuthConsumer.is_sync_hook`),
+e.g. with a blocking database driver. Calling them directly would block the event loop,
+so they run in a bounded thread pool instead.
+
+For CPU-bound hooks (e.g. key derivation) a pool of processes can be used:
+each worker process makes its own consumer of the same class with the same custom settings
+(so the class must be importable), and the hook arguments and results are pickled.
+The worker's consumer gets its own `on_startup`/`on_cleanup` calls with a container of its own
+(run in an event loop of the worker process), so its resources are never shared across processes.
+The pool is replaced when the consumer's custom settings are updated;
+calls that have already been submitted finish in the old pool.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import multiprocessing
+import multiprocessing.util
+from typing import Any, Optional
+
+import attr
+
+from notion_oauth_handler.core.consumer import NotionOAuthConsumer
+from notion_oauth_handler.core.resources import ResourceContainer
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(frozen=True)
+class ExecutorSettings:
+    thread_workers: int = attr.ib(kw_only=True, default=8)
+    process_workers: int = attr.ib(kw_only=True, default=0)  # More than 0 runs sync hooks in processes instead
+
+    @property
+    def use_processes(self) -> bool:
+        return self.process_workers > 0
+
+
+# The consumer of a worker process, its resources and the loop its lifecycle hooks run in
+_worker_consumer: Optional[NotionOAuthConsumer] = None
+_worker_resources: Optional[ResourceContainer] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker_process(consumer_cls: type[NotionOAuthConsumer], custom_settings: dict) -> None:
+    global _worker_consumer, _worker_resources, _worker_loop
+    consumer = consumer_cls(custom_settings=custom_settings)
+    resources = ResourceContainer()
+    # Kept open, so that the resources created in it can be closed in it
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(consumer.on_startup(resources))
+    _worker_consumer, _worker_resources, _worker_loop = consumer, resources, loop
+    # Called when the worker process exits (the pool is shut down or replaced)
+    multiprocessing.util.Finalize(None, _cleanup_worker_process, exitpriority=10)
+
+
+def _cleanup_worker_process() -> None:
+    global _worker_consumer, _worker_resources, _worker_loop
+    if _worker_loop is None:
+        return
+    assert _worker_consumer is not None and _worker_resources is not None
+    try:
+        _worker_loop.run_until_complete(_worker_consumer.on_cleanup(_worker_resources))
+    except Exception:
+        _LOGGER.exception('Consumer cleanup failed in an executor process')
+    finally:
+        _worker_loop.run_until_complete(_worker_resources.close())
+        _worker_loop.close()
+        _worker_consumer, _worker_resources, _worker_loop = None, None, None
+
+
+def _call_worker_hook(hook_name: str, kwargs: dict[str, Any]) -> Any:
+    assert _worker_consumer is not None
+    return _worker_consumer.call_sync_hook(hook_name, **kwargs)
+
+
+@attr.s
+class HookExecutor:
+    _settings: ExecutorSettings = attr.ib(kw_only=True, factory=ExecutorSettings)
+    _consumer: NotionOAuthConsumer = attr.ib(kw_only=True)
+    _executor: Optional[concurrent.futures.Executor] = attr.ib(init=False, default=None)
+    _executor_custom_settings: Optional[dict] = attr.ib(init=False, default=None)  # Of the worker processes
+
+    def _make_executor(self) -> concurrent.futures.Executor:
+        if not self._settings.use_processes:
+            return concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._settings.thread_workers, thread_name_prefix='notion-oauth-consumer',
+            )
+        self._executor_custom_settings = self._consumer.custom_settings
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._settings.process_workers,
+            # Forking a process with a running event loop and threads is not safe
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker_process,
+            initargs=(type(self._consumer), self._consumer.custom_settings),
+        )
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if (
+                self._executor is not None and self._settings.use_processes
+                and self._executor_custom_settings is not self._consumer.custom_settings
+        ):
+            # The worker processes have consumers with outdated custom settings
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._executor is None:
+            self._executor = self._make_executor()
+        return self._executor
+
+    async def run(self, hook_name: str, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if self._settings.use_processes:
+            return await loop.run_in_executor(executor, _call_worker_hook, hook_name, kwargs)
+        # The thread gets the context, so the hook can see the request ID and the current span
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            executor, functools.partial(context.run, self._consumer.call_sync_hook, hook_name, **kwargs),
+        )
+
+    async def shutdown(self) -> None:
+        """Wait for the running calls to finish and stop the pool"""
+
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(executor.shutdown, wait=True))
@@ -0,0 +1,90 @@
+import asyncio
+import collections
+import contextlib
+from typing import AsyncIterator
+
+import attr
+
+import notion_oauth_handler.core.exc as exc
+
+
+@attr.s(frozen=True)
+class ConcurrencySettings:
+    max_in_flight: int = attr.ib(kw_only=True, default=0)  # 0 means no limit
+    max_queue: int = attr.ib(kw_only=True, default=100)
+    queue_timeout: float = attr.ib(kw_only=True, default=5.0)
+    retry_after: int = attr.ib(kw_only=True, default=1)  # Suggested to clients when overloaded
+
+
+@attr.s
+class ConcurrencyLimiter:
+    """
+    Limits the number of concurrent operations.
+    Operations that exceed `max_in_flight` wait in a bounded FIFO queue.
+    `HandlerOverloaded` is raised if the queue is full
+    or if the operation could not start within `queue_timeout`.
+    """
+
+    _settings: ConcurrencySettings = attr.ib(kw_only=True, factory=ConcurrencySettings)
+    _in_flight: int = attr.ib(init=False, default=0)
+    _waiters: collections.deque = attr.ib(init=False, factory=collections.deque)
+
+    @property
+    def settings(self) -> ConcurrencySettings:
+        return self._settings
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _make_overloaded_error(self, message: str) -> exc.HandlerOverloaded:
+        return exc.HandlerOverloaded(message, retry_after=self._settings.retry_after)
+
+    def _discard_waiter(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over right before the waiter gave up, so pass it on
+            self.release()
+        else:
+            with contextlib.suppress(ValueError):
+                self._waiters.remove(waiter)
+
+    async def acquire(self) -> None:
+        max_in_flight = self._settings.max_in_flight
+        if max_in_flight <= 0 or (self._in_flight < max_in_flight and not self._waiters):
+            self._in_flight += 1
+            return
+
+        if len(self._waiters) >= self._settings.max_queue:
+            raise self._make_overloaded_error('Wait queue is full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self._settings.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard_waiter(waiter)
+            raise self._make_overloaded_error('Timed out in wait queue') from None
+        except asyncio.CancelledError:
+            self._discard_waiter(waiter)
+            raise
+        # The slot has been handed over by `release`, so `_in_flight` stays the same
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
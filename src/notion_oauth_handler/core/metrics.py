@@ -0,0 +1,304 @@
+"""
+Minimal in-process metrics with Prometheus text exposition format.
+
+All updates are plain dict/list operations done from the event loop thread,
+so they are cheap enough to be always enabled.
+"""
+
+import abc
+import bisect
+import math
+import time
+from typing import Callable, ClassVar, Iterable, Optional, Sequence
+
+import attr
+
+import notion_oauth_handler.core.exc as exc
+
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BATCH_SIZE_BUCKETS: tuple[float, ...] = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+ConstLabels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(
+        label_names: Sequence[str], label_values: Sequence[str], const_labels: ConstLabels = (),
+) -> str:
+    if not label_names and not const_labels:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in (*const_labels, *zip(label_names, label_values))
+    )
+    return f'{{{pairs}}}'
+
+
+@attr.s
+class Metric(abc.ABC):
+    type_name: ClassVar[str]
+
+    name: str = attr.ib(kw_only=True)
+    help: str = attr.ib(kw_only=True)
+    label_names: tuple[str, ...] = attr.ib(kw_only=True, default=())
+    const_labels: ConstLabels = attr.ib(kw_only=True, default=())  # Added to all samples
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type_name}'
+        yield from self.render_samples()
+
+    def _format_labels(self, label_values: LabelValues) -> str:
+        return _format_labels(self.label_names, label_values, self.const_labels)
+
+    @abc.abstractmethod
+    def render_samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+@attr.s
+class Counter(Metric):
+    type_name = 'counter'
+
+    _values: dict[LabelValues, float] = attr.ib(init=False, factory=dict)
+
+    def inc(self, label_values: LabelValues = (), amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def get(self, label_values: LabelValues = ()) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render_samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f'{self.name}{self._format_labels(label_values)} {_format_value(value)}'
+
+
+@attr.s
+class Gauge(Metric):
+    """Gauge that is either set explicitly or read from a callback on each scrape"""
+
+    type_name = 'gauge'
+
+    _values: dict[LabelValues, float] = attr.ib(init=False, factory=dict)
+    _function: Optional[Callable[[], float]] = attr.ib(init=False, default=None)
+
+    def set(self, value: float, label_values: LabelValues = ()) -> None:
+        self._values[label_values] = value
+
+    def inc(self, label_values: LabelValues = (), amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, label_values: LabelValues = (), amount: float = 1.0) -> None:
+        self.inc(label_values, amount=-amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        assert not self.label_names, 'Callback gauges cannot have labels'
+        self._function = function
+
+    def get(self, label_values: LabelValues = ()) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(label_values, 0.0)
+
+    def render_samples(self) -> Iterable[str]:
+        if self._function is not None:
+            yield f'{self.name}{self._format_labels(())} {_format_value(self._function())}'
+            return
+        for label_values, value in self._values.items():
+            yield f'{self.name}{self._format_labels(label_values)} {_format_value(value)}'
+
+
+@attr.s
+class _HistogramSeries:
+    bucket_counts: list[int] = attr.ib()
+    sum: float = attr.ib(default=0.0)
+    count: int = attr.ib(default=0)
+
+
+@attr.s(slots=True)
+class _Timer:
+    _histogram: 'Histogram' = attr.ib()
+    _label_values: LabelValues = attr.ib()
+    _start: float = attr.ib(default=0.0)
+
+    def __enter__(self) -> '_Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, self._label_values)
+
+
+@attr.s
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    buckets: tuple[float, ...] = attr.ib(kw_only=True, default=DEFAULT_LATENCY_BUCKETS)
+    _series: dict[LabelValues, _HistogramSeries] = attr.ib(init=False, factory=dict)
+
+    def observe(self, value: float, label_values: LabelValues = ()) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = _HistogramSeries(bucket_counts=[0] * (len(self.buckets) + 1))
+        series.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def time(self, label_values: LabelValues = ()) -> _Timer:
+        """Context manager that observes the duration of its block"""
+        return _Timer(self, label_values)
+
+    def get_count(self, label_values: LabelValues = ()) -> int:
+        series = self._series.get(label_values)
+        return series.count if series is not None else 0
+
+    def render_samples(self) -> Iterable[str]:
+        bucket_label_names = self.label_names + ('le',)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (math.inf,), series.bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    bucket_label_names, label_values + (_format_value(upper_bound),), self.const_labels,
+                )
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = self._format_labels(label_values)
+            yield f'{self.name}_sum{labels} {_format_value(series.sum)}'
+            yield f'{self.name}_count{labels} {series.count}'
+
+
+@attr.s
+class MetricsRegistry:
+    """
+    Metrics with the same name may be registered several times with different const labels
+    (see `labeled`); they are rendered as a single metric family.
+    """
+
+    _const_labels: ConstLabels = attr.ib(kw_only=True, default=())
+    _metrics: dict[str, list[Metric]] = attr.ib(kw_only=True, factory=dict)
+
+    def labeled(self, **const_labels: str) -> 'MetricsRegistry':
+        """Make a view of the registry that adds the const labels to the metrics created through it"""
+        return MetricsRegistry(const_labels=self._const_labels + tuple(const_labels.items()), metrics=self._metrics)
+
+    def register(self, metric: Metric) -> None:
+        family = self._metrics.setdefault(metric.name, [])
+        assert all(
+            other.const_labels != metric.const_labels for other in family
+        ), f'Duplicate metric: {metric.name}'
+        family.append(metric)
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name=name, help=help, label_names=label_names, const_labels=self._const_labels)
+        self.register(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name=name, help=help, label_names=label_names, const_labels=self._const_labels)
+        self.register(metric)
+        return metric
+
+    def histogram(
+            self, name: str, help: str, label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(
+            name=name, help=help, label_names=label_names, buckets=buckets, const_labels=self._const_labels,
+        )
+        self.register(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for family in self._metrics.values():
+            lines.extend(family[0].render())
+            for metric in family[1:]:
+                lines.extend(metric.render_samples())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def get_redirect_outcome(err: Optional[Exception]) -> str:
+    if err is None:
+        return 'ok'
+    if isinstance(err, exc.NotionAccessDenied):
+        return 'access_denied'
+    if isinstance(err, exc.InvalidState):
+        return 'invalid_state'
+    if isinstance(err, exc.TokenRequestFailed):
+        return 'token_failed'
+    if isinstance(err, exc.InvalidTokenResponse):
+        return 'invalid_response'
+    if isinstance(err, exc.OperationTimeout):
+        return 'timeout'
+    if isinstance(err, exc.HandlerOverloaded):
+        return 'overloaded'
+    if isinstance(err, exc.CircuitOpen):
+        return 'circuit_open'
+    if isinstance(err, exc.NotionUnavailable):
+        return 'unavailable'
+    return 'error'
+
+
+@attr.s
+class OAuthMetrics:
+    """Metrics of `NotionOAuthHandler`"""
+
+    registry: MetricsRegistry = attr.ib(kw_only=True, factory=MetricsRegistry)
+
+    def __attrs_post_init__(self) -> None:
+        registry = self.registry
+        self.redirects = registry.counter(
+            'notion_oauth_redirects_total', 'Handled OAuth redirects by outcome', ('outcome',))
+        self.redirect_duration = registry.histogram(
+            'notion_oauth_redirect_duration_seconds', 'Total duration of handling an OAuth redirect')
+        self.phase_duration = registry.histogram(
+            'notion_oauth_phase_duration_seconds', 'Duration of each phase of an OAuth redirect', ('phase',))
+        self.upstream_responses = registry.counter(
+            'notion_oauth_upstream_responses_total', 'Responses of the Notion token endpoint by status', ('status',))
+        self.token_retries = registry.counter(
+            'notion_oauth_token_retries_total', 'Retried token requests')
+        self.exchanges_in_flight = registry.gauge(
+            'notion_oauth_exchanges_in_flight', 'Token exchanges currently in progress')
+        self.exchanges_queued = registry.gauge(
+            'notion_oauth_exchanges_queued', 'Token exchanges waiting for a free slot')
+        self.token_queue_depth = registry.gauge(
+            'notion_oauth_token_queue_depth', 'Token results waiting to be consumed in the batch mode')
+        self.token_batch_size = registry.histogram(
+            'notion_oauth_token_batch_size', 'Number of token results per consumed batch',
+            buckets=BATCH_SIZE_BUCKETS)
+        self.token_batch_failures = registry.counter(
+            'notion_oauth_token_batch_failures_total', 'Batches of token results that failed to be consumed')
+        self.spool_pending = registry.gauge(
+            'notion_oauth_spool_pending', 'Spooled token results that have not been consumed yet')
+        self.spool_replays = registry.counter(
+            'notion_oauth_spool_replays_total', 'Replays of spooled token results by outcome', ('outcome',))
+        self.circuit_state = registry.gauge(
+            'notion_oauth_circuit_state', 'State of the token endpoint circuit breaker (0 closed, 1 open, 2 half-open)')
+        self.circuit_transitions = registry.counter(
+            'notion_oauth_circuit_transitions_total', 'State changes of the token endpoint circuit breaker by state',
+            ('state',))
+
+    def time_phase(self, phase: str) -> _Timer:
+        return self.phase_duration.time((phase,))
+
+    def observe_redirect(self, err: Optional[Exception], duration: float) -> None:
+        self.redirects.inc((get_redirect_outcome(err),))
+        self.redirect_duration.observe(duration)
@@ -1,14 +1,75 @@
+import asyncio
 import base64
+import logging
+import time
 from http import HTTPStatus
-from typing import Any, ClassVar
+from types import MappingProxyType
+from typing import Any, ClassVar, Mapping, Optional
 
 import aiohttp
 import attr
 import yarl
 
 import notion_oauth_handler.core.exc as exc
-from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+from notion_oauth_handler.core.dto import TOKEN_RESPONSE_FIELDS, AuthRedirectInfo, TokenResponseInfo
 from notion_oauth_handler.core.consumer import NotionOAuthConsumer
+from notion_oauth_handler.core.batching import BatchSettings, TokenBatcher
+from notion_oauth_handler.core.circuit_breaker import (
+    CircuitBreaker, CircuitBreakerSettings, CircuitState, is_failure_status,
+)
+from notion_oauth_handler.core.dedup import SingleFlight, make_redirect_key
+from notion_oauth_handler.core.executor import ExecutorSettings, HookExecutor
+from notion_oauth_handler.core.limiter import ConcurrencyLimiter
+from notion_oauth_handler.core.metrics import OAuthMetrics
+from notion_oauth_handler.core.retry import RetryPolicy, parse_retry_after
+from notion_oauth_handler.core.session import ClientSessionSettings, make_client_session
+from notion_oauth_handler.core.spool import SpoolSettings, TokenSpool
+from notion_oauth_handler.core.timeouts import TimeoutSettings
+from notion_oauth_handler.core.tracing import NoopTracer, Tracer
+
+
+_LOGGER = logging.getLogger(__name__)
+
+SpooledTokenBatchItem = tuple[TokenResponseInfo, Any, Optional[str]]  # Token info, state info, spool entry ID
+
+
+@attr.s(frozen=True, slots=True)
+class _TokenRequestData:
+    """Parts of the token request that do not depend on the redirect"""
+
+    url: yarl.URL = attr.ib(kw_only=True)
+    headers: Mapping[str, str] = attr.ib(kw_only=True)
+
+
+def _make_basic_auth_headers(client_id: str, client_secret: str) -> Mapping[str, str]:
+    credential_token = base64.b64encode(f'{client_id}:{client_secret}'.encode()).decode()
+    return MappingProxyType({
+        'Authorization': f'Basic {credential_token}',
+    })
+
+
+def parse_token_response(response_body: Any) -> TokenResponseInfo:
+    """Pack the token response into the DTO. Raises `InvalidTokenResponse` if it is malformed"""
+
+    try:
+        token_info = TokenResponseInfo(
+            access_token=response_body['access_token'],
+            workspace_id=response_body['workspace_id'],
+            workspace_name=response_body['workspace_name'],
+            workspace_icon=response_body['workspace_icon'],
+            bot_id=response_body['bot_id'],
+            owner=response_body['owner'],
+        )
+    except (KeyError, TypeError):
+        if not isinstance(response_body, dict):
+            raise exc.InvalidTokenResponse('Token response is not a JSON object') from None
+        missing_fields = [field for field in TOKEN_RESPONSE_FIELDS if field not in response_body]
+        raise exc.InvalidTokenResponse(
+            f'Token response is missing fields: {", ".join(missing_fields)}', missing_fields=missing_fields,
+        ) from None
+    if not token_info.access_token or not isinstance(token_info.access_token, str):
+        raise exc.InvalidTokenResponse('Token response contains no access token')
+    return token_info
 
 
 @attr.s
@@ -24,19 +85,147 @@ class NotionOAuthHandler:
     _client_id: str = attr.ib(kw_only=True)
     _client_secret: str = attr.ib(kw_only=True)
     _base_url: str = attr.ib(kw_only=True)
+    _session_settings: ClientSessionSettings = attr.ib(kw_only=True, factory=ClientSessionSettings)
+    _limiter: ConcurrencyLimiter = attr.ib(kw_only=True, factory=ConcurrencyLimiter)
+    _retry_policy: RetryPolicy = attr.ib(kw_only=True, factory=RetryPolicy)
+    _timeouts: TimeoutSettings = attr.ib(kw_only=True, factory=TimeoutSettings)
+    _single_flight: SingleFlight[TokenResponseInfo] = attr.ib(kw_only=True, factory=SingleFlight)
+    _metrics: OAuthMetrics = attr.ib(kw_only=True, factory=OAuthMetrics)
+    _tracer: Tracer = attr.ib(kw_only=True, factory=NoopTracer)
+    _batch_settings: BatchSettings = attr.ib(kw_only=True, factory=BatchSettings)
+    _spool_settings: SpoolSettings = attr.ib(kw_only=True, factory=SpoolSettings)
+    _executor_settings: ExecutorSettings = attr.ib(kw_only=True, factory=ExecutorSettings)
+    _circuit_breaker_settings: CircuitBreakerSettings = attr.ib(kw_only=True, factory=CircuitBreakerSettings)
+    _session: Optional[aiohttp.ClientSession] = attr.ib(init=False, default=None)
+    _hook_executor: HookExecutor = attr.ib(init=False)
+    _sync_hooks: frozenset[str] = attr.ib(init=False)  # Names of the consumer's hooks to run in the executor
+    _circuit_breaker: CircuitBreaker = attr.ib(init=False)
+    _batcher: Optional[TokenBatcher[SpooledTokenBatchItem]] = attr.ib(init=False, default=None)
+    _spool: Optional[TokenSpool] = attr.ib(init=False, default=None)
+    _token_request_data: _TokenRequestData = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        limiter = self._limiter
+        self._metrics.exchanges_in_flight.set_function(lambda: limiter.in_flight)
+        self._metrics.exchanges_queued.set_function(lambda: limiter.queue_depth)
+        if self._batch_settings.enabled:
+            batcher = self._batcher = TokenBatcher(
+                settings=self._batch_settings, consume_batch=self._consume_token_batch,
+            )
+            self._metrics.token_queue_depth.set_function(lambda: batcher.queue_depth)
+        if self._spool_settings.enabled:
+            spool = self._spool = TokenSpool(
+                settings=self._spool_settings,
+                replay=self._replay_token_info,
+                dump_state_info=self._consumer.dump_state_info,
+                load_state_info=self._consumer.load_state_info,
+            )
+            self._metrics.spool_pending.set_function(lambda: spool.pending_count)
+        self._token_request_data = self._make_token_request_data(
+            client_id=self._client_id, client_secret=self._client_secret,
+        )
+        circuit_breaker = self._circuit_breaker = CircuitBreaker(
+            settings=self._circuit_breaker_settings, on_state_change=self._observe_circuit_state,
+        )
+        self._metrics.circuit_state.set_function(lambda: circuit_breaker.state)
+        self._hook_executor = HookExecutor(settings=self._executor_settings, consumer=self._consumer)
+        self._sync_hooks = frozenset(
+            hook_name for hook_name in (
+                'consume_redirect_error', 'consume_redirect_info', 'consume_token_info', 'consume_token_info_batch',
+            )
+            if self._consumer.is_sync_hook(hook_name)
+        )
+
+    def _observe_circuit_state(self, state: CircuitState) -> None:
+        self._metrics.circuit_transitions.inc((state.name.lower(),))
 
     @_base_url.default
     def _make_base_url(self) -> str:
         return self._default_base_url
 
+    @property
+    def consumer(self) -> NotionOAuthConsumer:
+        return self._consumer
+
+    @property
+    def limiter(self) -> ConcurrencyLimiter:
+        """Exposes the number of in-flight and queued token exchanges"""
+        return self._limiter
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """Exposes the state of the circuit breaker around the token endpoint"""
+        return self._circuit_breaker
+
+    @property
+    def metrics(self) -> OAuthMetrics:
+        return self._metrics
+
+    @property
+    def tracer(self) -> Tracer:
+        return self._tracer
+
+    def _make_session(self) -> aiohttp.ClientSession:
+        trace_config = self._tracer.make_trace_config()
+        return make_client_session(
+            self._session_settings,
+            trace_configs=[trace_config] if trace_config is not None else None,
+        )
+
+    async def startup(self) -> None:
+        """
+        Open the pooled client session, the spool and start the token batcher (if enabled).
+        Should be called once the event loop is running
+        """
+        if self._session is None:
+            self._session = self._make_session()
+        if self._spool is not None:
+            await self._spool.start()
+        if self._batcher is not None:
+            self._batcher.start()
+
+    async def cleanup(self) -> None:
+        """
+        Drain the token batcher, close the spool, stop the executor of sync consumer hooks,
+        the client session and all of its pooled connections
+        """
+        if self._batcher is not None:
+            await self._batcher.stop()
+        if self._spool is not None:
+            await self._spool.stop()
+        await self._hook_executor.shutdown()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            # The handler is being used outside of an application's lifecycle
+            self._session = self._make_session()
+        return self._session
+
+    def _make_token_request_data(self, client_id: str, client_secret: str) -> _TokenRequestData:
+        base_url = self._base_url or self._default_base_url
+        return _TokenRequestData(
+            url=yarl.URL(base_url.rstrip('/')) / self._auth_entrypoint.lstrip('/'),
+            headers=_make_basic_auth_headers(client_id, client_secret),
+        )
+
+    def update_credentials(self, client_id: str, client_secret: str) -> None:
+        """
+        Switch to new client credentials.
+        Token requests that have already started keep using the old ones
+        """
+        # A single assignment, so no request can see a mix of the old and the new credentials
+        self._token_request_data = self._make_token_request_data(client_id=client_id, client_secret=client_secret)
+        self._client_id = client_id
+        self._client_secret = client_secret
+
     def _make_token_url(self, redirect_info: AuthRedirectInfo) -> yarl.URL:
-        return yarl.URL(self._base_url.rstrip('/')) / self._auth_entrypoint.lstrip('/')
+        return self._token_request_data.url
 
-    def _make_token_headers(self, redirect_info: AuthRedirectInfo) -> Any:
-        credential_token = base64.b64encode(f'{self._client_id}:{self._client_secret}'.encode()).decode()
-        return {
-            'Authorization': f'Basic {credential_token}',
-        }
+    def _make_token_headers(self, redirect_info: AuthRedirectInfo) -> Mapping[str, str]:
+        return self._token_request_data.headers
 
     def _make_token_body(self, redirect_info: AuthRedirectInfo) -> dict:
         return {
@@ -45,41 +234,204 @@ class NotionOAuthHandler:
             'redirect_uri': redirect_info.redirect_uri,
         }
 
-    async def _make_token_request(self, redirect_info: AuthRedirectInfo) -> TokenResponseInfo:
+    async def _make_token_request(
+            self, redirect_info: AuthRedirectInfo, deadline: Optional[float] = None,
+    ) -> TokenResponseInfo:
+        """
+        Request the token from Notion.
+        Safe-to-retry failures are retried according to the retry policy
+        as long as the next attempt fits in before `deadline` (event loop time).
+        Connection errors and upstream failures (5xx and 429 responses) raise `NotionUnavailable`,
+        other error responses raise `TokenRequestFailed`.
+        """
+
         # Make request parameters
         url = self._make_token_url(redirect_info=redirect_info)
         body = self._make_token_body(redirect_info=redirect_info)
         headers = self._make_token_headers(redirect_info=redirect_info)
 
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            deadline = loop.time() + self._retry_policy.settings.deadline
+
         # Make the request
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=body, headers=headers) as response:
-                if response.status != HTTPStatus.OK:
-                    raise exc.TokenRequestFailed(
-                        request_data=body,
-                        request_headers=headers,
-                        response_status=response.status,
-                        response_body=await response.text(),
-                    )
-                response_body = await response.json()
-
-        # Pack response into DTO
-        token_info = TokenResponseInfo(
-            access_token=response_body['access_token'],
-            workspace_id=response_body['workspace_id'],
-            workspace_name=response_body['workspace_name'],
-            workspace_icon=response_body['workspace_icon'],
-            bot_id=response_body['bot_id'],
-            owner=response_body['owner'],
-        )
-        return token_info
+        session = self._get_session()
+        attempt = 0
+        while True:
+            attempt += 1
+            failure: Exception
+            retry_after: Optional[float] = None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise exc.OperationTimeout(
+                    'Token request deadline exceeded', operation='token_request',
+                    timeout=self._retry_policy.settings.deadline,
+                )
+            client_timeout = self._timeouts.make_client_timeout(remaining=remaining)
+            # Fails fast with `CircuitOpen` (also between the attempts) while the endpoint keeps failing
+            with self._circuit_breaker.call() as call_outcome:
+                try:
+                    async with session.post(url, data=body, headers=headers, timeout=client_timeout) as response:
+                        self._metrics.upstream_responses.inc((str(response.status),))
+                        if response.status == HTTPStatus.OK:
+                            try:
+                                response_body = await response.json()
+                            except (ValueError, aiohttp.ContentTypeError) as err:
+                                raise exc.InvalidTokenResponse(f'Token response is not valid JSON: {err}') from err
+                            # Parsed within the breaker, so a malformed response counts as a failure
+                            return parse_token_response(response_body)
+                        response_text = await response.text()
+                        if is_failure_status(response.status):
+                            # Notion is failing (as opposed to rejecting the request), so this is not a client error
+                            failure = exc.NotionUnavailable(
+                                f'Notion responded with status {response.status}', attempts=attempt,
+                            )
+                            call_outcome.failed = True
+                        else:
+                            failure = exc.TokenRequestFailed(
+                                request_data=body,
+                                request_headers=headers,
+                                response_status=response.status,
+                                response_body=response_text,
+                                attempts=attempt,
+                            )
+                        retryable = self._retry_policy.is_retryable_status(response.status)
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                except asyncio.TimeoutError as err:
+                    raise exc.OperationTimeout(
+                        f'Token request timed out on attempt {attempt}', operation='token_request',
+                        timeout=client_timeout.total,
+                    ) from err
+                except aiohttp.ClientError as err:
+                    failure = exc.NotionUnavailable(f'Token request to Notion failed: {err!r}', attempts=attempt)
+                    failure.__cause__ = err
+                    retryable = self._retry_policy.is_retryable_error(err)
+                    call_outcome.failed = True
+
+            if not retryable or not self._retry_policy.can_retry(attempt):
+                raise failure
+            delay = self._retry_policy.get_delay(attempt, retry_after=retry_after)
+            if loop.time() + delay >= deadline:
+                _LOGGER.warning('Not retrying token request: deadline would be exceeded')
+                raise failure
+            _LOGGER.info(f'Token request attempt {attempt} failed ({failure!r}), retrying in {delay:.3f}s')
+            self._metrics.token_retries.inc()
+            await asyncio.sleep(delay)
+
+    async def _call_consumer(self, operation: str, **kwargs: Any) -> Any:
+        """Call a consumer hook (named `operation`) within the consumer timeout"""
+
+        timeout = self._timeouts.consumer_timeout
+        try:
+            with self._tracer.span(f'oauth.consumer.{operation}'), self._metrics.time_phase(operation):
+                if operation in self._sync_hooks:
+                    hook_call = self._hook_executor.run(operation, **kwargs)
+                else:
+                    hook_call = getattr(self._consumer, operation)(**kwargs)
+                return await asyncio.wait_for(hook_call, timeout=timeout)
+        except asyncio.TimeoutError as err:
+            raise exc.OperationTimeout(
+                f'Consumer hook {operation} timed out', operation=operation, timeout=timeout,
+            ) from err
+
+    async def _spool_token_info(self, token_info: TokenResponseInfo, state_info: Any) -> Optional[str]:
+        """Record token info in the spool (if enabled) before it is consumed. Returns the spool entry ID"""
+
+        if self._spool is None:
+            return None
+        try:
+            with self._metrics.time_phase('spool_append'):
+                return await self._spool.append(token_info=token_info, state_info=state_info)
+        except Exception:
+            _LOGGER.exception('Failed to spool token info, consuming it without the spool')
+            return None
+
+    def _settle_spool_entries(self, entry_ids: list[Optional[str]], consumed: bool) -> None:
+        assert self._spool is not None
+        for entry_id in entry_ids:
+            if entry_id is None:
+                continue
+            if consumed:
+                self._spool.ack(entry_id)
+            else:
+                self._spool.retry_later(entry_id)
+
+    async def _consume_token_info(self, token_info: TokenResponseInfo, state_info: Any) -> None:
+        entry_id = await self._spool_token_info(token_info=token_info, state_info=state_info)
+        try:
+            await self._call_consumer('consume_token_info', token_info=token_info, state_info=state_info)
+        except Exception:
+            if entry_id is None:
+                raise
+            # The token is safe in the spool, so the redirect does not fail
+            _LOGGER.exception('Failed to consume token info, it will be replayed from the spool')
+            self._settle_spool_entries([entry_id], consumed=False)
+        else:
+            if entry_id is not None:
+                self._settle_spool_entries([entry_id], consumed=True)
+
+    async def _replay_token_info(self, token_info: TokenResponseInfo, state_info: Any) -> None:
+        try:
+            await self._call_consumer('consume_token_info', token_info=token_info, state_info=state_info)
+        except Exception:
+            self._metrics.spool_replays.inc(('failed',))
+            raise
+        self._metrics.spool_replays.inc(('ok',))
+
+    async def _consume_token_batch(self, items: list[SpooledTokenBatchItem]) -> None:
+        self._metrics.token_batch_size.observe(len(items))
+        entry_ids = [entry_id for _, _, entry_id in items]
+        try:
+            await self._call_consumer(
+                'consume_token_info_batch',
+                items=[(token_info, state_info) for token_info, state_info, _ in items],
+            )
+        except Exception:
+            self._metrics.token_batch_failures.inc()
+            if self._spool is not None:
+                self._settle_spool_entries(entry_ids, consumed=False)
+            raise
+        if self._spool is not None:
+            self._settle_spool_entries(entry_ids, consumed=True)
 
     async def handle_error(self, error_text: str) -> None:
-        await self._consumer.consume_redirect_error(error_text=error_text)
-        raise exc.NotionAccessDenied('Notion access was denied')
+        start = time.perf_counter()
+        try:
+            await self._call_consumer('consume_redirect_error', error_text=error_text)
+            raise exc.NotionAccessDenied('Notion access was denied')
+        except Exception as err:
+            self._metrics.observe_redirect(err, duration=time.perf_counter() - start)
+            raise
 
     async def handle_auth(self, redirect_info: AuthRedirectInfo) -> TokenResponseInfo:
-        state_info = await self._consumer.consume_redirect_info(redirect_info=redirect_info)
-        token_info = await self._make_token_request(redirect_info=redirect_info)
-        await self._consumer.consume_token_info(token_info=token_info, state_info=state_info)
+        """
+        Exchange the authorization code for a token.
+        Replayed redirects with the same code and state share a single exchange
+        and get the same result.
+        """
+
+        start = time.perf_counter()
+        try:
+            token_info = await self._single_flight.run(
+                make_redirect_key(redirect_info.code, redirect_info.state),
+                lambda: self._handle_auth_once(redirect_info=redirect_info),
+            )
+        except Exception as err:
+            self._metrics.observe_redirect(err, duration=time.perf_counter() - start)
+            raise
+        self._metrics.observe_redirect(None, duration=time.perf_counter() - start)
+        return token_info
+
+    async def _handle_auth_once(self, redirect_info: AuthRedirectInfo) -> TokenResponseInfo:
+        deadline = asyncio.get_running_loop().time() + self._retry_policy.settings.deadline
+        async with self._limiter.slot():
+            state_info = await self._call_consumer('consume_redirect_info', redirect_info=redirect_info)
+            with self._tracer.span('oauth.token_request'), self._metrics.time_phase('token_request'):
+                token_info = await self._make_token_request(redirect_info=redirect_info, deadline=deadline)
+            if self._batcher is None:
+                await self._consume_token_info(token_info=token_info, state_info=state_info)
+        if self._batcher is not None:
+            # The token info is consumed in the background, so the redirect is answered right away
+            entry_id = await self._spool_token_info(token_info=token_info, state_info=state_info)
+            await self._batcher.put((token_info, state_info, entry_id))
         return token_info
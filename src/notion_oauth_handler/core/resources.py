@@ -0,0 +1,67 @@
+"""
+App-scoped resources, such as database connection pools, shared across redirects.
+
+Consumers create them in `NotionOAuthConsumer.on_startup` and add them to the container
+along with a function that closes them. The container closes them on app cleanup in the reverse order,
+after all consumers' `on_cleanup` hooks have been called.
+"""
+
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Optional, TypeVar, Union
+
+import attr
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_RESOURCE_TV = TypeVar('_RESOURCE_TV')
+
+CloseFunc = Callable[[Any], Union[Awaitable[Any], Any]]  # May be sync or async
+
+
+@attr.s
+class ResourceContainer:
+    _resources: dict[str, Any] = attr.ib(init=False, factory=dict)
+    _close_funcs: list[tuple[str, CloseFunc]] = attr.ib(init=False, factory=list)
+
+    def add(self, name: str, resource: _RESOURCE_TV, close: Optional[CloseFunc] = None) -> _RESOURCE_TV:
+        """Add a resource; `close` is called with it on cleanup"""
+
+        if name in self._resources:
+            raise KeyError(f'Resource {name!r} already exists')
+        self._resources[name] = resource
+        if close is not None:
+            self._close_funcs.append((name, close))
+        return resource
+
+    async def get_or_create(
+            self,
+            name: str,
+            create: Callable[[], Awaitable[_RESOURCE_TV]],
+            close: Optional[CloseFunc] = None,
+    ) -> _RESOURCE_TV:
+        """Get the resource if it exists (e.g. added by another consumer) or create and add it"""
+
+        if name in self._resources:
+            return self._resources[name]
+        return self.add(name, await create(), close=close)
+
+    def __getitem__(self, name: str) -> Any:
+        return self._resources[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resources
+
+    async def close(self) -> None:
+        """Close all resources in the reverse order; failures are logged and do not stop the others"""
+
+        while self._close_funcs:
+            name, close = self._close_funcs.pop()
+            try:
+                result = close(self._resources[name])
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                _LOGGER.exception(f'Failed to close resource {name!r}')
+        self._resources.clear()
@@ -0,0 +1,71 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from typing import Optional
+
+import aiohttp
+import attr
+
+
+_DEFAULT_RETRY_STATUSES = frozenset({
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+})
+
+
+@attr.s(frozen=True)
+class RetrySettings:
+    max_attempts: int = attr.ib(kw_only=True, default=3)
+    base_delay: float = attr.ib(kw_only=True, default=0.2)
+    max_delay: float = attr.ib(kw_only=True, default=3.0)
+    deadline: float = attr.ib(kw_only=True, default=10.0)  # Overall budget of the token request (seconds)
+    retry_statuses: frozenset[int] = attr.ib(kw_only=True, default=_DEFAULT_RETRY_STATUSES)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse the value of a `Retry-After` header (either seconds or an HTTP date)"""
+
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+@attr.s(frozen=True)
+class RetryPolicy:
+    """
+    Decides which token request failures can be retried and how long to wait before each retry.
+
+    Only failures that are safe to retry are retried:
+    connection errors (the request never reached Notion)
+    and responses with one of `retry_statuses`.
+    """
+
+    settings: RetrySettings = attr.ib(kw_only=True, factory=RetrySettings)
+
+    def is_retryable_status(self, status: int) -> bool:
+        return status in self.settings.retry_statuses
+
+    def is_retryable_error(self, err: Exception) -> bool:
+        return isinstance(err, aiohttp.ClientConnectorError)
+
+    def can_retry(self, attempt: int) -> bool:
+        return attempt < self.settings.max_attempts
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter; `Retry-After` (if given) is used as the lower bound"""
+
+        backoff = min(self.settings.max_delay, self.settings.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
@@ -0,0 +1,30 @@
+from typing import Optional, Sequence
+
+import aiohttp
+import attr
+
+
+@attr.s(frozen=True)
+class ClientSessionSettings:
+    """
+    Connection pool settings of the HTTP client used for requests to Notion
+    """
+
+    pool_limit: int = attr.ib(kw_only=True, default=100)
+    pool_limit_per_host: int = attr.ib(kw_only=True, default=0)  # 0 means no limit
+    keepalive_timeout: float = attr.ib(kw_only=True, default=30.0)
+    dns_cache_ttl: int = attr.ib(kw_only=True, default=300)
+
+
+def make_client_session(
+        settings: ClientSessionSettings,
+        trace_configs: Optional[Sequence[aiohttp.TraceConfig]] = None,
+) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.pool_limit,
+        limit_per_host=settings.pool_limit_per_host,
+        keepalive_timeout=settings.keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.dns_cache_ttl,
+    )
+    return aiohttp.ClientSession(connector=connector, trace_configs=list(trace_configs) if trace_configs else None)
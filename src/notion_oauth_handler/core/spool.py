@@ -0,0 +1,387 @@
+"""
+Durable local spool of token results.
+
+Token info (with the consumer's state info, see `NotionOAuthConsumer.dump_state_info`) is appended to the spool file
+before the consumer gets it, and is acknowledged once the consumer succeeds.
+Entries the consumer failed to handle are replayed in the background
+with exponential backoff, so an outage of the consumer's backend
+does not lose access tokens (authorization codes are single-use).
+
+The spool file is a JSON lines log of `add` and `ack` records. It contains access tokens,
+so it is created readable by the owner only.
+Appends issued close together share a single write and `fsync` (group commit).
+Once enough entries are acknowledged, the file is compacted
+(rewritten with the pending entries only).
+
+Each process needs a file of its own: a process that finds the spool file
+locked by another one uses `<path>.<pid>` instead.
+On startup, pending entries of unlocked sibling files (left by stopped processes) are adopted.
+"""
+
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import random
+import re
+from typing import IO, Any, Awaitable, Callable, Optional
+
+import attr
+
+from notion_oauth_handler.core.dto import TokenResponseInfo
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_ADD_OP = 'add'
+_ACK_OP = 'ack'
+
+StateInfoDumper = Callable[[Any], Any]
+StateInfoLoader = Callable[[Any], Any]
+
+
+@attr.s(frozen=True)
+class SpoolSettings:
+    path: str = attr.ib(kw_only=True, default='')  # Empty disables the spool
+    fsync_interval: float = attr.ib(kw_only=True, default=0.005)  # Group commit window (seconds)
+    replay_interval: float = attr.ib(kw_only=True, default=1.0)  # How often due entries are looked for
+    replay_base_delay: float = attr.ib(kw_only=True, default=1.0)
+    replay_max_delay: float = attr.ib(kw_only=True, default=300.0)
+    compact_threshold: int = attr.ib(kw_only=True, default=1000)  # Acknowledged entries that trigger compaction
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+
+@attr.s(slots=True)
+class SpoolEntry:
+    entry_id: str = attr.ib(kw_only=True)
+    token_info: TokenResponseInfo = attr.ib(kw_only=True)
+    state_info: Any = attr.ib(kw_only=True)
+    record: str = attr.ib(kw_only=True)  # Serialized `add` record, reused on compaction
+    attempts: int = attr.ib(kw_only=True, default=0)
+    next_attempt: Optional[float] = attr.ib(kw_only=True, default=None)  # None if not scheduled for replay
+
+
+def _make_entry_id() -> str:
+    return os.urandom(12).hex()
+
+
+def _make_add_record(entry_id: str, token_info: TokenResponseInfo, state_data: Any) -> str:
+    return json.dumps({
+        'op': _ADD_OP,
+        'id': entry_id,
+        'token_info': token_info.to_dict(),
+        'state_info': state_data,
+    }) + '\n'
+
+
+def _make_ack_record(entry_id: str) -> str:
+    return json.dumps({'op': _ACK_OP, 'id': entry_id}) + '\n'
+
+
+def _read_entries(file: IO[str], filename: str, load_state_info: StateInfoLoader) -> dict[str, SpoolEntry]:
+    """Read the entries that have been added, but not acknowledged"""
+
+    entries: dict[str, SpoolEntry] = {}
+    for line_no, line in enumerate(file, 1):
+        if not line.endswith('\n'):
+            # Torn write of the last record: it has never been acknowledged to the caller
+            _LOGGER.warning(f'Ignoring incomplete record at {filename}:{line_no}')
+            break
+        try:
+            record = json.loads(line)
+            if record['op'] == _ADD_OP:
+                entries[record['id']] = SpoolEntry(
+                    entry_id=record['id'],
+                    token_info=TokenResponseInfo(**record['token_info']),
+                    state_info=load_state_info(record['state_info']),
+                    record=line,
+                )
+            elif record['op'] == _ACK_OP:
+                entries.pop(record['id'], None)
+        except Exception:
+            _LOGGER.exception(f'Ignoring invalid record at {filename}:{line_no}')
+    return entries
+
+
+def _open_private(path: str, mode: str) -> IO[str]:
+    """Open the file for appending (`a+`) or writing (`w`), creating it with access for the owner only"""
+    flags = os.O_CREAT | (os.O_RDWR | os.O_APPEND if mode == 'a+' else os.O_WRONLY | os.O_TRUNC)
+    return os.fdopen(os.open(path, flags, 0o600), mode)
+
+
+def _fsync_dir(path: str) -> None:
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _try_lock(file: IO) -> bool:
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@attr.s
+class TokenSpool:
+    _settings: SpoolSettings = attr.ib(kw_only=True)
+    _replay: Callable[[TokenResponseInfo, Any], Awaitable[None]] = attr.ib(kw_only=True)
+    _dump_state_info: StateInfoDumper = attr.ib(kw_only=True, default=lambda state_info: state_info)
+    _load_state_info: StateInfoLoader = attr.ib(kw_only=True, default=lambda data: data)
+    _filename: str = attr.ib(init=False, default='')
+    _file: Optional[IO[str]] = attr.ib(init=False, default=None)
+    _entries: dict[str, SpoolEntry] = attr.ib(init=False, factory=dict)
+    _acked_since_compaction: int = attr.ib(init=False, default=0)
+    _compaction_scheduled: bool = attr.ib(init=False, default=False)
+    _buffer: list[str] = attr.ib(init=False, factory=list)
+    _waiters: list[asyncio.Future] = attr.ib(init=False, factory=list)
+    _flush_task: Optional[asyncio.Task] = attr.ib(init=False, default=None)
+    _write_lock: Optional[asyncio.Lock] = attr.ib(init=False, default=None)
+    _replayer: Optional[asyncio.Task] = attr.ib(init=False, default=None)
+
+    @property
+    def settings(self) -> SpoolSettings:
+        return self._settings
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._entries)
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+    # File operations (run in the default executor)
+
+    def _open_file(self) -> dict[str, SpoolEntry]:
+        path = self._settings.path
+        file = _open_private(path, 'a+')
+        if not _try_lock(file):
+            file.close()
+            path = f'{path}.{os.getpid()}'
+            file = _open_private(path, 'a+')
+            if not _try_lock(file):
+                file.close()
+                raise RuntimeError(f'Spool file {path} is locked by another process')
+        self._filename = path
+        self._file = file
+        file.seek(0)
+        entries = _read_entries(file, path, self._load_state_info)
+
+        # Adopt entries of the files left by processes that are no longer running
+        adopted_files: list[tuple[IO[str], str]] = []
+        sibling_pattern = re.compile(re.escape(self._settings.path) + r'(\.\d+)?')
+        for sibling_path in [self._settings.path, *glob.glob(f'{glob.escape(self._settings.path)}.*')]:
+            if sibling_path == path or not sibling_pattern.fullmatch(sibling_path):
+                continue
+            sibling_file = open(sibling_path, 'r')
+            if not _try_lock(sibling_file):
+                sibling_file.close()
+                continue
+            sibling_entries = _read_entries(sibling_file, sibling_path, self._load_state_info)
+            if sibling_entries:
+                _LOGGER.info(f'Adopting {len(sibling_entries)} pending entries of {sibling_path}')
+            entries.update(sibling_entries)
+            adopted_files.append((sibling_file, sibling_path))
+
+        self._rewrite_file(entries)
+        for adopted_file, adopted_path in adopted_files:
+            if adopted_path == self._settings.path:
+                os.truncate(adopted_path, 0)
+            else:
+                os.unlink(adopted_path)
+            adopted_file.close()
+        return entries
+
+    def _rewrite_file(self, entries: dict[str, SpoolEntry]) -> None:
+        """Atomically replace the spool file with the given entries (compaction)"""
+
+        assert self._file is not None
+        tmp_path = f'{self._filename}.tmp'
+        with _open_private(tmp_path, 'w') as tmp_file:
+            tmp_file.writelines(entry.record for entry in entries.values())
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        new_file = open(tmp_path, 'a+')
+        _try_lock(new_file)
+        os.replace(tmp_path, self._filename)
+        _fsync_dir(self._filename)
+        self._file.close()
+        self._file = new_file
+
+    def _write_records(self, records: list[str]) -> None:
+        assert self._file is not None
+        self._file.writelines(records)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # Group commit
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(self._settings.fsync_interval)
+        assert self._write_lock is not None
+        async with self._write_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        """Write and fsync the buffered records. Should be called under the write lock"""
+
+        records, self._buffer = self._buffer, []
+        waiters, self._waiters = self._waiters, []
+        self._flush_task = None
+        if not records:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_records, records)
+        except Exception as err:
+            _LOGGER.exception('Failed to write to the spool file')
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(err)
+        else:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def _write(self, record: str, wait: bool) -> Optional[asyncio.Future]:
+        """Buffer the record until the next flush. If `wait` is set, return a future resolved by the flush"""
+
+        self._buffer.append(record)
+        waiter: Optional[asyncio.Future] = None
+        if wait:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_soon())
+        return waiter
+
+    async def _compact(self) -> None:
+        assert self._write_lock is not None
+        async with self._write_lock:
+            self._compaction_scheduled = False
+            if self._file is None:
+                return
+            # The buffered records (acks in particular) go to the old file first,
+            # so that the new one contains nothing but the pending entries
+            self._acked_since_compaction = 0
+            await self._flush()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._rewrite_file, dict(self._entries))
+            except Exception:
+                _LOGGER.exception('Failed to compact the spool file')
+
+    # Public interface
+
+    async def start(self) -> None:
+        """Open the spool file and start replaying the pending entries left by the previous runs"""
+
+        if self._file is not None:
+            return
+        self._write_lock = asyncio.Lock()
+        entries = await asyncio.get_running_loop().run_in_executor(None, self._open_file)
+        now = asyncio.get_running_loop().time()
+        for entry in entries.values():
+            entry.next_attempt = now
+        self._entries.update(entries)
+        if entries:
+            _LOGGER.warning(f'{len(entries)} token(s) from the spool will be replayed')
+        self._replayer = asyncio.create_task(self._run_replayer())
+
+    async def append(self, token_info: TokenResponseInfo, state_info: Any) -> str:
+        """Durably record token info. Returns the ID of the entry to acknowledge"""
+
+        if self._file is None:
+            # The spool is being used outside of an application's lifecycle
+            await self.start()
+        entry_id = _make_entry_id()
+        record = _make_add_record(entry_id, token_info, self._dump_state_info(state_info))
+        # The entry is registered before the record is written, so that a compaction
+        # that starts in the meantime writes it to the new file (it is not replayed until `retry_later`)
+        self._entries[entry_id] = SpoolEntry(
+            entry_id=entry_id, token_info=token_info, state_info=state_info, record=record,
+        )
+        waiter = self._write(record, wait=True)
+        assert waiter is not None
+        try:
+            await waiter
+        except BaseException:
+            self._entries.pop(entry_id, None)
+            raise
+        return entry_id
+
+    def ack(self, entry_id: str) -> None:
+        """Mark the entry as consumed. Losing an ack only causes a repeated replay, so it is not awaited"""
+
+        if self._entries.pop(entry_id, None) is None:
+            return
+        self._write(_make_ack_record(entry_id), wait=False)
+        self._acked_since_compaction += 1
+        if self._acked_since_compaction >= self._settings.compact_threshold and not self._compaction_scheduled:
+            self._compaction_scheduled = True
+            asyncio.create_task(self._compact())
+
+    def retry_later(self, entry_id: str) -> None:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return
+        entry.attempts += 1
+        backoff = min(self._settings.replay_max_delay, self._settings.replay_base_delay * 2 ** (entry.attempts - 1))
+        entry.next_attempt = asyncio.get_running_loop().time() + random.uniform(backoff / 2, backoff)
+
+    async def _replay_due_entries(self) -> None:
+        now = asyncio.get_running_loop().time()
+        due_entries = [
+            entry for entry in self._entries.values()
+            if entry.next_attempt is not None and entry.next_attempt <= now
+        ]
+        for entry in due_entries:
+            entry.next_attempt = None  # Not scheduled while being replayed
+            try:
+                await self._replay(entry.token_info, entry.state_info)
+            except Exception as err:
+                _LOGGER.warning(f'Failed to replay spooled token {entry.entry_id} (attempt {entry.attempts}): {err!r}')
+                self.retry_later(entry.entry_id)
+            else:
+                _LOGGER.info(f'Replayed spooled token {entry.entry_id}')
+                self.ack(entry.entry_id)
+
+    async def _run_replayer(self) -> None:
+        while True:
+            await asyncio.sleep(self._settings.replay_interval)
+            try:
+                await self._replay_due_entries()
+            except Exception:
+                _LOGGER.exception('Spool replayer failed')
+
+    async def stop(self) -> None:
+        """Stop replaying, write the buffered records and close the file"""
+
+        if self._replayer is not None:
+            self._replayer.cancel()
+            try:
+                await self._replayer
+            except asyncio.CancelledError:
+                pass
+            self._replayer = None
+        if self._file is None:
+            return
+        assert self._write_lock is not None
+        if self._flush_task is not None:
+            await self._flush_task
+        async with self._write_lock:
+            await self._flush()
+        if self._acked_since_compaction:
+            await self._compact()
+        if self._entries:
+            _LOGGER.warning(f'{len(self._entries)} token(s) remain in the spool {self._filename}')
+        self._file.close()
+        self._file = None
+        self._entries.clear()
@@ -0,0 +1,137 @@
+"""
+Signed, stateless OAuth `state` tokens.
+
+A state token carries an optional JSON payload and an expiry time
+and is signed with HMAC-SHA256, so it can be verified on redirect without any I/O:
+
+    <key ID>.<base64url(JSON payload)>.<base64url(truncated signature)>
+
+Keys can be rotated: new tokens are signed with the first key,
+while tokens signed with any of the keys are accepted.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Any, Optional, Sequence
+from urllib.parse import urlencode
+
+import attr
+
+import notion_oauth_handler.core.exc as exc
+
+
+NOTION_AUTHORIZE_URL = 'https://api.notion.com/v1/oauth/authorize'
+
+_SIGNATURE_SIZE = 16
+_NONCE_SIZE = 8
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def parse_state_keys(value: str) -> list[tuple[str, bytes]]:
+    """Parse keys in the `<key ID>:<secret>[, <key ID>:<secret>...]` format"""
+
+    keys: list[tuple[str, bytes]] = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key_id, sep, secret = item.partition(':')
+        if not sep or not key_id or not secret or '.' in key_id:
+            raise ValueError('State keys must be specified as <key ID>:<secret> (key IDs may not contain dots)')
+        keys.append((key_id.strip(), secret.strip().encode()))
+    return keys
+
+
+@attr.s(frozen=True, slots=True)
+class SignedState:
+    payload: Any = attr.ib(kw_only=True)
+    expires_at: int = attr.ib(kw_only=True)
+    key_id: str = attr.ib(kw_only=True)
+
+
+@attr.s(frozen=True)
+class StateCodec:
+    keys: Sequence[tuple[str, bytes]] = attr.ib(kw_only=True)  # The first key signs new tokens
+    ttl: int = attr.ib(kw_only=True, default=600)  # Seconds
+    _hmacs: dict[str, Any] = attr.ib(init=False)
+
+    @keys.validator
+    def _validate_keys(self, attribute: attr.Attribute, value: Sequence[tuple[str, bytes]]) -> None:
+        if not value:
+            raise ValueError('At least one state key is required')
+
+    @_hmacs.default
+    def _make_hmacs(self) -> dict[str, Any]:
+        # Keyed HMAC objects are prepared once and copied for each token
+        return {key_id: hmac.new(secret, digestmod=hashlib.sha256) for key_id, secret in self.keys}
+
+    def _sign(self, key_id: str, message: bytes) -> bytes:
+        mac = self._hmacs[key_id].copy()
+        mac.update(message)
+        return mac.digest()[:_SIGNATURE_SIZE]
+
+    def encode(self, payload: Any = None, ttl: Optional[int] = None) -> str:
+        key_id = self.keys[0][0]
+        body = {
+            'e': int(time.time()) + (self.ttl if ttl is None else ttl),
+            'n': _b64encode(os.urandom(_NONCE_SIZE)),
+        }
+        if payload is not None:
+            body['p'] = payload
+        encoded_body = _b64encode(json.dumps(body, separators=(',', ':')).encode())
+        message = f'{key_id}.{encoded_body}'
+        return f'{message}.{_b64encode(self._sign(key_id, message.encode()))}'
+
+    def decode(self, token: str) -> SignedState:
+        """Verify the token and return its contents. Raises `InvalidState` if it cannot be trusted"""
+
+        try:
+            message, _, encoded_signature = token.rpartition('.')
+            key_id, _, encoded_body = message.partition('.')
+            signature = _b64decode(encoded_signature)
+        except ValueError:
+            raise exc.InvalidState('Malformed state') from None
+        if key_id not in self._hmacs or not encoded_body:
+            raise exc.InvalidState('Malformed state or unknown state key')
+        if not hmac.compare_digest(signature, self._sign(key_id, message.encode())):
+            raise exc.InvalidState('Invalid state signature')
+
+        try:
+            body = json.loads(_b64decode(encoded_body))
+            expires_at = int(body['e'])
+        except (ValueError, TypeError, KeyError):
+            raise exc.InvalidState('Malformed state') from None
+        if expires_at < time.time():
+            raise exc.InvalidState('State has expired')
+        return SignedState(payload=body.get('p'), expires_at=expires_at, key_id=key_id)
+
+
+def make_authorize_url(
+        *,
+        client_id: str,
+        redirect_uri: str,
+        state: str,
+        owner: str = 'user',
+        base_url: str = NOTION_AUTHORIZE_URL,
+) -> str:
+    """Make the URL of Notion's authorization page to send the user to"""
+
+    query = urlencode({
+        'client_id': client_id,
+        'redirect_uri': redirect_uri,
+        'response_type': 'code',
+        'owner': owner,
+        'state': state,
+    })
+    return f'{base_url}?{query}'
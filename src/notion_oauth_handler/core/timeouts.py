@@ -0,0 +1,33 @@
+from typing import Optional
+
+import aiohttp
+import attr
+
+
+@attr.s(frozen=True)
+class TimeoutSettings:
+    """
+    Timeouts (in seconds) of the token request to Notion
+    and of each call to the consumer's hooks. 0 means no timeout.
+    """
+
+    connect: float = attr.ib(kw_only=True, default=5.0)
+    read: float = attr.ib(kw_only=True, default=10.0)
+    total: float = attr.ib(kw_only=True, default=15.0)
+    consumer: float = attr.ib(kw_only=True, default=10.0)
+
+    @property
+    def consumer_timeout(self) -> Optional[float]:
+        return self.consumer or None
+
+    def make_client_timeout(self, remaining: Optional[float] = None) -> aiohttp.ClientTimeout:
+        """Make timeout for a single request that also fits into the `remaining` time budget"""
+
+        total = self.total or None
+        if remaining is not None:
+            total = min(total, remaining) if total is not None else remaining
+        return aiohttp.ClientTimeout(
+            total=total,
+            connect=self.connect or None,
+            sock_read=self.read or None,
+        )
@@ -0,0 +1,246 @@
+"""
+Local token store backed by SQLite.
+
+Tokens are upserted by bot ID (one per authorization of the integration in a workspace)
+and indexed by workspace ID and owner user ID. The database is used in the WAL mode,
+so other processes (e.g. the application that uses the tokens) can read it while it is being written.
+
+All database calls are made in a single dedicated thread with its own connection.
+Writes are group-committed: upserts that arrive while a transaction is being committed
+are written together in the next one.
+Lookups by workspace ID go through an in-memory LRU cache, which is updated on each write
+(so it does not see writes made by other processes).
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import sqlite3
+import time
+from typing import Any, Optional
+
+import attr
+
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
+from notion_oauth_handler.core.resources import ResourceContainer
+
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS notion_tokens (
+        bot_id TEXT PRIMARY KEY,
+        workspace_id TEXT NOT NULL,
+        owner_user_id TEXT,
+        token_info BLOB NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS notion_tokens_workspace_id ON notion_tokens (workspace_id, updated_at)',
+    'CREATE INDEX IF NOT EXISTS notion_tokens_owner_user_id ON notion_tokens (owner_user_id)',
+)
+
+_UPSERT_QUERY = """
+    INSERT INTO notion_tokens (bot_id, workspace_id, owner_user_id, token_info, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (bot_id) DO UPDATE SET
+        workspace_id = excluded.workspace_id,
+        owner_user_id = excluded.owner_user_id,
+        token_info = excluded.token_info,
+        updated_at = excluded.updated_at
+"""
+
+_TokenRow = tuple[str, str, Optional[str], bytes, float]
+
+
+@attr.s(frozen=True)
+class TokenStoreSettings:
+    path: str = attr.ib(kw_only=True)
+    cache_size: int = attr.ib(kw_only=True, default=1024)  # Workspaces; 0 disables the cache
+    busy_timeout: float = attr.ib(kw_only=True, default=5.0)  # Seconds to wait for a lock held by another process
+
+
+@attr.s
+class SQLiteTokenStore:
+    _settings: TokenStoreSettings = attr.ib(kw_only=True)
+    _executor: concurrent.futures.ThreadPoolExecutor = attr.ib(init=False)
+    _connection: Optional[sqlite3.Connection] = attr.ib(init=False, default=None)  # Used in the executor only
+    _cache: collections.OrderedDict[str, TokenResponseInfo] = attr.ib(init=False, factory=collections.OrderedDict)
+    _pending: list[tuple[TokenResponseInfo, asyncio.Future]] = attr.ib(init=False, factory=list)
+    _commit_task: Optional[asyncio.Task] = attr.ib(init=False, default=None)
+
+    @_executor.default
+    def _make_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='notion-token-store')
+
+    @property
+    def settings(self) -> TokenStoreSettings:
+        return self._settings
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self._settings.path, timeout=self._settings.busy_timeout, isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')  # Durable enough in the WAL mode
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    def _write_rows(self, rows: list[_TokenRow]) -> None:
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(_UPSERT_QUERY, rows)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _fetch_token_infos(self, query: str, params: tuple[Any, ...]) -> list[TokenResponseInfo]:
+        rows = self._get_connection().execute(query, params).fetchall()
+        return [TokenResponseInfo.from_bytes(token_info_data) for token_info_data, in rows]
+
+    async def _run(self, func: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def open(self) -> None:
+        """Open the database and create the schema (otherwise this is done on first use)"""
+        await self._run(self._get_connection)
+
+    def _cache_put(self, token_info: TokenResponseInfo) -> None:
+        if self._settings.cache_size <= 0:
+            return
+        self._cache[token_info.workspace_id] = token_info
+        self._cache.move_to_end(token_info.workspace_id)
+        while len(self._cache) > self._settings.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _commit_pending(self) -> None:
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                now = time.time()
+                rows = [
+                    (
+                        token_info.bot_id, token_info.workspace_id, token_info.owner_info.user_id,
+                        token_info.to_bytes(), now,
+                    )
+                    for token_info, _ in batch
+                ]
+                try:
+                    await self._run(self._write_rows, rows)
+                except Exception as err:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(err)
+                    continue
+                for token_info, future in batch:
+                    self._cache_put(token_info)
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self._commit_task = None
+
+    async def save_many(self, token_infos: list[TokenResponseInfo]) -> None:
+        """Upsert the tokens; returns once they have been committed"""
+
+        if not token_infos:
+            return
+        loop = asyncio.get_running_loop()
+        futures = []
+        for token_info in token_infos:
+            future = loop.create_future()
+            self._pending.append((token_info, future))
+            futures.append(future)
+        if self._commit_task is None:
+            self._commit_task = asyncio.create_task(self._commit_pending())
+        await asyncio.gather(*futures)
+
+    async def save(self, token_info: TokenResponseInfo) -> None:
+        await self.save_many([token_info])
+
+    async def get_by_workspace_id(self, workspace_id: str) -> Optional[TokenResponseInfo]:
+        """The most recently saved token of the workspace"""
+
+        token_info = self._cache.get(workspace_id)
+        if token_info is not None:
+            self._cache.move_to_end(workspace_id)
+            return token_info
+        token_infos = await self._run(
+            self._fetch_token_infos,
+            'SELECT token_info FROM notion_tokens WHERE workspace_id = ? ORDER BY updated_at DESC LIMIT 1',
+            (workspace_id,),
+        )
+        if not token_infos:
+            return None
+        self._cache_put(token_infos[0])
+        return token_infos[0]
+
+    async def get_by_bot_id(self, bot_id: str) -> Optional[TokenResponseInfo]:
+        token_infos = await self._run(
+            self._fetch_token_infos, 'SELECT token_info FROM notion_tokens WHERE bot_id = ?', (bot_id,),
+        )
+        return token_infos[0] if token_infos else None
+
+    async def get_by_owner_user_id(self, user_id: str) -> list[TokenResponseInfo]:
+        """Tokens of all workspaces authorized by the user, the most recently saved first"""
+        return await self._run(
+            self._fetch_token_infos,
+            'SELECT token_info FROM notion_tokens WHERE owner_user_id = ? ORDER BY updated_at DESC',
+            (user_id,),
+        )
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self) -> None:
+        """Wait for the pending writes and close the database"""
+
+        if self._commit_task is not None:
+            await asyncio.gather(self._commit_task, return_exceptions=True)
+        await self._run(self._close_connection)
+        self._executor.shutdown(wait=True)
+
+
+@attr.s
+class SQLiteTokenStoreNotionOAuthConsumer(DefaultNotionOAuthConsumer):
+    """
+    Saves tokens to a local SQLite database (see `SQLiteTokenStore`);
+    use `token_store` to look them up.
+
+    Uses the following custom settings:
+    - token_store_path: path of the database file (required);
+    - token_store_cache_size: number of workspaces whose tokens are cached in memory (1024 by default);
+    - token_store_busy_timeout: seconds to wait for a lock held by another process (5 by default).
+    """
+
+    _token_store: Optional[SQLiteTokenStore] = attr.ib(init=False, default=None)
+
+    @property
+    def token_store(self) -> SQLiteTokenStore:
+        if self._token_store is None:
+            self._token_store = SQLiteTokenStore(settings=TokenStoreSettings(
+                path=self.custom_settings['token_store_path'],
+                cache_size=int(self.custom_settings.get('token_store_cache_size', 1024)),
+                busy_timeout=float(self.custom_settings.get('token_store_busy_timeout', 5.0)),
+            ))
+        return self._token_store
+
+    async def on_startup(self, resources: ResourceContainer) -> None:
+        await self.token_store.open()
+
+    async def on_cleanup(self, resources: ResourceContainer) -> None:
+        if self._token_store is not None:
+            await self._token_store.close()
+            self._token_store = None
+
+    async def consume_token_info(self, token_info: TokenResponseInfo, state_info: AuthRedirectInfo) -> None:
+        await self.token_store.save(token_info)
+
+    async def consume_token_info_batch(self, items: list[tuple[TokenResponseInfo, AuthRedirectInfo]]) -> None:
+        await self.token_store.save_many([token_info for token_info, _ in items])
@@ -0,0 +1,211 @@
+"""
+Tracing hooks for the OAuth handling process.
+
+A `Tracer` receives start and end events of spans with timing and attributes:
+- `oauth.redirect` - handling of a redirect request (started by the auth view);
+- `oauth.consumer.<hook>` - each call to the consumer's hooks;
+- `oauth.token_request` - the token request to Notion (including retries);
+- `http.client.*` - the underlying HTTP requests, connections and DNS lookups
+  (via aiohttp's `TraceConfig`).
+
+Spans are linked to their parents and carry the request ID set by the server middleware.
+Consumers can use `get_current_span()` to link their own spans to these.
+"""
+
+import abc
+import collections
+import contextlib
+import contextvars
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, ContextManager, Iterator, Optional
+
+import aiohttp
+import attr
+
+
+_REQUEST_ID_VAR: contextvars.ContextVar[str] = contextvars.ContextVar('notion_oauth_request_id', default='')
+_CURRENT_SPAN_VAR: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar(
+    'notion_oauth_current_span', default=None)
+
+
+def get_request_id() -> str:
+    return _REQUEST_ID_VAR.get()
+
+
+def set_request_id(request_id: str) -> None:
+    _REQUEST_ID_VAR.set(request_id)
+
+
+def get_current_span() -> Optional['Span']:
+    return _CURRENT_SPAN_VAR.get()
+
+
+def _make_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+@attr.s(slots=True)
+class Span:
+    name: str = attr.ib(kw_only=True)
+    span_id: str = attr.ib(kw_only=True, factory=_make_span_id)
+    parent_id: Optional[str] = attr.ib(kw_only=True, default=None)
+    request_id: str = attr.ib(kw_only=True, default='')
+    attributes: dict[str, Any] = attr.ib(kw_only=True, factory=dict)
+    start_time: float = attr.ib(kw_only=True, factory=time.perf_counter)
+    end_time: Optional[float] = attr.ib(kw_only=True, default=None)
+    error: Optional[BaseException] = attr.ib(kw_only=True, default=None)
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+
+class Tracer(abc.ABC):
+    @abc.abstractmethod
+    def on_span_start(self, span: Span) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def on_span_end(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def start_span(self, name: str, attributes: Optional[dict[str, Any]] = None) -> Span:
+        parent = get_current_span()
+        span = Span(
+            name=name,
+            parent_id=parent.span_id if parent is not None else None,
+            request_id=get_request_id(),
+            attributes=attributes or {},
+        )
+        self.on_span_start(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.end_time = time.perf_counter()
+        span.error = error
+        self.on_span_end(span)
+
+    @contextlib.contextmanager
+    def _span_context(self, name: str, attributes: Optional[dict[str, Any]]) -> Iterator[Optional[Span]]:
+        span = self.start_span(name, attributes=attributes)
+        token = _CURRENT_SPAN_VAR.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            self.end_span(span, error=err)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _CURRENT_SPAN_VAR.reset(token)
+
+    def span(self, name: str, **attributes: Any) -> ContextManager[Optional[Span]]:
+        """Context manager that makes the span current for the duration of its block"""
+        return self._span_context(name, attributes)
+
+    def make_trace_config(self) -> Optional[aiohttp.TraceConfig]:
+        """Make `TraceConfig` that reports the HTTP client's activity as spans"""
+
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams,
+        ) -> None:
+            ctx.request_span = self.start_span(
+                'http.client.request', attributes={'method': params.method, 'url': str(params.url)},
+            )
+
+        async def on_request_end(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceRequestEndParams,
+        ) -> None:
+            ctx.request_span.attributes['status'] = params.response.status
+            self.end_span(ctx.request_span)
+
+        async def on_request_exception(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceRequestExceptionParams,
+        ) -> None:
+            # A failed connection attempt (or DNS lookup) has no end event of its own
+            for span_name in ('dns_span', 'connection_span'):
+                span = getattr(ctx, span_name, None)
+                if span is not None:
+                    self.end_span(span, error=params.exception)
+                    setattr(ctx, span_name, None)
+            self.end_span(ctx.request_span, error=params.exception)
+
+        async def on_connection_create_start(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: Any,
+        ) -> None:
+            ctx.connection_span = self.start_span('http.client.connect')
+
+        async def on_connection_create_end(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: Any,
+        ) -> None:
+            self.end_span(ctx.connection_span)
+            ctx.connection_span = None
+
+        async def on_dns_resolvehost_start(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceDnsResolveHostStartParams,
+        ) -> None:
+            ctx.dns_span = self.start_span('http.client.dns', attributes={'host': params.host})
+
+        async def on_dns_resolvehost_end(
+                session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceDnsResolveHostEndParams,
+        ) -> None:
+            self.end_span(ctx.dns_span)
+            ctx.dns_span = None
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        return trace_config
+
+
+class NoopTracer(Tracer):
+    """Default tracer that does nothing and adds no overhead to the HTTP client"""
+
+    def on_span_start(self, span: Span) -> None:
+        pass
+
+    def on_span_end(self, span: Span) -> None:
+        pass
+
+    def span(self, name: str, **attributes: Any) -> ContextManager[Optional[Span]]:
+        return contextlib.nullcontext()
+
+    def make_trace_config(self) -> Optional[aiohttp.TraceConfig]:
+        return None
+
+
+@attr.s
+class InMemoryTracer(Tracer):
+    """Keeps the most recent finished spans in memory. Handy for tests and local debugging"""
+
+    max_spans: int = attr.ib(kw_only=True, default=10000)
+    spans: collections.deque = attr.ib(init=False)
+
+    @spans.default
+    def _make_spans(self) -> collections.deque:
+        return collections.deque(maxlen=self.max_spans)
+
+    def on_span_start(self, span: Span) -> None:
+        pass
+
+    def on_span_end(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def find(self, name: str) -> list[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def get_request_spans(self, request_id: str) -> list[Span]:
+        return [span for span in self.spans if span.request_id == request_id]
+
+    def clear(self) -> None:
+        self.spans.clear()
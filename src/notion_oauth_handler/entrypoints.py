@@ -1,3 +1,5 @@
+import functools
+import sys
 from importlib import metadata
 from typing import Any, Type, cast
 
@@ -10,22 +12,56 @@ CONSUMER_ENTRYPOINT_NAME = f'{package.__name__}.consumer'
 AUTH_VIEW_ENTRYPOINT_NAME = f'{package.__name__}.auth_view'
 
 
-def list_entrypoint_item_names(entrypoint_name: str) -> list[str]:
-    entrypoints = metadata.entry_points()[entrypoint_name]
-    return [ep.name for ep in entrypoints]
+class EntrypointNotFound(LookupError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _get_entrypoint_group(entrypoint_name: str) -> dict[str, metadata.EntryPoint]:
+    """
+    Scanning the metadata of all installed distributions is expensive,
+    so it is done only once per entrypoint group.
+    Nothing is imported here - items are loaded only when they are requested.
+    """
+
+    if sys.version_info >= (3, 10):
+        entrypoints = metadata.entry_points(group=entrypoint_name)
+    else:
+        entrypoints = metadata.entry_points().get(entrypoint_name, ())
+    return {ep.name: ep for ep in entrypoints}
 
 
+@functools.lru_cache(maxsize=None)
 def _get_entrypoint(entrypoint_name: str, item_name: str) -> Any:
-    entrypoints = metadata.entry_points()[entrypoint_name]
-    ep_item = next(
-        iter(ep for ep in entrypoints if ep.name == item_name)
-    ).load()
-    return ep_item
+    entrypoints = _get_entrypoint_group(entrypoint_name)
+    try:
+        ep = entrypoints[item_name]
+    except KeyError:
+        raise EntrypointNotFound(
+            f'Entrypoint {item_name!r} not found in {entrypoint_name!r}. '
+            f'Available: {", ".join(sorted(entrypoints)) or "none"}'
+        ) from None
+    return ep.load()
 
 
-def get_consumer(consumer_name: str, custom_settings: dict) -> NotionOAuthConsumer:
+def clear_entrypoint_cache() -> None:
+    """Forget the discovered entrypoints (e.g. after installing new packages)"""
+    _get_entrypoint_group.cache_clear()
+    _get_entrypoint.cache_clear()
+
+
+def list_entrypoint_item_names(entrypoint_name: str) -> list[str]:
+    return list(_get_entrypoint_group(entrypoint_name))
+
+
+def get_consumer_cls(consumer_name: str) -> Type[NotionOAuthConsumer]:
     consumer_cls = _get_entrypoint(entrypoint_name=CONSUMER_ENTRYPOINT_NAME, item_name=consumer_name)
     assert issubclass(consumer_cls, NotionOAuthConsumer)
+    return consumer_cls
+
+
+def get_consumer(consumer_name: str, custom_settings: dict) -> NotionOAuthConsumer:
+    consumer_cls = get_consumer_cls(consumer_name)
     consumer = consumer_cls(custom_settings=custom_settings)
     return consumer
 
@@ -1,31 +1,241 @@
+"""
+Mock of the Notion OAuth token endpoint.
+
+Mimics Notion's behavior closely enough to stand in for it in local performance tests:
+- validates the client credentials (HTTP Basic auth) and the request body;
+- accepts each authorization code only once, responding with `invalid_grant` on reuse;
+- delays responses according to a configurable latency distribution;
+- injects faults: rate limiting (429 with Retry-After), server errors (5xx),
+  slow response bodies and connection resets.
+"""
+
+import asyncio
+import base64
+import binascii
+import collections
 import logging
+import random
+import socket
+import struct
 import uuid
+from http import HTTPStatus
+from typing import Optional, Type
 
+import attr
 from aiohttp import web
 
 
 _LOGGER = logging.getLogger(__name__)
 
+FIXED_LATENCY = 'fixed'
+UNIFORM_LATENCY = 'uniform'
+EXPONENTIAL_LATENCY = 'exponential'
+LOGNORMAL_LATENCY = 'lognormal'
+LATENCY_DISTRIBUTIONS = (FIXED_LATENCY, UNIFORM_LATENCY, EXPONENTIAL_LATENCY, LOGNORMAL_LATENCY)
+
+RESET_FAULT = 'reset'
+RATE_LIMIT_FAULT = 'rate_limit'
+ERROR_FAULT = 'error'
+SLOW_BODY_FAULT = 'slow_body'
+
+
+@attr.s(frozen=True)
+class MockSettings:
+    # Expected client credentials; not checked if empty
+    client_id: str = attr.ib(kw_only=True, default='')
+    client_secret: str = attr.ib(kw_only=True, default='')
+    one_time_codes: bool = attr.ib(kw_only=True, default=True)
+    max_used_codes: int = attr.ib(kw_only=True, default=100_000)  # Oldest used codes are forgotten beyond this
+    # Latency before each token response:
+    # - fixed: `delay`;
+    # - uniform: `delay` ± `delay_spread`;
+    # - exponential: mean `delay`;
+    # - lognormal: median `delay`, `delay_spread` is the sigma of the underlying normal distribution
+    latency_distribution: str = attr.ib(kw_only=True, default=FIXED_LATENCY)
+    delay: float = attr.ib(kw_only=True, default=0.0)
+    delay_spread: float = attr.ib(kw_only=True, default=0.0)
+    # Fractions of token requests that get each fault
+    error_rate: float = attr.ib(kw_only=True, default=0.0)  # 500/502/503
+    rate_limit_rate: float = attr.ib(kw_only=True, default=0.0)  # 429
+    slow_body_rate: float = attr.ib(kw_only=True, default=0.0)
+    reset_rate: float = attr.ib(kw_only=True, default=0.0)
+    retry_after: int = attr.ib(kw_only=True, default=1)  # Retry-After of 429 responses
+    slow_body_duration: float = attr.ib(kw_only=True, default=5.0)  # Time to send a slow body
+
+    @latency_distribution.validator
+    def _validate_latency_distribution(self, attribute: attr.Attribute, value: str) -> None:
+        if value not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f'Invalid latency distribution: {value!r}')
+
+    def get_delay(self) -> float:
+        if not self.delay:
+            return 0.0
+        if self.latency_distribution == UNIFORM_LATENCY:
+            return max(0.0, random.uniform(self.delay - self.delay_spread, self.delay + self.delay_spread))
+        if self.latency_distribution == EXPONENTIAL_LATENCY:
+            return random.expovariate(1 / self.delay)
+        if self.latency_distribution == LOGNORMAL_LATENCY:
+            return self.delay * random.lognormvariate(0.0, self.delay_spread)
+        return self.delay
+
+    def pick_fault(self) -> Optional[str]:
+        value = random.random()
+        for fault, rate in (
+                (RESET_FAULT, self.reset_rate),
+                (RATE_LIMIT_FAULT, self.rate_limit_rate),
+                (ERROR_FAULT, self.error_rate),
+                (SLOW_BODY_FAULT, self.slow_body_rate),
+        ):
+            if value < rate:
+                return fault
+            value -= rate
+        return None
+
+
+@attr.s
+class UsedCodeRegistry:
+    _max_size: int = attr.ib(kw_only=True)
+    _codes: collections.OrderedDict = attr.ib(init=False, factory=collections.OrderedDict)
+
+    def use(self, code: str) -> bool:
+        """Mark the code as used. Return `False` if it has already been used"""
+        if code in self._codes:
+            return False
+        self._codes[code] = None
+        if len(self._codes) > self._max_size:
+            self._codes.popitem(last=False)
+        return True
+
+
+def _make_error_response(status: int, error: str, description: str) -> web.Response:
+    return web.json_response({'error': error, 'error_description': description}, status=status)
+
 
 class MockTokenView(web.View):
-    async def get(self) -> web.Response:
-        # TODO: Implement me
-        _LOGGER.info('Mock: accepted token request')
-        return web.json_response({
-            'access_token': str(uuid.uuid4()),
+    mock_settings: MockSettings = MockSettings()
+    used_codes: UsedCodeRegistry = UsedCodeRegistry(max_size=MockSettings().max_used_codes)
+
+    def _check_credentials(self) -> bool:
+        settings = self.mock_settings
+        if not settings.client_id and not settings.client_secret:
+            return True
+        auth_type, _, credential_token = self.request.headers.get('Authorization', '').partition(' ')
+        if auth_type.lower() != 'basic':
+            return False
+        try:
+            credentials = base64.b64decode(credential_token, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return False
+        return credentials == f'{settings.client_id}:{settings.client_secret}'
+
+    async def _read_body(self) -> Optional[dict]:
+        if self.request.content_type == 'application/json':
+            try:
+                body = await self.request.json()
+            except ValueError:
+                return None
+            return body if isinstance(body, dict) else None
+        return dict(await self.request.post())
+
+    def _reset_connection(self) -> None:
+        transport = self.request.transport
+        if transport is None:
+            return
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            # Zero linger makes closing the socket send RST instead of FIN
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        transport.abort()
+
+    def _make_token_body(self) -> dict:
+        return {
+            'access_token': f'secret_{uuid.uuid4().hex}',
+            'token_type': 'bearer',
             'workspace_id': str(uuid.uuid4()),
-            'workspace_name': str(uuid.uuid4()),
-            'workspace_icon': f'http://{uuid.uuid4()}.png',
+            'workspace_name': 'Mock Workspace',
+            'workspace_icon': f'https://example.com/{uuid.uuid4()}.png',
             'bot_id': str(uuid.uuid4()),
-            'owner': {},
-        })
+            'owner': {'type': 'workspace', 'workspace': True},
+        }
+
+    async def _make_slow_response(self) -> web.StreamResponse:
+        body = web.json_response(self._make_token_body()).body
+        assert isinstance(body, bytes)
+        response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+        response.content_length = len(body)
+        await response.prepare(self.request)
+        chunk_count = 10
+        chunk_size = -(-len(body) // chunk_count)
+        for offset in range(0, len(body), chunk_size):
+            await asyncio.sleep(self.mock_settings.slow_body_duration / chunk_count)
+            await response.write(body[offset:offset + chunk_size])
+        await response.write_eof()
+        return response
+
+    async def _make_token_response(self) -> web.StreamResponse:
+        settings = self.mock_settings
+        delay = settings.get_delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        fault = settings.pick_fault()
+        if fault == RESET_FAULT:
+            _LOGGER.debug('Mock: resetting connection')
+            self._reset_connection()
+            raise web.HTTPInternalServerError()  # Never sent, the connection is already closed
+        if fault == RATE_LIMIT_FAULT:
+            response = _make_error_response(HTTPStatus.TOO_MANY_REQUESTS, 'rate_limited', 'Rate limited')
+            response.headers['Retry-After'] = str(settings.retry_after)
+            return response
+        if fault == ERROR_FAULT:
+            status = random.choice((
+                HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY, HTTPStatus.SERVICE_UNAVAILABLE,
+            ))
+            return _make_error_response(status, 'internal_server_error', 'Injected server error')
+
+        if not self._check_credentials():
+            return _make_error_response(HTTPStatus.UNAUTHORIZED, 'invalid_client', 'Invalid client credentials')
+        body = await self._read_body()
+        if body is None:
+            return _make_error_response(HTTPStatus.BAD_REQUEST, 'invalid_request', 'Invalid request body')
+        if body.get('grant_type') != 'authorization_code':
+            return _make_error_response(
+                HTTPStatus.BAD_REQUEST, 'unsupported_grant_type', 'Expected grant_type: authorization_code')
+        code = body.get('code')
+        if not code or not isinstance(code, str):
+            return _make_error_response(HTTPStatus.BAD_REQUEST, 'invalid_request', 'Missing code')
+        if settings.one_time_codes and not self.used_codes.use(code):
+            return _make_error_response(HTTPStatus.BAD_REQUEST, 'invalid_grant', 'Authorization code has been used')
+
+        if fault == SLOW_BODY_FAULT:
+            return await self._make_slow_response()
+        return web.json_response(self._make_token_body())
+
+    async def get(self) -> web.Response:
+        return web.json_response(
+            {'error': 'invalid_request', 'error_description': 'Use POST'},
+            status=HTTPStatus.METHOD_NOT_ALLOWED, headers={'Allow': 'POST'},
+        )
+
+    async def post(self) -> web.StreamResponse:
+        _LOGGER.debug('Mock: accepted token request')
+        return await self._make_token_response()
+
+
+def mock_token_view_factory(settings: MockSettings) -> Type[MockTokenView]:
+    class CustomMockTokenView(MockTokenView):
+        mock_settings = settings
+        used_codes = UsedCodeRegistry(max_size=settings.max_used_codes)
+
+    return CustomMockTokenView
 
 
-def make_mock_app() -> web.Application:
+def make_mock_app(settings: MockSettings = MockSettings()) -> web.Application:
     app = web.Application(
         middlewares=[],
     )
+    token_view_cls = mock_token_view_factory(settings)
     app.add_routes([
-        web.get('/v1/oauth/token', MockTokenView),
+        web.view('/v1/oauth/token', token_view_cls),
     ])
     return app
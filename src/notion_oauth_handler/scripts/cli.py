@@ -1,12 +1,22 @@
 import argparse
+import contextlib
 import logging
-from typing import Any
+import time
+from typing import Any, Iterator
 
+import attr
 from aiohttp import web
 
-from notion_oauth_handler.server.app import make_app_from_config, make_app_from_file
-from notion_oauth_handler.server.config import AppConfiguration
-from notion_oauth_handler.mock.app import make_mock_app
+from notion_oauth_handler.server.app import (
+    AppComponents, AppFactory, make_app_from_prepared, prepare_app_components,
+)
+from notion_oauth_handler.server.config import AppConfiguration, load_config_from_file
+from notion_oauth_handler.server.reload import register_config_reloader
+from notion_oauth_handler.server.workers import WorkerSupervisor
+from notion_oauth_handler.mock.app import FIXED_LATENCY, LATENCY_DISTRIBUTIONS, MockSettings, make_mock_app
+import notion_oauth_handler.bench.load as load_bench
+import notion_oauth_handler.bench.memory as memory_bench
+import notion_oauth_handler.bench.overhead as overhead_bench
 from notion_oauth_handler.entrypoints import (
     AUTH_VIEW_ENTRYPOINT_NAME, CONSUMER_ENTRYPOINT_NAME,
     list_entrypoint_item_names,
@@ -53,11 +63,60 @@ def get_parser() -> argparse.ArgumentParser:
         '--privacy-path', default='/auth', help='Path of the privacy policy endpoint')
     serve_cmd_parser.add_argument(
         '--terms-path', default='/auth', help='Path of the terms of use endpoint')
+    serve_cmd_parser.add_argument(
+        '--workers', default=1, type=int,
+        help='Number of worker processes (more than 1 enables the pre-fork mode)',
+    )
+    serve_cmd_parser.add_argument(
+        '--reuse-port', action='store_true',
+        help='In the pre-fork mode bind each worker with SO_REUSEPORT instead of sharing a pre-bound socket',
+    )
+    serve_cmd_parser.add_argument(
+        '--watch-config', default=0, type=float, metavar='INTERVAL',
+        help='In the single-process mode also reload the configuration file when it changes '
+             '(checked every INTERVAL seconds; it is always reloaded on SIGHUP)',
+    )
+    serve_cmd_parser.add_argument(
+        '--startup-report', action='store_true',
+        help='Print how long each startup step takes',
+    )
 
-    subparsers.add_parser(
+    mock_cmd_parser = subparsers.add_parser(
         'mock', help='Run Notion mock server',
         parents=[host_port_arg_parser]
     )
+    mock_cmd_parser.add_argument(
+        '--client-id', default='', help='Expected client ID (credentials are not checked if empty)')
+    mock_cmd_parser.add_argument(
+        '--client-secret', default='', help='Expected client secret')
+    mock_cmd_parser.add_argument(
+        '--allow-code-reuse', action='store_true',
+        help='Accept authorization codes more than once instead of responding with invalid_grant',
+    )
+    mock_cmd_parser.add_argument(
+        '--latency-distribution', default=FIXED_LATENCY, choices=LATENCY_DISTRIBUTIONS,
+        help='Distribution of the token response latency',
+    )
+    mock_cmd_parser.add_argument(
+        '--delay', default=0.0, type=float,
+        help='Token response latency in seconds (mean for exponential, median for lognormal)',
+    )
+    mock_cmd_parser.add_argument(
+        '--delay-spread', default=0.0, type=float,
+        help='Half-width of the uniform distribution or sigma of the lognormal one',
+    )
+    mock_cmd_parser.add_argument(
+        '--error-rate', default=0.0, type=float, help='Fraction of token requests that fail with a 5xx')
+    mock_cmd_parser.add_argument(
+        '--rate-limit-rate', default=0.0, type=float, help='Fraction of token requests that get a 429')
+    mock_cmd_parser.add_argument(
+        '--retry-after', default=1, type=int, help='Retry-After of 429 responses in seconds')
+    mock_cmd_parser.add_argument(
+        '--slow-body-rate', default=0.0, type=float, help='Fraction of token responses with a slow body')
+    mock_cmd_parser.add_argument(
+        '--slow-body-duration', default=5.0, type=float, help='Time to send a slow body in seconds')
+    mock_cmd_parser.add_argument(
+        '--reset-rate', default=0.0, type=float, help='Fraction of token requests whose connection is reset')
 
     consumer_cmd_parser = subparsers.add_parser('consumer', help='Consumer information')
     consumer_cmd_subparsers = consumer_cmd_parser.add_subparsers(
@@ -69,9 +128,78 @@ def get_parser() -> argparse.ArgumentParser:
         title='auth_view_command', dest='auth_view_command')
     auth_view_cmd_subparsers.add_parser('list', help='List available auth views')
 
+    bench_cmd_parser = subparsers.add_parser('bench', help='Benchmarks')
+    bench_cmd_subparsers = bench_cmd_parser.add_subparsers(
+        title='bench_command', dest='bench_command')
+    bench_load_cmd_parser = bench_cmd_subparsers.add_parser(
+        'load', help='Load-test the server against the local Notion mock')
+    bench_load_cmd_parser.add_argument(
+        '--targets', default=','.join(load_bench.TARGETS),
+        help=f'Comma-separated endpoints to load ({", ".join(load_bench.TARGETS)})',
+    )
+    bench_load_cmd_parser.add_argument(
+        '--concurrency', default=32, type=int, help='Maximum number of concurrent requests')
+    bench_load_cmd_parser.add_argument(
+        '--requests', default=2000, type=int, help='Number of requests per target')
+    bench_load_cmd_parser.add_argument(
+        '--duration', default=0.0, type=float,
+        help='Seconds to load each target for (overrides --requests)',
+    )
+    bench_load_cmd_parser.add_argument(
+        '--rate', default=0.0, type=float,
+        help='Fixed request rate per second (open loop); by default requests are sent as fast as possible',
+    )
+    bench_load_cmd_parser.add_argument(
+        '--upstream-delay', default=0.0, type=float, help='Mock token endpoint latency in seconds')
+    bench_load_cmd_parser.add_argument(
+        '--upstream-error-rate', default=0.0, type=float,
+        help='Fraction of mock token requests that fail',
+    )
+    bench_load_cmd_parser.add_argument(
+        '--doc-size', default=32 * 1024, type=int, help='Size of the served document in bytes')
+    bench_load_cmd_parser.add_argument(
+        '--output', default='', help='Write the JSON report to this file')
+    bench_overhead_cmd_parser = bench_cmd_subparsers.add_parser(
+        'overhead', help='Measure the per-redirect overhead of the handler outside the network call')
+    bench_overhead_cmd_parser.add_argument(
+        '--iterations', default=100_000, type=int, help='Number of iterations of each measurement')
+    bench_overhead_cmd_parser.add_argument(
+        '--output', default='', help='Write the JSON report to this file')
+    bench_memory_cmd_parser = bench_cmd_subparsers.add_parser(
+        'memory', help='Compare the memory footprint of the current and the former DTOs')
+    bench_memory_cmd_parser.add_argument(
+        '--count', default=10_000, type=int, help='Number of instances of each DTO')
+    bench_memory_cmd_parser.add_argument(
+        '--output', default='', help='Write the JSON report to this file')
+
     return parser
 
 
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s
+class StartupReport:
+    """Collects durations of startup steps"""
+
+    _durations: dict[str, float] = attr.ib(init=False, factory=dict)
+
+    @contextlib.contextmanager
+    def measure(self, step_name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._durations[step_name] = time.perf_counter() - start
+
+    def format(self) -> str:
+        lines = ['Startup timing:']
+        for step_name, duration in self._durations.items():
+            lines.append(f'    {step_name:<24} {duration * 1000:>10.1f} ms')
+        lines.append(f'    {"total":<24} {sum(self._durations.values()) * 1000:>10.1f} ms')
+        return '\n'.join(lines)
+
+
 class NotionOAuthTool:
     @classmethod
     def consumer_list(cls) -> None:
@@ -94,31 +222,114 @@ class NotionOAuthTool:
             auth_path: str,
             privacy_path: str,
             terms_path: str,
+            workers: int = 1,
+            reuse_port: bool = False,
+            watch_config: float = 0,
+            startup_report: bool = False,
     ) -> None:
-        if config_file:
-            app = make_app_from_file(
-                filename=config_file,
+        report = StartupReport()
+
+        def load_app_components() -> tuple[AppConfiguration, AppComponents]:
+            with report.measure('config'):
+                if config_file:
+                    config = load_config_from_file(config_file)
+                else:
+                    config = AppConfiguration(
+                        consumer_name=consumer_name,
+                        auth_view_name=auth_view_name,
+                        notion_client_id_key=notion_client_id_key,
+                        notion_client_secret_key=notion_client_secret_key,
+                        base_path=base_path,
+                        auth_path=auth_path,
+                    )
+            with report.measure('entrypoint resolution'):
+                components = prepare_app_components(config)
+            return config, components
+
+        def load_app_factory() -> AppFactory:
+            config, components = load_app_components()
+            return lambda: make_app_from_prepared(config, components)
+
+        if workers > 1:
+            def load_worker_app_factory() -> AppFactory:
+                app_factory = load_app_factory()
+                if startup_report:
+                    print(report.format())
+
+                def worker_app_factory() -> web.Application:
+                    start = time.perf_counter()
+                    app = app_factory()
+                    _LOGGER.info(f'App build took {(time.perf_counter() - start) * 1000:.1f} ms')
+                    return app
+
+                return worker_app_factory if startup_report else app_factory
+
+            supervisor = WorkerSupervisor(
+                prepare_app_factory=load_worker_app_factory,
+                host=host, port=port,
+                workers=workers,
+                reuse_port=reuse_port,
             )
+            supervisor.run()
         else:
-            app = make_app_from_config(
-                config=AppConfiguration(
-                    consumer_name=consumer_name,
-                    auth_view_name=auth_view_name,
-                    notion_client_id_key=notion_client_id_key,
-                    notion_client_secret_key=notion_client_secret_key,
-                    base_path=base_path,
-                    auth_path=auth_path,
-                    privacy_path=privacy_path,
-                    terms_path=terms_path,
+            config, components = load_app_components()
+            with report.measure('app build'):
+                app = make_app_from_prepared(config, components)
+            if config_file:
+                register_config_reloader(
+                    app, filename=config_file, config=config, components=components, watch_interval=watch_config,
                 )
-            )
-        web.run_app(app, host=host, port=port)
+            if startup_report:
+                print(report.format())
+            web.run_app(app, host=host, port=port)
 
     @classmethod
-    def mock(cls, host: str, port: int) -> None:
-        app = make_mock_app()
+    def mock(cls, host: str, port: int, settings: MockSettings) -> None:
+        app = make_mock_app(settings)
         web.run_app(app, host=host, port=port)
 
+    @classmethod
+    def bench_load(
+            cls,
+            targets: str,
+            concurrency: int,
+            requests: int,
+            duration: float,
+            rate: float,
+            upstream_delay: float,
+            upstream_error_rate: float,
+            doc_size: int,
+            output: str,
+    ) -> None:
+        settings = load_bench.LoadSettings(
+            targets=tuple(target.strip() for target in targets.split(',') if target.strip()),
+            concurrency=concurrency,
+            requests=requests,
+            duration=duration,
+            rate=rate,
+            upstream_delay=upstream_delay,
+            upstream_error_rate=upstream_error_rate,
+            document_size=doc_size,
+        )
+        unknown_targets = set(settings.targets) - set(load_bench.TARGETS)
+        if unknown_targets:
+            raise SystemExit(f'Unknown targets: {", ".join(sorted(unknown_targets))}')
+        # Per-request logging would dominate the measurements
+        logging.getLogger('notion_oauth_handler').setLevel(logging.WARNING)
+        report = load_bench.run_load_benchmark(settings, output_file=output or None)
+        print(load_bench.format_report(report))
+
+    @classmethod
+    def bench_overhead(cls, iterations: int, output: str) -> None:
+        logging.getLogger('notion_oauth_handler').setLevel(logging.WARNING)
+        report = overhead_bench.run_overhead_benchmark(iterations=iterations, output_file=output or None)
+        print(overhead_bench.format_report(report))
+
+    @classmethod
+    def bench_memory(cls, count: int, output: str) -> None:
+        report = memory_bench.run_memory_benchmark(count=count, output_file=output or None)
+        print(memory_bench.format_report(report))
+
     @classmethod
     def _print_http_response(cls, response: web.Response) -> None:
         print(f'Status: {response.status}')
@@ -143,15 +354,49 @@ class NotionOAuthTool:
                 auth_path=args.auth_path,
                 privacy_path=args.privacy_path,
                 terms_path=args.terms_path,
+                workers=args.workers,
+                reuse_port=args.reuse_port,
+                watch_config=args.watch_config,
+                startup_report=args.startup_report,
             )
         elif args.command == 'mock':
-            cls.mock(host=args.host, port=args.port)
+            cls.mock(host=args.host, port=args.port, settings=MockSettings(
+                client_id=args.client_id,
+                client_secret=args.client_secret,
+                one_time_codes=not args.allow_code_reuse,
+                latency_distribution=args.latency_distribution,
+                delay=args.delay,
+                delay_spread=args.delay_spread,
+                error_rate=args.error_rate,
+                rate_limit_rate=args.rate_limit_rate,
+                retry_after=args.retry_after,
+                slow_body_rate=args.slow_body_rate,
+                slow_body_duration=args.slow_body_duration,
+                reset_rate=args.reset_rate,
+            ))
         elif args.command == 'consumer':
             if args.consumer_command == 'list':
                 cls.consumer_list()
         elif args.command == 'auth_view':
             if args.auth_view_command == 'list':
                 cls.auth_view_list()
+        elif args.command == 'bench':
+            if args.bench_command == 'load':
+                cls.bench_load(
+                    targets=args.targets,
+                    concurrency=args.concurrency,
+                    requests=args.requests,
+                    duration=args.duration,
+                    rate=args.rate,
+                    upstream_delay=args.upstream_delay,
+                    upstream_error_rate=args.upstream_error_rate,
+                    doc_size=args.doc_size,
+                    output=args.output,
+                )
+            elif args.bench_command == 'overhead':
+                cls.bench_overhead(iterations=args.iterations, output=args.output)
+            elif args.bench_command == 'memory':
+                cls.bench_memory(count=args.count, output=args.output)
 
 
 def configure_logging() -> None:
@@ -1,14 +1,64 @@
 import os
-from typing import Optional, Type
+from typing import Callable, Optional, Sequence, Type
 
+import attr
 from aiohttp import web
 
+from notion_oauth_handler.core.batching import BatchSettings
+from notion_oauth_handler.core.circuit_breaker import CircuitBreakerSettings
 from notion_oauth_handler.core.consumer import NotionOAuthConsumer
+from notion_oauth_handler.core.dedup import DedupSettings, SingleFlight
+from notion_oauth_handler.core.executor import ExecutorSettings
+from notion_oauth_handler.core.limiter import ConcurrencyLimiter, ConcurrencySettings
+from notion_oauth_handler.core.metrics import MetricsRegistry, OAuthMetrics
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.core.resources import ResourceContainer
+from notion_oauth_handler.core.retry import RetryPolicy, RetrySettings
+from notion_oauth_handler.core.session import ClientSessionSettings
+from notion_oauth_handler.core.spool import SpoolSettings
+from notion_oauth_handler.core.timeouts import TimeoutSettings
+from notion_oauth_handler.core.tracing import NoopTracer, Tracer
 from notion_oauth_handler.server.auth_view import NotionOAuthRedirectView
-from notion_oauth_handler.server.document_view import document_view_factory
-from notion_oauth_handler.server.middleware import notion_oauth_middleware_factory
-from notion_oauth_handler.server.config import AppConfiguration, DocumentConfig, load_config_from_file
-from notion_oauth_handler.entrypoints import get_consumer, get_auth_view_cls
+from notion_oauth_handler.server.document_store import DocumentStore
+from notion_oauth_handler.server.document_view import DocumentMetrics, document_view_factory
+from notion_oauth_handler.server.metrics_view import metrics_view_factory
+from notion_oauth_handler.server.rate_limit import (
+    RateLimitMetrics, RateLimitSettings, TokenBucketLimiter, rate_limit_middleware_factory,
+)
+from notion_oauth_handler.server.middleware import (
+    RESOURCES_APP_KEY, IntegrationContext, notion_oauth_middleware_factory,
+)
+from notion_oauth_handler.server.config import (
+    AppConfiguration, DocumentConfig, IntegrationConfig, load_config_from_file,
+)
+from notion_oauth_handler.entrypoints import get_consumer_cls, get_auth_view_cls
+
+
+AppFactory = Callable[[], web.Application]
+
+APP_PARTS_APP_KEY = '__notion_oauth_app_parts__'
+MAIN_INTEGRATION_NAME = ''
+
+
+@attr.s(frozen=True)
+class Integration:
+    """An additional Notion integration served by the app on its own auth path"""
+
+    name: str = attr.ib(kw_only=True)  # Used in metric labels and spool file names
+    consumer: NotionOAuthConsumer = attr.ib(kw_only=True)
+    auth_view_cls: Type[NotionOAuthRedirectView] = attr.ib(kw_only=True)
+    notion_client_id: str = attr.ib(kw_only=True)
+    notion_client_secret: str = attr.ib(kw_only=True)
+    auth_path: str = attr.ib(kw_only=True)
+    custom_settings: dict = attr.ib(kw_only=True)
+
+
+@attr.s(frozen=True)
+class AppParts:
+    """Parts of a built app that can be updated in place (see `server.reload`), stored in the app"""
+
+    integrations: dict[str, IntegrationContext] = attr.ib(kw_only=True)  # The main one is `MAIN_INTEGRATION_NAME`
+    document_stores: dict[str, DocumentStore] = attr.ib(kw_only=True)  # Keyed by the configured paths
 
 
 def make_app(
@@ -17,64 +67,269 @@ def make_app(
         auth_view_cls: Type[NotionOAuthRedirectView],
         notion_client_id: str,
         notion_client_secret: str,
+        notion_base_url: str = '',
         base_path: str = '',
         auth_path: str = '/auth',
         documents: Optional[dict[str, DocumentConfig]] = None,
         custom_settings: dict,
+        notion_session_settings: Optional[ClientSessionSettings] = None,
+        concurrency_settings: Optional[ConcurrencySettings] = None,
+        retry_settings: Optional[RetrySettings] = None,
+        circuit_breaker_settings: Optional[CircuitBreakerSettings] = None,
+        timeout_settings: Optional[TimeoutSettings] = None,
+        dedup_settings: Optional[DedupSettings] = None,
+        batch_settings: Optional[BatchSettings] = None,
+        spool_settings: Optional[SpoolSettings] = None,
+        executor_settings: Optional[ExecutorSettings] = None,
+        rate_limit_settings: Optional[RateLimitSettings] = None,
+        metrics_path: str = '',
+        metrics_registry: Optional[MetricsRegistry] = None,
+        tracer: Optional[Tracer] = None,
+        integrations: Sequence[Integration] = (),
+        resources: Optional[ResourceContainer] = None,
 ) -> web.Application:
     """
     Create Notion OAuth handling server (aiohttp Application)
+
+    The consumers' `on_startup`/`on_cleanup` hooks are called with `resources`
+    (a new container by default), which is closed on app cleanup.
+
+    Metrics are always collected in `metrics_registry`,
+    but are served only if `metrics_path` is not empty.
+
+    Each of `integrations` gets its own `NotionOAuthHandler` (with the same settings as the main one)
+    and its metrics are labeled with `integration="<name>"`.
     """
 
     base_path = base_path.rstrip('/')
-    auth_path = auth_path.lstrip('/')
-    app = web.Application(
-        middlewares=[
-            notion_oauth_middleware_factory(
-                consumer=consumer,
-                notion_client_id=notion_client_id,
-                notion_client_secret=notion_client_secret,
-                custom_settings=custom_settings,
-            )
-        ],
+    if metrics_registry is None:
+        metrics_registry = MetricsRegistry()
+    if spool_settings is None:
+        spool_settings = SpoolSettings()
+    if resources is None:
+        resources = ResourceContainer()
+    if rate_limit_settings is None:
+        rate_limit_settings = RateLimitSettings()
+
+    def make_oauth_handler(
+            consumer: NotionOAuthConsumer,
+            client_id: str,
+            client_secret: str,
+            metrics_registry: MetricsRegistry,
+            spool_settings: SpoolSettings,
+    ) -> NotionOAuthHandler:
+        return NotionOAuthHandler(
+            consumer=consumer,
+            client_id=client_id,
+            client_secret=client_secret,
+            base_url=notion_base_url,
+            session_settings=notion_session_settings or ClientSessionSettings(),
+            limiter=ConcurrencyLimiter(settings=concurrency_settings or ConcurrencySettings()),
+            retry_policy=RetryPolicy(settings=retry_settings or RetrySettings()),
+            circuit_breaker_settings=circuit_breaker_settings or CircuitBreakerSettings(),
+            timeouts=timeout_settings or TimeoutSettings(),
+            single_flight=SingleFlight(settings=dedup_settings or DedupSettings()),
+            metrics=OAuthMetrics(registry=metrics_registry),
+            tracer=tracer or NoopTracer(),
+            batch_settings=batch_settings or BatchSettings(),
+            spool_settings=spool_settings,
+            executor_settings=executor_settings or ExecutorSettings(),
+        )
+
+    oauth_handler = make_oauth_handler(
+        consumer, notion_client_id, notion_client_secret, metrics_registry, spool_settings,
     )
-    app.add_routes([
-        web.get(f'{base_path}/{auth_path}', auth_view_cls),
-    ])
-    for doc_serve_path, doc_config in documents.items():
-        doc_serve_path = doc_serve_path.lstrip('/')
+    default_context = IntegrationContext(oauth_handler=oauth_handler, custom_settings=custom_settings)
+    app_parts = AppParts(integrations={MAIN_INTEGRATION_NAME: default_context}, document_stores={})
+    # Filled below: the middlewares route requests with dict lookups by the matched resource
+    integration_routes: dict[web.AbstractResource, IntegrationContext] = {}
+    route_limiters: dict[web.AbstractResource, TokenBucketLimiter] = {}
+    middlewares = [
+        notion_oauth_middleware_factory(
+            default_context=default_context,
+            integration_routes=integration_routes,
+        ),
+    ]
+    if rate_limit_settings.enabled:
+        middlewares.append(rate_limit_middleware_factory(
+            settings=rate_limit_settings,
+            route_limiters=route_limiters,
+            metrics=RateLimitMetrics(registry=metrics_registry),
+        ))
+
+    def limit_route(route: web.AbstractRoute, rate: float, burst: int) -> None:
+        assert route.resource is not None
+        route_limiters[route.resource] = TokenBucketLimiter(
+            rate=rate,
+            burst=burst,
+            max_clients=rate_limit_settings.max_clients,
+            idle_timeout=rate_limit_settings.idle_timeout,
+        )
+
+    app = web.Application(middlewares=middlewares)
+    app[APP_PARTS_APP_KEY] = app_parts
+    app[RESOURCES_APP_KEY] = resources
+    _register_oauth_handler_lifecycle(app, oauth_handler=oauth_handler, resources=resources)
+    route = app.router.add_get(f'{base_path}/{auth_path.lstrip("/")}', auth_view_cls)
+    limit_route(route, rate_limit_settings.auth_rate, rate_limit_settings.auth_burst)
+
+    for integration in integrations:
+        integration_spool_settings = spool_settings
+        if spool_settings.enabled:
+            integration_spool_settings = attr.evolve(spool_settings, path=f'{spool_settings.path}-{integration.name}')
+        integration_handler = make_oauth_handler(
+            integration.consumer,
+            integration.notion_client_id,
+            integration.notion_client_secret,
+            metrics_registry.labeled(integration=integration.name),
+            integration_spool_settings,
+        )
+        _register_oauth_handler_lifecycle(app, oauth_handler=integration_handler, resources=resources)
+        route = app.router.add_get(
+            f'{base_path}/{integration.auth_path.lstrip("/")}', integration.auth_view_cls,
+        )
+        assert route.resource is not None
+        integration_routes[route.resource] = app_parts.integrations[integration.name] = IntegrationContext(
+            oauth_handler=integration_handler, custom_settings=integration.custom_settings,
+        )
+        limit_route(route, rate_limit_settings.auth_rate, rate_limit_settings.auth_burst)
+
+    document_metrics = DocumentMetrics(registry=metrics_registry)
+    for doc_config_path, doc_config in (documents or {}).items():
+        full_doc_serve_path = f'{base_path}/{doc_config_path.lstrip("/")}'
+        doc_view_cls = document_view_factory(doc_config, serve_path=full_doc_serve_path, metrics=document_metrics)
+        app_parts.document_stores[doc_config_path] = doc_view_cls.doc_store
+        route = app.router.add_get(full_doc_serve_path, doc_view_cls)
+        limit_route(route, rate_limit_settings.document_rate, rate_limit_settings.document_burst)
+    if metrics_path:
+        metrics_path = metrics_path.lstrip('/')
         app.add_routes([
-            web.get(f'{base_path}/{doc_serve_path}', document_view_factory(doc_config))
+            web.get(f'{base_path}/{metrics_path}', metrics_view_factory(metrics_registry)),
         ])
 
+    async def close_resources(_app: web.Application) -> None:
+        await resources.close()
+
+    # After all handlers and consumers have been cleaned up
+    app.on_cleanup.append(close_resources)
     return app
 
 
-def make_app_from_config(config: AppConfiguration) -> web.Application:
-    if config.notion_client_id:
-        notion_client_id = config.notion_client_id
-    else:
-        notion_client_id = os.environ[config.notion_client_id_key]
+def _register_oauth_handler_lifecycle(
+        app: web.Application, oauth_handler: NotionOAuthHandler, resources: ResourceContainer,
+) -> None:
+    """
+    Start the consumer and then open the handler's pooled client session on startup;
+    on cleanup close the handler (consuming all pending token info) and then the consumer
+    """
 
-    if config.notion_client_secret:
-        notion_client_secret = config.notion_client_secret
-    else:
-        notion_client_secret = os.environ[config.notion_client_secret_key]
+    async def start_oauth_handler(_app: web.Application) -> None:
+        await oauth_handler.consumer.on_startup(resources)
+        await oauth_handler.startup()
 
-    consumer = get_consumer(config.consumer_name, custom_settings=config.custom_settings)
+    async def cleanup_oauth_handler(_app: web.Application) -> None:
+        try:
+            await oauth_handler.cleanup()
+        finally:
+            await oauth_handler.consumer.on_cleanup(resources)
 
-    return make_app(
-        consumer=consumer,
+    app.on_startup.append(start_oauth_handler)
+    app.on_cleanup.append(cleanup_oauth_handler)
+
+
+@attr.s(frozen=True)
+class AppComponents:
+    """Everything that the app needs besides its configuration"""
+
+    notion_client_id: str = attr.ib(kw_only=True)
+    notion_client_secret: str = attr.ib(kw_only=True)
+    consumer_cls: Type[NotionOAuthConsumer] = attr.ib(kw_only=True)
+    auth_view_cls: Type[NotionOAuthRedirectView] = attr.ib(kw_only=True)
+    integrations: dict[str, 'AppComponents'] = attr.ib(kw_only=True, factory=dict)
+
+
+def _resolve_setting(value: str, env_key: str) -> str:
+    return value if value else os.environ[env_key]
+
+
+def _prepare_integration_components(config: IntegrationConfig) -> AppComponents:
+    return AppComponents(
+        notion_client_id=_resolve_setting(config.notion_client_id, config.notion_client_id_key),
+        notion_client_secret=_resolve_setting(config.notion_client_secret, config.notion_client_secret_key),
+        consumer_cls=get_consumer_cls(config.consumer_name),
         auth_view_cls=get_auth_view_cls(config.auth_view_name),
-        notion_client_id=notion_client_id,
-        notion_client_secret=notion_client_secret,
+    )
+
+
+def prepare_app_components(config: AppConfiguration) -> AppComponents:
+    """Resolve credentials and entrypoints (only the selected ones are imported)"""
+
+    return AppComponents(
+        notion_client_id=_resolve_setting(config.notion_client_id, config.notion_client_id_key),
+        notion_client_secret=_resolve_setting(config.notion_client_secret, config.notion_client_secret_key),
+        consumer_cls=get_consumer_cls(config.consumer_name),
+        auth_view_cls=get_auth_view_cls(config.auth_view_name),
+        integrations={
+            name: _prepare_integration_components(integration_config)
+            for name, integration_config in config.integrations.items()
+        },
+    )
+
+
+def make_app_from_prepared(config: AppConfiguration, components: AppComponents) -> web.Application:
+    integrations = [
+        Integration(
+            name=name,
+            consumer=components.integrations[name].consumer_cls(custom_settings=integration_config.custom_settings),
+            auth_view_cls=components.integrations[name].auth_view_cls,
+            notion_client_id=components.integrations[name].notion_client_id,
+            notion_client_secret=components.integrations[name].notion_client_secret,
+            auth_path=integration_config.auth_path,
+            custom_settings=integration_config.custom_settings,
+        )
+        for name, integration_config in config.integrations.items()
+    ]
+    return make_app(
+        consumer=components.consumer_cls(custom_settings=config.custom_settings),
+        auth_view_cls=components.auth_view_cls,
+        notion_client_id=components.notion_client_id,
+        notion_client_secret=components.notion_client_secret,
+        notion_base_url=config.notion_base_url,
         base_path=config.base_path,
         auth_path=config.auth_path,
         documents=config.documents,
         custom_settings=config.custom_settings,
+        notion_session_settings=config.notion_session_settings,
+        concurrency_settings=config.concurrency_settings,
+        retry_settings=config.retry_settings,
+        circuit_breaker_settings=config.circuit_breaker_settings,
+        timeout_settings=config.timeout_settings,
+        dedup_settings=config.dedup_settings,
+        batch_settings=config.batch_settings,
+        spool_settings=config.spool_settings,
+        executor_settings=config.executor_settings,
+        rate_limit_settings=config.rate_limit_settings,
+        metrics_path=config.metrics_path,
+        integrations=integrations,
     )
 
 
+def prepare_app_factory(config: AppConfiguration) -> AppFactory:
+    """
+    Resolve credentials and entrypoints right away,
+    but postpone creation of the app itself until the returned factory is called.
+    This allows doing the expensive part once in a parent process
+    and building the app in each of the forked worker processes.
+    """
+
+    components = prepare_app_components(config)
+    return lambda: make_app_from_prepared(config, components)
+
+
+def make_app_from_config(config: AppConfiguration) -> web.Application:
+    return prepare_app_factory(config)()
+
+
 def make_app_from_file(filename: Optional[str] = None) -> web.Application:
     if not filename:
         filename = os.environ.get('NOTION_OAUTH_HANDLER_CONFIG', 'notion-oauth-handler.ini')
@@ -9,8 +9,9 @@ from aiohttp.typedefs import LooseHeaders
 import notion_oauth_handler.core.exc as exc
 from notion_oauth_handler.core.dto import AuthRedirectInfo, TokenResponseInfo
 from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.core.resources import ResourceContainer
 from notion_oauth_handler.server.middleware import (
-    OAUTH_HANDLER_REQUEST_KEY, CUSTOM_SETTINGS_REQUEST_KEY,
+    OAUTH_HANDLER_REQUEST_KEY, CUSTOM_SETTINGS_REQUEST_KEY, REQUEST_ID_REQUEST_KEY, RESOURCES_APP_KEY,
 )
 
 
@@ -41,16 +42,46 @@ class NotionOAuthRedirectView(View, abc.ABC):
                 await handler.handle_error(error_text=error_text)
             except exc.NotionAccessDenied:
                 return await self.make_access_denied_response(error_text=error_text)
+            except exc.OperationTimeout as err:
+                _LOGGER.warning(f'Timed out handling redirect error: {err}')
+                return await self.make_timeout_response(err=err)
+
+        code = self.request.query.get('code', '')
+        state = self.request.query.get('state', '')
+        # `state` is optional in Notion OAuth (consumers that need it check it themselves)
+        missing_params = [] if code else ['code']
+        if missing_params:
+            # Junk requests are rejected before any consumer or upstream work
+            _LOGGER.warning(f'Rejected redirect request without {", ".join(missing_params)}')
+            return await self.make_invalid_request_response(missing_params=missing_params)
 
         redirect_info = AuthRedirectInfo(
             redirect_uri=str(self.request.url).split('?')[0],  # https://github.com/aio-libs/yarl/issues/723
-            state=self.request.query.get('state', ''),
-            code=self.request.query.get('code', ''),
+            state=state,
+            code=code,
         )
         try:
             token_info = await handler.handle_auth(redirect_info=redirect_info)
+        except exc.InvalidState as err:
+            _LOGGER.warning(f'Rejected redirect request: {err}')
+            return await self.make_invalid_state_response(err=err)
         except exc.TokenRequestFailed as err:
             return await self.make_bad_request_response(err=err)
+        except exc.InvalidTokenResponse as err:
+            _LOGGER.error(f'Invalid token response: {err}')
+            return await self.make_invalid_token_response(err=err)
+        except exc.OperationTimeout as err:
+            _LOGGER.warning(f'Timed out handling redirect: {err}')
+            return await self.make_timeout_response(err=err)
+        except exc.CircuitOpen as err:
+            _LOGGER.warning(f'Rejected redirect request: {err}')
+            return await self.make_circuit_open_response(err=err)
+        except exc.NotionUnavailable as err:
+            _LOGGER.warning(f'Notion is unavailable after {err.attempts} attempt(s): {err}')
+            return await self.make_unavailable_response(err=err)
+        except exc.HandlerOverloaded as err:
+            _LOGGER.warning(f'Rejected redirect request: {err}')
+            return await self.make_overloaded_response(err=err)
 
         return await self.make_auth_response(token_info=token_info)
 
@@ -60,6 +91,17 @@ class NotionOAuthRedirectView(View, abc.ABC):
         assert isinstance(settings, dict)
         return settings
 
+    @property
+    def resources(self) -> ResourceContainer:
+        """App-scoped resources added by the consumers"""
+        resources = self.request.config_dict[RESOURCES_APP_KEY]
+        assert isinstance(resources, ResourceContainer)
+        return resources
+
+    @property
+    def request_id(self) -> str:
+        return self.request.get(REQUEST_ID_REQUEST_KEY, '')
+
     @property
     def oauth_handler(self) -> NotionOAuthHandler:
         handler = self.request[OAUTH_HANDLER_REQUEST_KEY]
@@ -67,7 +109,52 @@ class NotionOAuthRedirectView(View, abc.ABC):
         return handler
 
     async def get(self) -> Response:
-        return await self.handle_notion_auth()
+        with self.oauth_handler.tracer.span('oauth.redirect', path=self.request.path):
+            return await self.handle_notion_auth()
+
+    async def make_timeout_response(self, err: exc.OperationTimeout) -> Response:
+        return self.make_response(
+            status=HTTPStatus.GATEWAY_TIMEOUT,
+            text='Request timed out, please try again later',
+        )
+
+    async def make_overloaded_response(self, err: exc.HandlerOverloaded) -> Response:
+        return self.make_response(
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+            text='Service is overloaded, please try again later',
+            headers={'Retry-After': str(err.retry_after)},
+        )
+
+    async def make_invalid_request_response(self, missing_params: list[str]) -> Response:
+        return self.make_response(
+            status=HTTPStatus.BAD_REQUEST,
+            text=f'Missing parameters: {", ".join(missing_params)}',
+        )
+
+    async def make_invalid_state_response(self, err: exc.InvalidState) -> Response:
+        return self.make_response(
+            status=HTTPStatus.BAD_REQUEST,
+            text='Invalid or expired authorization request, please start over',
+        )
+
+    async def make_invalid_token_response(self, err: exc.InvalidTokenResponse) -> Response:
+        return self.make_response(
+            status=HTTPStatus.BAD_GATEWAY,
+            text='Notion returned an unexpected response, please try again later',
+        )
+
+    async def make_unavailable_response(self, err: exc.NotionUnavailable) -> Response:
+        return self.make_response(
+            status=HTTPStatus.BAD_GATEWAY,
+            text='Notion is unavailable, please try again later',
+        )
+
+    async def make_circuit_open_response(self, err: exc.CircuitOpen) -> Response:
+        return self.make_response(
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+            text='Notion is temporarily unavailable, please try again shortly',
+            headers={'Retry-After': str(err.retry_after)},
+        )
 
     @abc.abstractmethod
     async def make_bad_request_response(self, err: exc.TokenRequestFailed) -> Response:
@@ -9,32 +9,137 @@ base_path =
 auth_path = /auth
 privacy_path = /privacy
 terms_path = /terms
+metrics_path =
 
 [notion_oauth_handler.notion]
 client_id = ...
 # or notion_client_id_key = ...
 client_secret = ...
 # or notion_client_secret_key = ...
+base_url = https://api.notion.com
+pool_limit = 100
+pool_limit_per_host = 0
+keepalive_timeout = 30
+dns_cache_ttl = 300
+retry_max_attempts = 3
+retry_base_delay = 0.2
+retry_max_delay = 3
+retry_deadline = 10
+
+[notion_oauth_handler.timeouts]
+connect = 5
+read = 10
+total = 15
+consumer = 10
+
+[notion_oauth_handler.dedup]
+ttl = 60
+max_size = 1024
+
+[notion_oauth_handler.concurrency]
+max_in_flight = 0
+max_queue = 100
+queue_timeout = 5
+retry_after = 1
+
+[notion_oauth_handler.circuit_breaker]
+enabled = false
+window = 30
+min_calls = 20
+failure_rate = 0.5
+slow_call_duration = 5
+slow_call_rate = 0.8
+open_duration = 15
+half_open_max_calls = 3
+
+[notion_oauth_handler.executor]
+thread_workers = 8
+process_workers = 0
+
+[notion_oauth_handler.rate_limit]
+enabled = false
+auth_rate = 1
+auth_burst = 10
+document_rate = 5
+document_burst = 20
+max_clients = 10000
+idle_timeout = 60
+trusted_proxies = 127.0.0.1, 10.0.0.0/8
+
+[notion_oauth_handler.batch]
+enabled = false
+max_batch_size = 100
+flush_interval = 0.05
+max_queue = 10000
+drain_timeout = 30
+
+[notion_oauth_handler.spool]
+path =
+fsync_interval = 0.005
+replay_interval = 1
+replay_base_delay = 1
+replay_max_delay = 300
+compact_threshold = 1000
 
 [notion_oauth_handler.documents]
-/privacy = text/html; docs/privacy_policy.html
+/privacy = text/html; docs/privacy_policy.html; max_age=3600; reload_interval=5
 /terms = text/html; docs/terms_of_use.html
 
+# Additional integrations served by the same app (any number of sections).
+# They share the Notion connection, retry, timeout, concurrency, circuit breaker, dedup, batch and spool settings
+# (each integration gets its own pool, limiter, circuit breaker and spool file), but have their own credentials and consumer
+[notion_oauth_handler.integration.other]
+consumer = dummy
+auth_view = default
+auth_path = /other/auth
+client_id = ...
+# or client_id_key = ...
+client_secret = ...
+# or client_secret_key = ...
+custom_section = my_other_application
+
 [my_application]
 # Your custom application settings go here
 """
 
 import configparser
+from typing import Optional
 
 import attr
 
 import notion_oauth_handler as package
+from notion_oauth_handler.core.batching import BatchSettings
+from notion_oauth_handler.core.circuit_breaker import CircuitBreakerSettings
+from notion_oauth_handler.core.dedup import DedupSettings
+from notion_oauth_handler.core.executor import ExecutorSettings
+from notion_oauth_handler.core.limiter import ConcurrencySettings
+from notion_oauth_handler.core.retry import RetrySettings
+from notion_oauth_handler.core.session import ClientSessionSettings
+from notion_oauth_handler.core.spool import SpoolSettings
+from notion_oauth_handler.core.timeouts import TimeoutSettings
+from notion_oauth_handler.server.rate_limit import RateLimitSettings, parse_networks
 
 
 @attr.s(frozen=True)
 class DocumentConfig:
     filename: str = attr.ib(kw_only=True)
     content_type: str = attr.ib(kw_only=True)
+    max_age: Optional[int] = attr.ib(kw_only=True, default=None)
+    reload_interval: float = attr.ib(kw_only=True, default=0)  # 0 means never reload
+
+
+@attr.s(frozen=True)
+class IntegrationConfig:
+    """An additional Notion integration served by the app"""
+
+    consumer_name: str = attr.ib(kw_only=True)
+    auth_view_name: str = attr.ib(kw_only=True)
+    auth_path: str = attr.ib(kw_only=True)
+    notion_client_id: str = attr.ib(kw_only=True, default='')
+    notion_client_id_key: str = attr.ib(kw_only=True, default='')
+    notion_client_secret: str = attr.ib(kw_only=True, default='')
+    notion_client_secret_key: str = attr.ib(kw_only=True, default='')
+    custom_settings: dict = attr.ib(kw_only=True, factory=dict)
 
 
 @attr.s(frozen=True)
@@ -45,10 +150,42 @@ class AppConfiguration:
     notion_client_id_key: str = attr.ib(kw_only=True, default='')
     notion_client_secret: str = attr.ib(kw_only=True, default='')
     notion_client_secret_key: str = attr.ib(kw_only=True, default='')
+    notion_base_url: str = attr.ib(kw_only=True, default='')  # Empty means the real Notion API
     base_path: str = attr.ib(kw_only=True, default='')
     auth_path: str = attr.ib(kw_only=True, default='/auth')
-    documents: dict[str, DocumentConfig] = attr.ib(kw_only=True, default='text/plain')
+    metrics_path: str = attr.ib(kw_only=True, default='')
+    documents: dict[str, DocumentConfig] = attr.ib(kw_only=True, factory=dict)
     custom_settings: dict = attr.ib(kw_only=True, factory=dict)
+    notion_session_settings: ClientSessionSettings = attr.ib(kw_only=True, factory=ClientSessionSettings)
+    concurrency_settings: ConcurrencySettings = attr.ib(kw_only=True, factory=ConcurrencySettings)
+    retry_settings: RetrySettings = attr.ib(kw_only=True, factory=RetrySettings)
+    circuit_breaker_settings: CircuitBreakerSettings = attr.ib(kw_only=True, factory=CircuitBreakerSettings)
+    timeout_settings: TimeoutSettings = attr.ib(kw_only=True, factory=TimeoutSettings)
+    dedup_settings: DedupSettings = attr.ib(kw_only=True, factory=DedupSettings)
+    batch_settings: BatchSettings = attr.ib(kw_only=True, factory=BatchSettings)
+    spool_settings: SpoolSettings = attr.ib(kw_only=True, factory=SpoolSettings)
+    executor_settings: ExecutorSettings = attr.ib(kw_only=True, factory=ExecutorSettings)
+    rate_limit_settings: RateLimitSettings = attr.ib(kw_only=True, factory=RateLimitSettings)
+    integrations: dict[str, IntegrationConfig] = attr.ib(kw_only=True, factory=dict)
+
+
+def _parse_document_spec(file_spec: str) -> DocumentConfig:
+    """
+    Parse document spec in the following format:
+    content-type; file/system/path[; max_age=<seconds>][; reload_interval=<seconds>]
+    """
+
+    content_type, filename, *option_items = [part.strip() for part in file_spec.split(';')]
+    options = dict(
+        (item.split('=', 1)[0].strip(), item.split('=', 1)[1].strip())
+        for item in option_items if item
+    )
+    return DocumentConfig(
+        content_type=content_type,
+        filename=filename,
+        max_age=int(options['max_age']) if 'max_age' in options else None,
+        reload_interval=float(options.get('reload_interval', 0)),
+    )
 
 
 def load_config_from_file(filename: str) -> AppConfiguration:
@@ -56,26 +193,153 @@ def load_config_from_file(filename: str) -> AppConfiguration:
     config.read(filename)
     package_name = package.__name__
 
-    custom_settings: dict[str, str] = {}
+    def get_custom_settings(section: configparser.SectionProxy) -> dict[str, str]:
+        if section.get('custom_section'):
+            return dict(config[section['custom_section']])
+        return {}
+
     main_section = config[package_name]
-    if main_section.get('custom_section'):
-        custom_section_name = main_section['custom_section']
-        custom_settings = dict(config[custom_section_name])
+    custom_settings = get_custom_settings(main_section)
 
     documents: dict[str, DocumentConfig] = {}
     if config.has_section(f'{package_name}.documents'):
         documents_section = config[f'{package_name}.documents']
         documents = {
-            server_path: DocumentConfig(
-                content_type=file_spec.split(';')[0].strip(),
-                filename=file_spec.split(';')[1].strip(),
-            )
+            server_path: _parse_document_spec(file_spec)
             for server_path, file_spec in documents_section.items()
         }
 
     notion_section = config[f'{package_name}.notion']
     server_section = config[f'{package_name}.server']
 
+    default_session_settings = ClientSessionSettings()
+    notion_session_settings = ClientSessionSettings(
+        pool_limit=notion_section.getint('pool_limit', default_session_settings.pool_limit),
+        pool_limit_per_host=notion_section.getint(
+            'pool_limit_per_host', default_session_settings.pool_limit_per_host),
+        keepalive_timeout=notion_section.getfloat(
+            'keepalive_timeout', default_session_settings.keepalive_timeout),
+        dns_cache_ttl=notion_section.getint('dns_cache_ttl', default_session_settings.dns_cache_ttl),
+    )
+
+    default_retry_settings = RetrySettings()
+    retry_settings = RetrySettings(
+        max_attempts=notion_section.getint('retry_max_attempts', default_retry_settings.max_attempts),
+        base_delay=notion_section.getfloat('retry_base_delay', default_retry_settings.base_delay),
+        max_delay=notion_section.getfloat('retry_max_delay', default_retry_settings.max_delay),
+        deadline=notion_section.getfloat('retry_deadline', default_retry_settings.deadline),
+    )
+
+    timeout_settings = TimeoutSettings()
+    if config.has_section(f'{package_name}.timeouts'):
+        timeouts_section = config[f'{package_name}.timeouts']
+        timeout_settings = TimeoutSettings(
+            connect=timeouts_section.getfloat('connect', timeout_settings.connect),
+            read=timeouts_section.getfloat('read', timeout_settings.read),
+            total=timeouts_section.getfloat('total', timeout_settings.total),
+            consumer=timeouts_section.getfloat('consumer', timeout_settings.consumer),
+        )
+
+    circuit_breaker_settings = CircuitBreakerSettings()
+    if config.has_section(f'{package_name}.circuit_breaker'):
+        circuit_breaker_section = config[f'{package_name}.circuit_breaker']
+        circuit_breaker_settings = CircuitBreakerSettings(
+            enabled=circuit_breaker_section.getboolean('enabled', circuit_breaker_settings.enabled),
+            window=circuit_breaker_section.getint('window', circuit_breaker_settings.window),
+            min_calls=circuit_breaker_section.getint('min_calls', circuit_breaker_settings.min_calls),
+            failure_rate=circuit_breaker_section.getfloat('failure_rate', circuit_breaker_settings.failure_rate),
+            slow_call_duration=circuit_breaker_section.getfloat(
+                'slow_call_duration', circuit_breaker_settings.slow_call_duration,
+            ),
+            slow_call_rate=circuit_breaker_section.getfloat(
+                'slow_call_rate', circuit_breaker_settings.slow_call_rate,
+            ),
+            open_duration=circuit_breaker_section.getfloat('open_duration', circuit_breaker_settings.open_duration),
+            half_open_max_calls=circuit_breaker_section.getint(
+                'half_open_max_calls', circuit_breaker_settings.half_open_max_calls,
+            ),
+        )
+
+    dedup_settings = DedupSettings()
+    if config.has_section(f'{package_name}.dedup'):
+        dedup_section = config[f'{package_name}.dedup']
+        dedup_settings = DedupSettings(
+            ttl=dedup_section.getfloat('ttl', dedup_settings.ttl),
+            max_size=dedup_section.getint('max_size', dedup_settings.max_size),
+        )
+
+    concurrency_settings = ConcurrencySettings()
+    if config.has_section(f'{package_name}.concurrency'):
+        concurrency_section = config[f'{package_name}.concurrency']
+        concurrency_settings = ConcurrencySettings(
+            max_in_flight=concurrency_section.getint('max_in_flight', concurrency_settings.max_in_flight),
+            max_queue=concurrency_section.getint('max_queue', concurrency_settings.max_queue),
+            queue_timeout=concurrency_section.getfloat('queue_timeout', concurrency_settings.queue_timeout),
+            retry_after=concurrency_section.getint('retry_after', concurrency_settings.retry_after),
+        )
+
+    batch_settings = BatchSettings()
+    if config.has_section(f'{package_name}.batch'):
+        batch_section = config[f'{package_name}.batch']
+        batch_settings = BatchSettings(
+            enabled=batch_section.getboolean('enabled', batch_settings.enabled),
+            max_batch_size=batch_section.getint('max_batch_size', batch_settings.max_batch_size),
+            flush_interval=batch_section.getfloat('flush_interval', batch_settings.flush_interval),
+            max_queue=batch_section.getint('max_queue', batch_settings.max_queue),
+            drain_timeout=batch_section.getfloat('drain_timeout', batch_settings.drain_timeout),
+        )
+
+    spool_settings = SpoolSettings()
+    if config.has_section(f'{package_name}.spool'):
+        spool_section = config[f'{package_name}.spool']
+        spool_settings = SpoolSettings(
+            path=spool_section.get('path', spool_settings.path),
+            fsync_interval=spool_section.getfloat('fsync_interval', spool_settings.fsync_interval),
+            replay_interval=spool_section.getfloat('replay_interval', spool_settings.replay_interval),
+            replay_base_delay=spool_section.getfloat('replay_base_delay', spool_settings.replay_base_delay),
+            replay_max_delay=spool_section.getfloat('replay_max_delay', spool_settings.replay_max_delay),
+            compact_threshold=spool_section.getint('compact_threshold', spool_settings.compact_threshold),
+        )
+
+    executor_settings = ExecutorSettings()
+    if config.has_section(f'{package_name}.executor'):
+        executor_section = config[f'{package_name}.executor']
+        executor_settings = ExecutorSettings(
+            thread_workers=executor_section.getint('thread_workers', executor_settings.thread_workers),
+            process_workers=executor_section.getint('process_workers', executor_settings.process_workers),
+        )
+
+    rate_limit_settings = RateLimitSettings()
+    if config.has_section(f'{package_name}.rate_limit'):
+        rate_limit_section = config[f'{package_name}.rate_limit']
+        rate_limit_settings = RateLimitSettings(
+            enabled=rate_limit_section.getboolean('enabled', rate_limit_settings.enabled),
+            auth_rate=rate_limit_section.getfloat('auth_rate', rate_limit_settings.auth_rate),
+            auth_burst=rate_limit_section.getint('auth_burst', rate_limit_settings.auth_burst),
+            document_rate=rate_limit_section.getfloat('document_rate', rate_limit_settings.document_rate),
+            document_burst=rate_limit_section.getint('document_burst', rate_limit_settings.document_burst),
+            max_clients=rate_limit_section.getint('max_clients', rate_limit_settings.max_clients),
+            idle_timeout=rate_limit_section.getfloat('idle_timeout', rate_limit_settings.idle_timeout),
+            trusted_proxies=parse_networks(rate_limit_section.get('trusted_proxies', '')),
+        )
+
+    integrations: dict[str, IntegrationConfig] = {}
+    integration_section_prefix = f'{package_name}.integration.'
+    for section_name in config.sections():
+        if not section_name.startswith(integration_section_prefix):
+            continue
+        integration_section = config[section_name]
+        integrations[section_name[len(integration_section_prefix):]] = IntegrationConfig(
+            consumer_name=integration_section.get('consumer', 'dummy'),
+            auth_view_name=integration_section.get('auth_view', 'default'),
+            auth_path=integration_section['auth_path'],
+            notion_client_id=integration_section.get('client_id', ''),
+            notion_client_id_key=integration_section.get('client_id_key', ''),
+            notion_client_secret=integration_section.get('client_secret', ''),
+            notion_client_secret_key=integration_section.get('client_secret_key', ''),
+            custom_settings=get_custom_settings(integration_section),
+        )
+
     return AppConfiguration(
         consumer_name=main_section.get('consumer', 'dummy'),
         auth_view_name=main_section.get('auth_view', 'default'),
@@ -83,8 +347,21 @@ def load_config_from_file(filename: str) -> AppConfiguration:
         notion_client_id_key=notion_section.get('client_id_key', ''),
         notion_client_secret=notion_section.get('client_secret', ''),
         notion_client_secret_key=notion_section.get('client_secret_key', ''),
+        notion_base_url=notion_section.get('base_url', ''),
         base_path=server_section.get('base_path', ''),
         auth_path=server_section.get('auth_path', '/auth'),
+        metrics_path=server_section.get('metrics_path', ''),
         documents=documents,
         custom_settings=custom_settings,
+        notion_session_settings=notion_session_settings,
+        concurrency_settings=concurrency_settings,
+        retry_settings=retry_settings,
+        circuit_breaker_settings=circuit_breaker_settings,
+        timeout_settings=timeout_settings,
+        dedup_settings=dedup_settings,
+        batch_settings=batch_settings,
+        spool_settings=spool_settings,
+        executor_settings=executor_settings,
+        rate_limit_settings=rate_limit_settings,
+        integrations=integrations,
     )
@@ -0,0 +1,178 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import time
+from email.utils import formatdate
+from typing import Optional
+
+import attr
+
+from notion_oauth_handler.server.config import DocumentConfig
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+
+_LOGGER = logging.getLogger(__name__)
+
+IDENTITY_ENCODING = 'identity'
+# Sibling file suffixes of precompressed variants, in the order of preference
+PRECOMPRESSED_SUFFIXES: dict[str, str] = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+
+@attr.s(frozen=True)
+class DocumentVariant:
+    """Document body in a specific content-encoding"""
+
+    encoding: str = attr.ib(kw_only=True)
+    body: bytes = attr.ib(kw_only=True)
+    etag: str = attr.ib(kw_only=True)
+
+    @property
+    def content_length(self) -> int:
+        return len(self.body)
+
+
+@attr.s(frozen=True)
+class LoadedDocument:
+    """A document file loaded into memory along with its precomputed validators and encoded variants"""
+
+    variants: dict[str, DocumentVariant] = attr.ib(kw_only=True)
+    mtime: float = attr.ib(kw_only=True)
+    last_modified: str = attr.ib(kw_only=True)
+
+    @property
+    def identity(self) -> DocumentVariant:
+        return self.variants[IDENTITY_ENCODING]
+
+    @property
+    def body(self) -> bytes:
+        return self.identity.body
+
+    @property
+    def etag(self) -> str:
+        return self.identity.etag
+
+    @property
+    def content_length(self) -> int:
+        return self.identity.content_length
+
+
+def _read_file(filename: str) -> tuple[bytes, os.stat_result]:
+    with open(filename, 'rb') as doc_file:
+        stat = os.fstat(doc_file.fileno())
+        return doc_file.read(), stat
+
+
+def _read_precompressed_file(filename: str, source_mtime: float) -> Optional[bytes]:
+    """Read a precompressed variant unless it is missing or older than the source document"""
+
+    try:
+        with open(filename, 'rb') as doc_file:
+            if os.fstat(doc_file.fileno()).st_mtime < source_mtime:
+                _LOGGER.warning(f'Ignoring {filename}: it is older than the source document')
+                return None
+            return doc_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def _compress(body: bytes, encoding: str) -> Optional[bytes]:
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=11)
+    return None
+
+
+def load_document(filename: str) -> LoadedDocument:
+    """
+    Load document and prepare its compressed variants.
+    Sibling `.br`/`.gz` files are used if they exist and are not older than the document,
+    otherwise the variants are compressed here.
+    """
+
+    body, stat = _read_file(filename)
+    base_etag = hashlib.sha256(body).hexdigest()[:32]
+    variants = {
+        IDENTITY_ENCODING: DocumentVariant(encoding=IDENTITY_ENCODING, body=body, etag=f'"{base_etag}"'),
+    }
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+        encoded_body = _read_precompressed_file(f'{filename}{suffix}', source_mtime=stat.st_mtime)
+        if encoded_body is None:
+            encoded_body = _compress(body, encoding=encoding)
+            if encoded_body is None or len(encoded_body) >= len(body):
+                continue
+        variants[encoding] = DocumentVariant(
+            encoding=encoding, body=encoded_body, etag=f'"{base_etag}-{encoding}"',
+        )
+
+    return LoadedDocument(
+        variants=variants,
+        mtime=stat.st_mtime,
+        last_modified=formatdate(stat.st_mtime, usegmt=True),
+    )
+
+
+@attr.s
+class DocumentStore:
+    """
+    Keeps a document in memory.
+    If `reload_interval` is configured for the document,
+    the file's mtime is checked (in an executor, at most once per interval)
+    and the document is reloaded if the file has changed.
+    """
+
+    _doc_config: DocumentConfig = attr.ib(kw_only=True)
+    _document: LoadedDocument = attr.ib(init=False)
+    _last_check: float = attr.ib(init=False, factory=time.monotonic)
+    _reload_lock: Optional[asyncio.Lock] = attr.ib(init=False, default=None)
+
+    def __attrs_post_init__(self) -> None:
+        self._document = load_document(self._doc_config.filename)
+
+    @property
+    def doc_config(self) -> DocumentConfig:
+        return self._doc_config
+
+    def replace(self, doc_config: DocumentConfig, document: LoadedDocument) -> None:
+        """Switch to another document (e.g. on configuration reload); requests already served are unaffected"""
+        self._doc_config = doc_config
+        self._document = document
+        self._last_check = time.monotonic()
+
+    def _reload_due(self) -> bool:
+        reload_interval = self._doc_config.reload_interval
+        return reload_interval > 0 and time.monotonic() - self._last_check >= reload_interval
+
+    async def _reload_if_modified(self) -> None:
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+
+        async with self._reload_lock:
+            if not self._reload_due():  # Another request has just checked it
+                return
+
+            loop = asyncio.get_running_loop()
+            filename = self._doc_config.filename
+            try:
+                stat = await loop.run_in_executor(None, os.stat, filename)
+                if stat.st_mtime != self._document.mtime:
+                    self._document = await loop.run_in_executor(None, load_document, filename)
+                    _LOGGER.info(f'Reloaded document {filename}')
+            except OSError:
+                _LOGGER.exception(f'Failed to reload document {filename}, serving the cached version')
+            finally:
+                self._last_check = time.monotonic()
+
+    async def get_document(self) -> LoadedDocument:
+        if self._reload_due():
+            await self._reload_if_modified()
+        return self._document
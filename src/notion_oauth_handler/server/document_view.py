@@ -1,17 +1,54 @@
 import logging
+import time
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
-from typing import Type
+from typing import Optional, Type
 
+import attr
 from aiohttp.web import View, Response
 
+from notion_oauth_handler.core.metrics import MetricsRegistry
 from notion_oauth_handler.server.config import DocumentConfig
+from notion_oauth_handler.server.document_store import (
+    IDENTITY_ENCODING, PRECOMPRESSED_SUFFIXES,
+    DocumentStore, DocumentVariant, LoadedDocument,
+)
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@attr.s
+class DocumentMetrics:
+    registry: MetricsRegistry = attr.ib(kw_only=True, factory=MetricsRegistry)
+
+    def __attrs_post_init__(self) -> None:
+        self.requests = self.registry.counter(
+            'notion_oauth_document_requests_total', 'Document requests by path, status and encoding',
+            ('path', 'status', 'encoding'),
+        )
+        self.duration = self.registry.histogram(
+            'notion_oauth_document_duration_seconds', 'Duration of handling a document request', ('path',),
+        )
+        self.bytes_sent = self.registry.counter(
+            'notion_oauth_document_bytes_total', 'Document body bytes sent', ('path',),
+        )
+
+    def observe_request(self, path: str, status: int, encoding: str, body_size: int, duration: float) -> None:
+        self.requests.inc((path, str(status), encoding))
+        self.duration.observe(duration, (path,))
+        if body_size:
+            self.bytes_sent.inc((path,), amount=body_size)
+
+
 class DocumentView(View):
-    doc_config: DocumentConfig
+    doc_store: DocumentStore
+    doc_metrics: Optional[DocumentMetrics] = None
+    doc_serve_path: str = ''
+
+    @property
+    def doc_config(self) -> DocumentConfig:
+        return self.doc_store.doc_config
 
     @property
     def doc_filename(self) -> str:
@@ -21,21 +58,116 @@ class DocumentView(View):
     def doc_content_type(self) -> str:
         return self.doc_config.content_type
 
-    def get_doc_body(self) -> str:
-        with open(self.doc_filename) as doc_file:
-            return doc_file.read()
+    @property
+    def doc_charset(self) -> Optional[str]:
+        return 'utf-8' if self.doc_content_type.startswith('text/') else None
 
-    async def get(self) -> Response:
-        doc_body = self.get_doc_body()
-        return Response(
+    def _get_accepted_encodings(self) -> dict[str, float]:
+        accepted: dict[str, float] = {}
+        for item in self.request.headers.get('Accept-Encoding', '').split(','):
+            encoding, _, params = item.partition(';')
+            encoding = encoding.strip().lower()
+            if not encoding:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[encoding] = quality
+        return accepted
+
+    def select_variant(self, document: LoadedDocument) -> DocumentVariant:
+        """Pick the document variant that best matches the request's Accept-Encoding"""
+
+        if len(document.variants) == 1:
+            return document.identity
+
+        accepted = self._get_accepted_encodings()
+        best_variant = document.identity
+        best_quality = 0.0
+        for encoding in PRECOMPRESSED_SUFFIXES:  # Iterate in the order of preference
+            variant = document.variants.get(encoding)
+            if variant is None:
+                continue
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best_variant, best_quality = variant, quality
+
+        return best_variant
+
+    def make_cache_headers(self, document: LoadedDocument, variant: DocumentVariant) -> dict[str, str]:
+        headers = {
+            'ETag': variant.etag,
+            'Last-Modified': document.last_modified,
+        }
+        if len(document.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if self.doc_config.max_age is not None:
+            headers['Cache-Control'] = f'public, max-age={self.doc_config.max_age}'
+        return headers
+
+    def is_not_modified(self, document: LoadedDocument, variant: DocumentVariant) -> bool:
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-Modified-Since must be ignored when If-None-Match is present
+            etags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in etags or variant.etag in etags
+
+        if_modified_since = self.request.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(document.mtime) <= since
+
+        return False
+
+    async def make_document_response(self) -> tuple[Response, DocumentVariant]:
+        document = await self.doc_store.get_document()
+        variant = self.select_variant(document)
+        headers = self.make_cache_headers(document, variant)
+        if self.is_not_modified(document, variant):
+            return Response(status=HTTPStatus.NOT_MODIFIED, headers=headers), variant
+
+        if variant.encoding != IDENTITY_ENCODING:
+            headers['Content-Encoding'] = variant.encoding
+        response = Response(
             status=HTTPStatus.OK,
-            body=doc_body,
+            body=variant.body,
             content_type=self.doc_content_type,
+            charset=self.doc_charset,
+            headers=headers,
         )
+        return response, variant
+
+    async def get(self) -> Response:
+        start = time.perf_counter()
+        response, variant = await self.make_document_response()
+        if self.doc_metrics is not None:
+            self.doc_metrics.observe_request(
+                path=self.doc_serve_path,
+                status=response.status,
+                encoding=variant.encoding,
+                body_size=variant.content_length if response.status == HTTPStatus.OK else 0,
+                duration=time.perf_counter() - start,
+            )
+        return response
+
 
+def document_view_factory(
+        document_config: DocumentConfig,
+        serve_path: str = '',
+        metrics: Optional[DocumentMetrics] = None,
+) -> Type[DocumentView]:
+    document_store = DocumentStore(doc_config=document_config)
 
-def document_view_factory(document_config: DocumentConfig) -> Type[DocumentView]:
     class CustomDocumentView(DocumentView):
-        doc_config = document_config
+        doc_store = document_store
+        doc_metrics = metrics
+        doc_serve_path = serve_path
 
     return CustomDocumentView
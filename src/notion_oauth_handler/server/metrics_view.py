@@ -0,0 +1,27 @@
+from http import HTTPStatus
+from typing import Type
+
+from aiohttp.web import View, Response
+
+from notion_oauth_handler.core.metrics import MetricsRegistry
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsView(View):
+    metrics_registry: MetricsRegistry
+
+    async def get(self) -> Response:
+        return Response(
+            status=HTTPStatus.OK,
+            text=self.metrics_registry.render(),
+            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE, 'Cache-Control': 'no-store'},
+        )
+
+
+def metrics_view_factory(registry: MetricsRegistry) -> Type[MetricsView]:
+    class CustomMetricsView(MetricsView):
+        metrics_registry = registry
+
+    return CustomMetricsView
@@ -1,31 +1,93 @@
-from typing import Awaitable, Callable, Optional
+import uuid
+import warnings
+from typing import Awaitable, Callable, Mapping, Optional
 
-from aiohttp.web import middleware, Request, Response
+import attr
+from aiohttp.web import AbstractResource, middleware, Request, Response
 
 from notion_oauth_handler.core.consumer import NotionOAuthConsumer
 from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.core.tracing import set_request_id
 
 
 OAUTH_HANDLER_REQUEST_KEY = '__ouath_handler__'
 CUSTOM_SETTINGS_REQUEST_KEY = '__custom_settings__'
+REQUEST_ID_REQUEST_KEY = '__request_id__'
+RESOURCES_APP_KEY = '__notion_oauth_resources__'
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_MAX_REQUEST_ID_LENGTH = 128
+
+
+def _get_request_id(request: Request) -> str:
+    """Reuse the request ID sent by a proxy (if it looks sane) or generate a new one"""
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    if not request_id or len(request_id) > _MAX_REQUEST_ID_LENGTH or not request_id.isprintable():
+        request_id = uuid.uuid4().hex
+    return request_id
+
+
+@attr.s
+class IntegrationContext:
+    """
+    What the views of an integration get in the request.
+    `custom_settings` is replaced on configuration reload;
+    requests that are already being handled keep the settings they started with
+    """
+
+    oauth_handler: NotionOAuthHandler = attr.ib(kw_only=True)
+    custom_settings: dict = attr.ib(kw_only=True)
 
 
 def notion_oauth_middleware_factory(
         *,
-        notion_client_id: str,
-        notion_client_secret: str,
-        consumer: NotionOAuthConsumer,
-        custom_settings: dict,
+        default_context: Optional[IntegrationContext] = None,
+        integration_routes: Optional[Mapping[AbstractResource, IntegrationContext]] = None,
+        notion_client_id: Optional[str] = None,
+        notion_client_secret: Optional[str] = None,
+        consumer: Optional[NotionOAuthConsumer] = None,
+        custom_settings: Optional[dict] = None,
 ):
-    oauth_handler = NotionOAuthHandler(
-        consumer=consumer,
-        client_id=notion_client_id, client_secret=notion_client_secret,
-    )
+    """
+    `integration_routes` maps the resources of additional integrations to their contexts;
+    requests to all other resources get `default_context`.
+    The mapping is looked up on each request, so it may be filled after the middleware is created.
+
+    Deprecated: instead of `default_context`, the credentials, the consumer and the custom settings
+    may still be passed (as before), and a handler is made for them. Such a handler is not started
+    or cleaned up with the app, so its session is only closed when the process exits.
+    """
+
+    if default_context is None:
+        if notion_client_id is None or notion_client_secret is None or consumer is None or custom_settings is None:
+            raise TypeError('Either default_context or the credentials, consumer and custom_settings are required')
+        warnings.warn(
+            'Passing the credentials, consumer and custom_settings to notion_oauth_middleware_factory is deprecated, '
+            'pass default_context instead',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        default_context = IntegrationContext(
+            oauth_handler=NotionOAuthHandler(
+                consumer=consumer, client_id=notion_client_id, client_secret=notion_client_secret,
+            ),
+            custom_settings=custom_settings,
+        )
+    main_context: IntegrationContext = default_context
+    if integration_routes is None:
+        integration_routes = {}
 
     @middleware
     async def middleware_impl(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
-        request[OAUTH_HANDLER_REQUEST_KEY] = oauth_handler
-        request[CUSTOM_SETTINGS_REQUEST_KEY] = custom_settings
-        return await handler(request)
+        request_id = _get_request_id(request)
+        set_request_id(request_id)  # Each request is handled in its own task, so this is request-scoped
+        request[REQUEST_ID_REQUEST_KEY] = request_id
+        resource = request.match_info.route.resource  # None for system routes (e.g. 404)
+        context = main_context if resource is None else integration_routes.get(resource, main_context)
+        request[OAUTH_HANDLER_REQUEST_KEY] = context.oauth_handler
+        request[CUSTOM_SETTINGS_REQUEST_KEY] = context.custom_settings
+        response = await handler(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
 
     return middleware_impl
@@ -0,0 +1,159 @@
+"""
+Per-client rate limiting of the auth and document endpoints.
+
+Each limited route has its own token buckets keyed by the client IP.
+The IP is taken from `X-Forwarded-For` only if the request comes from one of the trusted proxies:
+the rightmost address that is not a trusted proxy is used.
+
+Buckets are kept in an LRU-ordered dict: buckets idle for longer than `idle_timeout` are evicted
+(by then they are full again anyway), and the least recently used ones are evicted
+when there are more than `max_clients` of them, so the memory used is bounded.
+Limited requests get a 429 response with `Retry-After`.
+Rates must be positive and bursts at least 1 (a limiter that never allows a request is an error,
+not a way to disable a route).
+"""
+
+import collections
+import ipaddress
+import math
+import time
+from http import HTTPStatus
+from typing import Awaitable, Callable, Mapping, Sequence, Union
+
+import attr
+from aiohttp.web import AbstractResource, middleware, Request, Response
+
+from notion_oauth_handler.core.metrics import MetricsRegistry
+
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(value: str) -> tuple[IPNetwork, ...]:
+    """Parse comma-separated IP addresses and networks (CIDR)"""
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip())
+
+
+@attr.s(frozen=True)
+class RateLimitSettings:
+    enabled: bool = attr.ib(kw_only=True, default=False)
+    auth_rate: float = attr.ib(kw_only=True, default=1.0, validator=attr.validators.gt(0))  # Requests per second
+    auth_burst: int = attr.ib(kw_only=True, default=10, validator=attr.validators.ge(1))
+    document_rate: float = attr.ib(kw_only=True, default=5.0, validator=attr.validators.gt(0))
+    document_burst: int = attr.ib(kw_only=True, default=20, validator=attr.validators.ge(1))
+    max_clients: int = attr.ib(kw_only=True, default=10000)  # Per route
+    idle_timeout: float = attr.ib(kw_only=True, default=60.0)
+    trusted_proxies: tuple[IPNetwork, ...] = attr.ib(kw_only=True, default=())
+
+
+@attr.s
+class TokenBucketLimiter:
+    rate: float = attr.ib(kw_only=True, validator=attr.validators.gt(0))
+    burst: int = attr.ib(kw_only=True, validator=attr.validators.ge(1))
+    max_clients: int = attr.ib(kw_only=True, default=10000)
+    idle_timeout: float = attr.ib(kw_only=True, default=60.0)
+    # Client key -> (tokens, last update), the least recently used first
+    _buckets: collections.OrderedDict[str, tuple[float, float]] = attr.ib(
+        init=False, factory=collections.OrderedDict,
+    )
+
+    @property
+    def client_count(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            _, updated = next(iter(buckets.values()))
+            if now - updated <= self.idle_timeout and len(buckets) <= self.max_clients:
+                break
+            buckets.popitem(last=False)
+
+    def acquire(self, key: str) -> float:
+        """Take a token from the client's bucket. Returns 0 if allowed, or seconds until a token is available"""
+
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens, updated = bucket
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        self._evict(now)
+        return wait
+
+
+def get_client_ip(request: Request, trusted_proxies: Sequence[IPNetwork]) -> str:
+    remote = request.remote or ''
+    if not trusted_proxies or not _is_trusted(remote, trusted_proxies):
+        return remote
+    hops = [
+        hop.strip()
+        for header_value in request.headers.getall('X-Forwarded-For', ())
+        for hop in header_value.split(',') if hop.strip()
+    ]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted_proxies):
+            return hop
+    return hops[0] if hops else remote
+
+
+def _is_trusted(address: str, trusted_proxies: Sequence[IPNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+@attr.s
+class RateLimitMetrics:
+    registry: MetricsRegistry = attr.ib(kw_only=True, factory=MetricsRegistry)
+
+    def __attrs_post_init__(self) -> None:
+        self.limited = self.registry.counter(
+            'notion_oauth_rate_limited_total', 'Requests rejected by the rate limiter by path', ('path',),
+        )
+        self.clients = self.registry.gauge(
+            'notion_oauth_rate_limit_clients', 'Number of clients tracked by the rate limiter',
+        )
+
+
+def rate_limit_middleware_factory(
+        *,
+        settings: RateLimitSettings,
+        route_limiters: Mapping[AbstractResource, TokenBucketLimiter],
+        metrics: RateLimitMetrics,
+):
+    """
+    `route_limiters` maps the limited resources to their limiters; other requests are not limited.
+    The mapping is looked up on each request, so it may be filled after the middleware is created.
+    """
+
+    trusted_proxies = settings.trusted_proxies
+    metrics.clients.set_function(lambda: sum(limiter.client_count for limiter in route_limiters.values()))
+
+    @middleware
+    async def middleware_impl(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
+        resource = request.match_info.route.resource
+        limiter = None if resource is None else route_limiters.get(resource)
+        if limiter is not None:
+            wait = limiter.acquire(get_client_ip(request, trusted_proxies))
+            if wait > 0:
+                assert resource is not None
+                metrics.limited.inc((resource.canonical,))
+                return Response(
+                    status=HTTPStatus.TOO_MANY_REQUESTS,
+                    text='Too many requests, please try again later',
+                    headers={'Retry-After': str(math.ceil(wait))},
+                )
+        return await handler(request)
+
+    return middleware_impl
@@ -0,0 +1,279 @@
+"""
+Hot reload of the configuration in the single-process mode.
+
+On SIGHUP (or when the file's mtime changes, if `watch_interval` is set)
+the configuration file is re-read, its entrypoints and credentials are resolved again,
+and the result is diffed against the running configuration.
+Parts that can be updated in place are swapped at once, without any awaits in between:
+- credentials of the integrations (see `NotionOAuthHandler.update_credentials`);
+- custom settings (of the views and the consumers, see `NotionOAuthConsumer.update_custom_settings`);
+- documents served on the configured paths (new documents are loaded before the swap).
+Requests that are already being handled finish with the objects they started with.
+
+Other changes (paths, entrypoints, Notion connection settings, etc.) require a restart,
+so they are only logged (on every reload until the process is restarted,
+since only the applied parts are taken as the running configuration).
+The pre-fork mode (see `server.workers`) restarts the workers on SIGHUP instead.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Optional
+
+import attr
+from aiohttp import web
+
+from notion_oauth_handler.server.app import (
+    APP_PARTS_APP_KEY, MAIN_INTEGRATION_NAME,
+    AppComponents, AppParts, prepare_app_components,
+)
+from notion_oauth_handler.server.config import (
+    AppConfiguration, DocumentConfig, IntegrationConfig, load_config_from_file,
+)
+from notion_oauth_handler.server.document_store import LoadedDocument, load_document
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Fields that are either updated in place or compared separately
+_HOT_APP_FIELDS = frozenset({
+    'notion_client_id', 'notion_client_id_key', 'notion_client_secret', 'notion_client_secret_key',
+    'custom_settings', 'documents', 'integrations',
+})
+_HOT_INTEGRATION_FIELDS = frozenset({
+    'notion_client_id', 'notion_client_id_key', 'notion_client_secret', 'notion_client_secret_key',
+    'custom_settings',
+})
+
+
+@attr.s(frozen=True)
+class ConfigDiff:
+    credentials: dict[str, tuple[str, str]] = attr.ib(kw_only=True, factory=dict)  # Client ID and secret
+    custom_settings: dict[str, dict] = attr.ib(kw_only=True, factory=dict)
+    documents: dict[str, DocumentConfig] = attr.ib(kw_only=True, factory=dict)
+    restart_required: list[str] = attr.ib(kw_only=True, factory=list)  # Names of the changed settings
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.credentials or self.custom_settings or self.documents or self.restart_required)
+
+
+def _diff_fields(old: Any, new: Any, hot_fields: frozenset[str], prefix: str = '') -> list[str]:
+    return [
+        f'{prefix}{field.name}'
+        for field in attr.fields(type(old))
+        if field.name not in hot_fields and getattr(old, field.name) != getattr(new, field.name)
+    ]
+
+
+def diff_config(
+        old_config: AppConfiguration, old_components: AppComponents,
+        new_config: AppConfiguration, new_components: AppComponents,
+) -> ConfigDiff:
+    diff = ConfigDiff()
+    diff.restart_required.extend(_diff_fields(old_config, new_config, _HOT_APP_FIELDS))
+    if old_config.documents.keys() != new_config.documents.keys():
+        diff.restart_required.append('documents (paths)')
+    if old_config.integrations.keys() != new_config.integrations.keys():
+        diff.restart_required.append('integrations (names)')
+
+    # (name, old config, old components, new config, new components) of the integrations present in both
+    integration_pairs: list[tuple[str, Any, AppComponents, Any, AppComponents]] = [
+        (MAIN_INTEGRATION_NAME, old_config, old_components, new_config, new_components),
+    ]
+    for name, new_integration_config in new_config.integrations.items():
+        old_integration_config: Optional[IntegrationConfig] = old_config.integrations.get(name)
+        if old_integration_config is None:
+            continue
+        diff.restart_required.extend(_diff_fields(
+            old_integration_config, new_integration_config, _HOT_INTEGRATION_FIELDS, prefix=f'integration.{name}.',
+        ))
+        integration_pairs.append((
+            name,
+            old_integration_config, old_components.integrations[name],
+            new_integration_config, new_components.integrations[name],
+        ))
+
+    for name, old_item_config, old_item_components, new_item_config, new_item_components in integration_pairs:
+        new_credentials = (new_item_components.notion_client_id, new_item_components.notion_client_secret)
+        if (old_item_components.notion_client_id, old_item_components.notion_client_secret) != new_credentials:
+            diff.credentials[name] = new_credentials
+        if old_item_config.custom_settings != new_item_config.custom_settings:
+            diff.custom_settings[name] = new_item_config.custom_settings
+
+    for path, doc_config in new_config.documents.items():
+        if path in old_config.documents and old_config.documents[path] != doc_config:
+            diff.documents[path] = doc_config
+    return diff
+
+
+def _evolve_hot_fields(old: Any, new: Any, hot_fields: frozenset[str]) -> Any:
+    return attr.evolve(old, **{field_name: getattr(new, field_name) for field_name in hot_fields})
+
+
+def apply_hot_changes(
+        old_config: AppConfiguration, old_components: AppComponents,
+        new_config: AppConfiguration, new_components: AppComponents,
+) -> tuple[AppConfiguration, AppComponents]:
+    """
+    The configuration that is running once the parts of the new one that can be updated in place are applied;
+    everything else stays as it is in the old one
+    """
+
+    config = _evolve_hot_fields(old_config, new_config, _HOT_INTEGRATION_FIELDS)
+    config = attr.evolve(
+        config,
+        documents={
+            path: new_config.documents.get(path, doc_config) for path, doc_config in old_config.documents.items()
+        },
+        integrations={
+            name: (
+                _evolve_hot_fields(integration_config, new_config.integrations[name], _HOT_INTEGRATION_FIELDS)
+                if name in new_config.integrations else integration_config
+            )
+            for name, integration_config in old_config.integrations.items()
+        },
+    )
+
+    def evolve_credentials(old: AppComponents, new: AppComponents) -> AppComponents:
+        return attr.evolve(old, notion_client_id=new.notion_client_id, notion_client_secret=new.notion_client_secret)
+
+    components = attr.evolve(
+        evolve_credentials(old_components, new_components),
+        integrations={
+            name: (
+                evolve_credentials(integration_components, new_components.integrations[name])
+                if name in new_components.integrations else integration_components
+            )
+            for name, integration_components in old_components.integrations.items()
+        },
+    )
+    return config, components
+
+
+@attr.s
+class ConfigReloader:
+    _app_parts: AppParts = attr.ib(kw_only=True)
+    _filename: str = attr.ib(kw_only=True)
+    _config: AppConfiguration = attr.ib(kw_only=True)
+    _components: AppComponents = attr.ib(kw_only=True)
+    _watch_interval: float = attr.ib(kw_only=True, default=0)  # 0 means reload only on SIGHUP
+    # Created in the running loop (before Python 3.10 a lock is bound to the loop current at its creation)
+    _lock: Optional[asyncio.Lock] = attr.ib(init=False, default=None)
+    _mtime: Optional[float] = attr.ib(init=False, default=None)
+    _watch_task: Optional[asyncio.Task] = attr.ib(init=False, default=None)
+    _reload_tasks: set[asyncio.Task] = attr.ib(init=False, factory=set)
+
+    def _get_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self._filename).st_mtime
+        except OSError:
+            return None
+
+    def _load(self) -> tuple[AppConfiguration, AppComponents, ConfigDiff, dict[str, LoadedDocument]]:
+        """Blocking part of the reload, run in an executor"""
+
+        config = load_config_from_file(self._filename)
+        components = prepare_app_components(config)
+        diff = diff_config(self._config, self._components, config, components)
+        documents = {
+            path: load_document(doc_config.filename)
+            for path, doc_config in diff.documents.items()
+            if path in self._app_parts.document_stores
+        }
+        return config, components, diff, documents
+
+    def _apply(self, diff: ConfigDiff, documents: dict[str, LoadedDocument]) -> None:
+        integrations = self._app_parts.integrations
+        for name, (client_id, client_secret) in diff.credentials.items():
+            if name in integrations:
+                integrations[name].oauth_handler.update_credentials(client_id=client_id, client_secret=client_secret)
+        for name, custom_settings in diff.custom_settings.items():
+            if name in integrations:
+                integrations[name].custom_settings = custom_settings
+                integrations[name].oauth_handler.consumer.update_custom_settings(custom_settings)
+        for path, document in documents.items():
+            self._app_parts.document_stores[path].replace(diff.documents[path], document)
+
+    async def reload(self) -> bool:
+        """Re-read the configuration and apply the changes; return whether anything has changed"""
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._mtime = self._get_mtime()
+            loop = asyncio.get_running_loop()
+            try:
+                config, components, diff, documents = await loop.run_in_executor(None, self._load)
+            except Exception:
+                _LOGGER.exception(f'Failed to reload {self._filename}, keeping the current configuration')
+                return False
+
+            self._apply(diff, documents)
+            self._config, self._components = apply_hot_changes(self._config, self._components, config, components)
+            if diff.restart_required:
+                _LOGGER.warning(f'Changes of {", ".join(diff.restart_required)} require a restart to take effect')
+            _LOGGER.info(
+                f'Reloaded {self._filename}: '
+                f'credentials of {len(diff.credentials)}, custom settings of {len(diff.custom_settings)} '
+                f'integration(s) and {len(documents)} document(s) updated'
+            )
+            return not diff.is_empty
+
+    def _schedule_reload(self) -> None:
+        task = asyncio.create_task(self.reload())
+        self._reload_tasks.add(task)
+        task.add_done_callback(self._reload_tasks.discard)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._watch_interval)
+            if self._get_mtime() != self._mtime:
+                await self.reload()
+
+    async def start(self) -> None:
+        self._lock = asyncio.Lock()
+        self._mtime = self._get_mtime()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._schedule_reload)
+        if self._watch_interval > 0:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+        for task in [self._watch_task, *self._reload_tasks]:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*self._reload_tasks, return_exceptions=True)
+        if self._watch_task is not None:
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+
+
+def register_config_reloader(
+        app: web.Application,
+        *,
+        filename: str,
+        config: AppConfiguration,
+        components: AppComponents,
+        watch_interval: float = 0,
+) -> None:
+    """Reload the configuration the app has been built from while it is running"""
+
+    reloader = ConfigReloader(
+        app_parts=app[APP_PARTS_APP_KEY],
+        filename=filename,
+        config=config,
+        components=components,
+        watch_interval=watch_interval,
+    )
+
+    async def start_reloader(_app: web.Application) -> None:
+        await reloader.start()
+
+    async def stop_reloader(_app: web.Application) -> None:
+        await reloader.stop()
+
+    app.on_startup.append(start_reloader)
+    app.on_cleanup.append(stop_reloader)
@@ -0,0 +1,286 @@
+"""
+Pre-fork multi-process server.
+
+The parent process loads the configuration and resolves entrypoints once,
+then forks worker processes that build their own app via the prepared factory
+and serve either a socket pre-bound by the parent or their own socket bound with SO_REUSEPORT.
+
+Each worker reports over a pipe once it is serving (its app has started up and its socket is bound).
+
+Signals handled by the parent:
+- SIGHUP: graceful restart - re-prepare the app factory (re-reading the configuration),
+  start a new generation of workers and, once all of them are ready, gracefully stop the old one
+  (if the new generation fails to get ready, it is stopped and the old one is kept);
+- SIGTERM/SIGINT: coordinated shutdown of all workers.
+
+Workers that exit unexpectedly are restarted with an exponential backoff.
+If they keep crashing (more than `max_restarts` times within `restart_window` seconds,
+e.g. because the port is taken), the supervisor stops all workers and exits with an error
+instead of restarting them forever.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import select
+import signal
+import socket
+import time
+from typing import Callable, Optional
+
+import attr
+from aiohttp import web
+
+from notion_oauth_handler.server.app import AppFactory
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def bind_socket(host: str, port: int, backlog: int = 128) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+@attr.s
+class WorkerSupervisor:
+    _prepare_app_factory: Callable[[], AppFactory] = attr.ib(kw_only=True)
+    _host: str = attr.ib(kw_only=True)
+    _port: int = attr.ib(kw_only=True)
+    _workers: int = attr.ib(kw_only=True)
+    _reuse_port: bool = attr.ib(kw_only=True, default=False)
+    _shutdown_timeout: float = attr.ib(kw_only=True, default=30.0)
+    _poll_interval: float = attr.ib(kw_only=True, default=0.5)
+    _ready_timeout: float = attr.ib(kw_only=True, default=30.0)  # For a new generation of workers on reload
+    _restart_base_delay: float = attr.ib(kw_only=True, default=0.5)
+    _restart_max_delay: float = attr.ib(kw_only=True, default=30.0)
+    _max_restarts: int = attr.ib(kw_only=True, default=10)  # Within `restart_window`, then give up
+    _restart_window: float = attr.ib(kw_only=True, default=60.0)
+
+    _sock: Optional[socket.socket] = attr.ib(init=False, default=None)
+    _app_factory: Optional[AppFactory] = attr.ib(init=False, default=None)
+    _worker_pids: set[int] = attr.ib(init=False, factory=set)
+    _retiring_pids: set[int] = attr.ib(init=False, factory=set)
+    _ready_fds: dict[int, int] = attr.ib(init=False, factory=dict)  # Worker PID -> read end of its readiness pipe
+    _crash_times: collections.deque[float] = attr.ib(init=False, factory=collections.deque)
+    _respawn_times: list[float] = attr.ib(init=False, factory=list)  # When to start the replacements of crashed workers
+    _gave_up: bool = attr.ib(init=False, default=False)
+    _reload_requested: bool = attr.ib(init=False, default=False)
+    _stop_requested: bool = attr.ib(init=False, default=False)
+
+    async def _serve_worker(self, app: web.Application, ready_fd: int) -> None:
+        runner = web.AppRunner(app, shutdown_timeout=self._shutdown_timeout)
+        await runner.setup()
+        try:
+            site: web.BaseSite
+            if self._sock is not None:
+                site = web.SockSite(runner, self._sock)
+            else:
+                site = web.TCPSite(runner, self._host, self._port, reuse_port=True)
+            await site.start()
+
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+            loop.add_signal_handler(signal.SIGINT, stop_event.set)
+            os.write(ready_fd, b'1')
+            os.close(ready_fd)
+            await stop_event.wait()
+        finally:
+            await runner.cleanup()
+
+    def _run_worker(self, app_factory: AppFactory, ready_fd: int) -> None:
+        """Runs in the forked child process; never returns"""
+
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            for fd in self._ready_fds.values():
+                os.close(fd)
+            app = app_factory()
+            asyncio.run(self._serve_worker(app, ready_fd))
+        except BaseException:
+            _LOGGER.exception(f'Worker {os.getpid()} failed')
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _spawn_worker(self) -> int:
+        assert self._app_factory is not None
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_worker(self._app_factory, write_fd)
+        os.close(write_fd)
+        self._ready_fds[pid] = read_fd
+        self._worker_pids.add(pid)
+        _LOGGER.info(f'Started worker {pid}')
+        return pid
+
+    def _close_ready_fd(self, pid: int) -> None:
+        fd = self._ready_fds.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _wait_ready(self, pids: set[int]) -> bool:
+        """Wait until all of the workers report that they are serving"""
+
+        waiting = {self._ready_fds[pid]: pid for pid in pids if pid in self._ready_fds}
+        deadline = time.monotonic() + self._ready_timeout
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select(list(waiting), [], [], remaining)
+            for fd in readable:
+                pid = waiting.pop(fd)
+                if not os.read(fd, 1):  # The worker has exited without getting ready
+                    return False
+                self._close_ready_fd(pid)
+        return True
+
+    def _signal_workers(self, pids: set[int], signum: int) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _get_restart_delay(self) -> Optional[float]:
+        """Register a crash; returns the delay before the restart or None if the workers keep crashing"""
+
+        now = time.monotonic()
+        self._crash_times.append(now)
+        while self._crash_times[0] < now - self._restart_window:
+            self._crash_times.popleft()
+        crash_count = len(self._crash_times)
+        if crash_count > self._max_restarts:
+            return None
+        return min(self._restart_max_delay, self._restart_base_delay * 2 ** (crash_count - 1))
+
+    def _reap_workers(self) -> None:
+        while self._worker_pids or self._retiring_pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._worker_pids.clear()
+                self._retiring_pids.clear()
+                return
+            if pid == 0:
+                return
+
+            self._close_ready_fd(pid)
+            if pid in self._retiring_pids:
+                self._retiring_pids.discard(pid)
+                _LOGGER.info(f'Retired worker {pid} exited')
+            elif pid in self._worker_pids:
+                self._worker_pids.discard(pid)
+                if self._stop_requested:
+                    continue
+                delay = self._get_restart_delay()
+                if delay is None:
+                    _LOGGER.error(
+                        f'Worker {pid} exited unexpectedly (status {status}); workers exited '
+                        f'{len(self._crash_times)} times within {self._restart_window:g}s, giving up'
+                    )
+                    self._gave_up = True
+                    self._stop_requested = True
+                    continue
+                _LOGGER.warning(f'Worker {pid} exited unexpectedly (status {status}), restarting it in {delay:.1f}s')
+                self._respawn_times.append(time.monotonic() + delay)
+
+    def _respawn_workers(self) -> None:
+        now = time.monotonic()
+        due_count = sum(1 for respawn_time in self._respawn_times if respawn_time <= now)
+        if not due_count:
+            return
+        self._respawn_times = [respawn_time for respawn_time in self._respawn_times if respawn_time > now]
+        for _ in range(due_count):
+            self._spawn_worker()
+
+    def _reload(self) -> None:
+        _LOGGER.info('Reloading workers')
+        try:
+            self._app_factory = self._prepare_app_factory()
+        except Exception:
+            _LOGGER.exception('Failed to reload, keeping the current workers')
+            return
+
+        old_pids = self._worker_pids
+        self._worker_pids = set()
+        self._respawn_times.clear()  # Replaced by the new generation
+        for _ in range(self._workers):
+            self._spawn_worker()
+        new_pids = set(self._worker_pids)
+        if not self._wait_ready(new_pids):
+            _LOGGER.error('New workers failed to get ready, keeping the current ones')
+            self._worker_pids = old_pids
+            self._retiring_pids |= new_pids
+            self._signal_workers(new_pids, signal.SIGTERM)
+            return
+        # The new generation is accepting connections on the same port,
+        # so the old one can finish its in-flight requests and exit
+        self._retiring_pids |= old_pids
+        self._signal_workers(old_pids, signal.SIGTERM)
+
+    def _shutdown(self) -> None:
+        _LOGGER.info('Shutting down workers')
+        all_pids = self._worker_pids | self._retiring_pids
+        self._retiring_pids = all_pids
+        self._worker_pids = set()
+        self._signal_workers(all_pids, signal.SIGTERM)
+
+        deadline = time.monotonic() + self._shutdown_timeout
+        while self._retiring_pids and time.monotonic() < deadline:
+            self._reap_workers()
+            time.sleep(0.1)
+        if self._retiring_pids:
+            _LOGGER.warning(f'Killing workers that did not stop in time: {sorted(self._retiring_pids)}')
+            self._signal_workers(self._retiring_pids, signal.SIGKILL)
+            self._reap_workers()
+
+    def _handle_reload_signal(self, signum: int, frame) -> None:
+        self._reload_requested = True
+
+    def _handle_stop_signal(self, signum: int, frame) -> None:
+        self._stop_requested = True
+
+    def run(self) -> None:
+        self._app_factory = self._prepare_app_factory()
+        if not self._reuse_port:
+            self._sock = bind_socket(self._host, self._port)
+
+        signal.signal(signal.SIGHUP, self._handle_reload_signal)
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        signal.signal(signal.SIGINT, self._handle_stop_signal)
+
+        _LOGGER.info(f'Serving on {self._host}:{self._port} with {self._workers} worker(s)')
+        for _ in range(self._workers):
+            self._spawn_worker()
+
+        try:
+            while not self._stop_requested:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._reload()
+                self._reap_workers()
+                self._respawn_workers()
+                time.sleep(self._poll_interval)
+        finally:
+            self._shutdown()
+            for pid in list(self._ready_fds):
+                self._close_ready_fd(pid)
+            if self._sock is not None:
+                self._sock.close()
+        if self._gave_up:
+            raise SystemExit(1)
@@ -0,0 +1,26 @@
+import contextlib
+import uuid
+from typing import AsyncIterator
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from notion_oauth_handler.core.dto import AuthRedirectInfo
+
+
+@contextlib.asynccontextmanager
+async def serve(app: web.Application) -> AsyncIterator[str]:
+    """Run the app on a local port; yields its base URL"""
+
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        yield str(server.make_url('')).rstrip('/')
+    finally:
+        await server.close()
+
+
+def make_redirect_info(code: str = '', state: str = 'state') -> AuthRedirectInfo:
+    return AuthRedirectInfo(
+        redirect_uri='http://localhost/auth', code=code or uuid.uuid4().hex, state=state,
+    )
@@ -0,0 +1,33 @@
+import asyncio
+
+import aiohttp
+
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+from notion_oauth_handler.server.app import make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+
+from helpers import serve
+
+
+async def _get_auth_status(query: str) -> int:
+    async with serve(make_mock_app(MockSettings())) as mock_url:
+        app = make_app(
+            consumer=DummyNotionOAuthConsumer(custom_settings={}),
+            auth_view_cls=DefaultNotionOAuthRedirectView,
+            notion_client_id='client-id',
+            notion_client_secret='client-secret',
+            notion_base_url=mock_url,
+            custom_settings={},
+        )
+        async with serve(app) as base_url, aiohttp.ClientSession() as session:
+            async with session.get(f'{base_url}/auth?{query}') as response:
+                return response.status
+
+
+def test_redirect_without_code_is_rejected():
+    assert asyncio.run(_get_auth_status('state=state')) == 400
+
+
+def test_redirect_without_state_is_accepted():
+    assert asyncio.run(_get_auth_status('code=code')) == 200
@@ -0,0 +1,106 @@
+import asyncio
+
+import attr
+
+from notion_oauth_handler.core.batching import BatchSettings, TokenBatcher
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+
+from helpers import make_redirect_info, serve
+
+
+@attr.s
+class RecordingConsumer(DefaultNotionOAuthConsumer):
+    batches: list = attr.ib(init=False, factory=list)
+
+    async def consume_token_info(self, token_info, state_info) -> None:
+        raise AssertionError('Tokens are consumed in batches')
+
+    async def consume_token_info_batch(self, items) -> None:
+        self.batches.append([token_info.access_token for token_info, _ in items])
+
+
+def _make_batcher(batches: list, **kwargs) -> TokenBatcher:
+    async def consume_batch(batch: list) -> None:
+        batches.append(batch)
+
+    return TokenBatcher(settings=BatchSettings(enabled=True, **kwargs), consume_batch=consume_batch)
+
+
+def test_items_are_consumed_in_batches_of_max_size():
+    async def run():
+        batches = []
+        batcher = _make_batcher(batches, max_batch_size=3, flush_interval=10)
+        batcher.start()
+        for item in range(7):
+            await batcher.put(item)
+        await asyncio.sleep(0.01)
+        full_batches = list(batches)
+        await batcher.stop()
+        return full_batches, batches
+
+    full_batches, batches = asyncio.run(run())
+    assert full_batches == [[0, 1, 2], [3, 4, 5]]
+    # The rest is flushed on stop, without waiting for the interval
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_partial_batch_is_flushed_after_the_interval():
+    async def run():
+        batches = []
+        batcher = _make_batcher(batches, max_batch_size=100, flush_interval=0.02)
+        batcher.start()
+        await batcher.put('a')
+        await batcher.put('b')
+        await asyncio.sleep(0.05)
+        flushed = list(batches)
+        await batcher.stop()
+        return flushed
+
+    assert asyncio.run(run()) == [['a', 'b']]
+
+
+def test_failed_batch_does_not_stop_the_drainer():
+    async def run():
+        batches = []
+
+        async def consume_batch(batch: list) -> None:
+            if batch == ['bad']:
+                raise RuntimeError('Consumer failed')
+            batches.append(batch)
+
+        batcher = TokenBatcher(
+            settings=BatchSettings(enabled=True, max_batch_size=1), consume_batch=consume_batch,
+        )
+        batcher.start()
+        await batcher.put('bad')
+        await batcher.put('good')
+        await batcher.stop()
+        # Consumed right away after shutdown
+        await batcher.put('late')
+        return batches
+
+    assert asyncio.run(run()) == [['good'], ['late']]
+
+
+def test_handler_consumes_queued_tokens_on_cleanup():
+    async def run():
+        consumer = RecordingConsumer(custom_settings={})
+        async with serve(make_mock_app(MockSettings())) as mock_url:
+            handler = NotionOAuthHandler(
+                consumer=consumer,
+                client_id='client-id',
+                client_secret='client-secret',
+                base_url=mock_url,
+                batch_settings=BatchSettings(enabled=True, flush_interval=10),
+            )
+            await handler.startup()
+            token_infos = [await handler.handle_auth(redirect_info=make_redirect_info()) for _ in range(3)]
+            consumed_before_cleanup = list(consumer.batches)
+            await handler.cleanup()
+        return [token_info.access_token for token_info in token_infos], consumed_before_cleanup, consumer.batches
+
+    access_tokens, consumed_before_cleanup, batches = asyncio.run(run())
+    assert consumed_before_cleanup == []
+    assert batches == [access_tokens]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.circuit_breaker import CircuitBreaker, CircuitBreakerSettings, CircuitState
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+
+from helpers import make_redirect_info, serve
+
+
+OPEN_DURATION = 0.05
+
+
+def _make_breaker(**kwargs) -> CircuitBreaker:
+    return CircuitBreaker(settings=CircuitBreakerSettings(
+        enabled=True, min_calls=2, failure_rate=0.5, open_duration=OPEN_DURATION, **kwargs,
+    ))
+
+
+def _call(breaker: CircuitBreaker, failed: bool) -> None:
+    with breaker.call() as call_outcome:
+        call_outcome.failed = failed
+
+
+def _trip(breaker: CircuitBreaker) -> None:
+    with pytest.raises(RuntimeError):
+        with breaker.call():
+            raise RuntimeError('Upstream failed')
+    _call(breaker, failed=True)
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_failures_open_the_circuit():
+    breaker = _make_breaker()
+    _call(breaker, failed=False)
+    _call(breaker, failed=False)
+    assert breaker.state == CircuitState.CLOSED
+    _trip(breaker)
+    with pytest.raises(exc.CircuitOpen) as exc_info:
+        _call(breaker, failed=False)
+    assert exc_info.value.retry_after == 1
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = _make_breaker()
+    _trip(breaker)
+    time.sleep(OPEN_DURATION + 0.01)
+    assert breaker.state == CircuitState.HALF_OPEN
+    _call(breaker, failed=True)
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(exc.CircuitOpen):
+        _call(breaker, failed=False)
+
+
+def test_successful_probes_close_the_circuit():
+    breaker = _make_breaker(half_open_max_calls=2)
+    _trip(breaker)
+    time.sleep(OPEN_DURATION + 0.01)
+    _call(breaker, failed=False)
+    assert breaker.state == CircuitState.HALF_OPEN
+    _call(breaker, failed=False)
+    assert breaker.state == CircuitState.CLOSED
+    # The failures from before are forgotten
+    _call(breaker, failed=True)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_malformed_token_responses_open_the_circuit():
+    async def token_view(_request: web.Request) -> web.Response:
+        return web.json_response({'access_token': 'token'})  # The other fields are missing
+
+    async def request_tokens() -> list[Exception]:
+        app = web.Application()
+        app.router.add_post('/v1/oauth/token', token_view)
+        errors = []
+        async with serve(app) as base_url:
+            handler = NotionOAuthHandler(
+                consumer=DummyNotionOAuthConsumer(custom_settings={}),
+                client_id='client-id',
+                client_secret='client-secret',
+                base_url=base_url,
+                circuit_breaker_settings=CircuitBreakerSettings(enabled=True, min_calls=2),
+            )
+            try:
+                for _ in range(3):
+                    try:
+                        await handler.handle_auth(redirect_info=make_redirect_info())
+                    except (exc.InvalidTokenResponse, exc.CircuitOpen) as err:
+                        errors.append(err)
+            finally:
+                await handler.cleanup()
+        return errors
+
+    errors = asyncio.run(request_tokens())
+    assert [type(err) for err in errors] == [exc.InvalidTokenResponse, exc.InvalidTokenResponse, exc.CircuitOpen]
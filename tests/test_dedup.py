@@ -0,0 +1,97 @@
+import asyncio
+
+import attr
+import pytest
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.consumer import SignedStateNotionOAuthConsumer
+from notion_oauth_handler.core.dedup import SingleFlight
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+
+from helpers import make_redirect_info, serve
+
+
+@attr.s
+class RecordingConsumer(SignedStateNotionOAuthConsumer):
+    consumed: list = attr.ib(init=False, factory=list)
+
+    async def consume_token_info(self, token_info, state_info) -> None:
+        self.consumed.append((token_info, state_info.payload))
+
+
+def _make_consumer() -> RecordingConsumer:
+    return RecordingConsumer(custom_settings={'state_keys': 'k1:secret'})
+
+
+async def _run_with_handler(func):
+    consumer = _make_consumer()
+    async with serve(make_mock_app(MockSettings(one_time_codes=True))) as mock_url:
+        handler = NotionOAuthHandler(consumer=consumer, client_id='id', client_secret='secret', base_url=mock_url)
+        try:
+            return await func(handler, consumer)
+        finally:
+            await handler.cleanup()
+
+
+def test_replays_with_the_same_code_and_state_share_the_exchange():
+    async def replay(handler, consumer):
+        redirect_info = make_redirect_info(code='code', state=consumer.state_codec.encode('user-1'))
+        results = await asyncio.gather(*[handler.handle_auth(redirect_info=redirect_info) for _ in range(3)])
+        results.append(await handler.handle_auth(redirect_info=redirect_info))
+        return results, consumer.consumed
+
+    results, consumed = asyncio.run(_run_with_handler(replay))
+    assert len({token_info.access_token for token_info in results}) == 1
+    assert [payload for _, payload in consumed] == ['user-1']
+
+
+def test_replay_with_a_forged_state_is_checked():
+    async def replay(handler, consumer):
+        valid_state = consumer.state_codec.encode('user-1')
+        await handler.handle_auth(redirect_info=make_redirect_info(code='code', state=valid_state))
+        forged_state = valid_state[:-2] + ('AA' if not valid_state.endswith('AA') else 'BB')
+        await handler.handle_auth(redirect_info=make_redirect_info(code='code', state=forged_state))
+
+    with pytest.raises(exc.InvalidState):
+        asyncio.run(_run_with_handler(replay))
+
+
+def test_cancelled_leader_does_not_cancel_the_duplicates():
+    async def run():
+        single_flight = SingleFlight()
+        calls = []
+
+        async def exchange():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'token'
+
+        leader = asyncio.create_task(single_flight.run('key', exchange))
+        duplicate = asyncio.create_task(single_flight.run('key', exchange))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await duplicate, leader.cancelled(), len(calls)
+
+    assert asyncio.run(run()) == ('token', True, 1)
+
+
+def test_call_is_cancelled_with_its_last_caller():
+    async def run():
+        single_flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def exchange():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(single_flight.run('key', exchange)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    asyncio.run(run())
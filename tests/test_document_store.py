@@ -0,0 +1,30 @@
+import gzip
+import os
+
+from notion_oauth_handler.server.document_store import load_document
+
+
+def _write(path, data: bytes, mtime: float) -> None:
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+
+
+def test_fresh_precompressed_sibling_is_used(tmp_path):
+    doc_path = tmp_path / 'doc.html'
+    _write(doc_path, b'<p>Privacy policy</p>' * 100, mtime=1000)
+    _write(tmp_path / 'doc.html.gz', b'precompressed', mtime=1000)
+
+    document = load_document(str(doc_path))
+
+    assert document.variants['gzip'].body == b'precompressed'
+
+
+def test_stale_precompressed_sibling_is_ignored(tmp_path):
+    doc_path = tmp_path / 'doc.html'
+    body = b'<p>Updated privacy policy</p>' * 100
+    _write(doc_path, body, mtime=2000)
+    _write(tmp_path / 'doc.html.gz', gzip.compress(b'<p>Old privacy policy</p>'), mtime=1000)
+
+    document = load_document(str(doc_path))
+
+    assert gzip.decompress(document.variants['gzip'].body) == body
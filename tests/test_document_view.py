@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+from notion_oauth_handler.server.config import DocumentConfig
+from notion_oauth_handler.server.document_view import document_view_factory
+
+from helpers import serve
+
+
+def _make_app(doc_config: DocumentConfig) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/privacy', document_view_factory(doc_config, serve_path='/privacy'))
+    return app
+
+
+async def _get_all(app: web.Application, headers_list: list[dict]) -> list[aiohttp.ClientResponse]:
+    responses = []
+    async with serve(app) as base_url, aiohttp.ClientSession(auto_decompress=False) as session:
+        for headers in headers_list:
+            async with session.get(f'{base_url}/privacy', headers=headers) as response:
+                await response.read()
+                responses.append(response)
+    return responses
+
+
+def test_conditional_requests_get_304(tmp_path):
+    doc_path = tmp_path / 'privacy.html'
+    doc_path.write_bytes(b'<p>Privacy policy</p>')
+    app = _make_app(DocumentConfig(filename=str(doc_path), content_type='text/html', max_age=60))
+
+    async def run():
+        [first] = await _get_all(app, [{'Accept-Encoding': 'identity'}])
+        return [first, *await _get_all(app, [
+            {'Accept-Encoding': 'identity', 'If-None-Match': first.headers['ETag']},
+            {'Accept-Encoding': 'identity', 'If-Modified-Since': first.headers['Last-Modified']},
+            {'Accept-Encoding': 'identity', 'If-None-Match': '"other"'},
+        ])]
+
+    first, by_etag, by_date, other_etag = asyncio.run(run())
+    assert first.status == 200
+    assert first.headers['Cache-Control'] == 'public, max-age=60'
+    assert by_etag.status == 304 and by_etag.headers['ETag'] == first.headers['ETag']
+    assert by_date.status == 304
+    assert other_etag.status == 200
+
+
+def test_modified_document_is_reloaded(tmp_path):
+    doc_path = tmp_path / 'privacy.html'
+    doc_path.write_bytes(b'<p>Old privacy policy</p>')
+    os.utime(doc_path, (1000, 1000))
+    app = _make_app(DocumentConfig(filename=str(doc_path), content_type='text/html', reload_interval=0.01))
+
+    async def run():
+        [old] = await _get_all(app, [{'Accept-Encoding': 'identity'}])
+        doc_path.write_bytes(b'<p>New privacy policy</p>')
+        os.utime(doc_path, (time.time(), time.time()))
+        await asyncio.sleep(0.02)
+        [new] = await _get_all(app, [{'Accept-Encoding': 'identity'}])
+        return old, new
+
+    old, new = asyncio.run(run())
+    assert old.headers['ETag'] != new.headers['ETag']
+    assert new.headers['Content-Length'] == str(len(b'<p>New privacy policy</p>'))
@@ -0,0 +1,41 @@
+import pickle
+
+import attr
+import pytest
+
+from notion_oauth_handler.core.dto import TokenResponseInfo
+
+
+OWNER_PAYLOAD = {
+    'type': 'user',
+    'user': {'id': 'user-1', 'name': 'User', 'avatar_url': None, 'person': {'email': 'user@example.com'}},
+}
+
+
+def _make_token_info() -> TokenResponseInfo:
+    return TokenResponseInfo(
+        access_token='secret', workspace_id='workspace', workspace_name=None, workspace_icon=None,
+        bot_id='bot', owner=OWNER_PAYLOAD,
+    )
+
+
+def test_owner_is_kept_read_only():
+    token_info = _make_token_info()
+    assert token_info.owner == OWNER_PAYLOAD
+    with pytest.raises(TypeError):
+        token_info.owner['type'] = 'workspace'  # type: ignore[index]
+    assert token_info.owner_info.email == 'user@example.com'
+    assert "'user-1'" in repr(token_info)
+
+
+def test_attrs_helpers_work():
+    token_info = _make_token_info()
+    assert attr.evolve(token_info, access_token='other').owner == OWNER_PAYLOAD
+    assert TokenResponseInfo(**attr.asdict(token_info)) == token_info
+
+
+def test_serialization_round_trips():
+    token_info = _make_token_info()
+    for restored in (TokenResponseInfo.from_bytes(token_info.to_bytes()), pickle.loads(pickle.dumps(token_info))):
+        assert restored == token_info
+        assert restored.owner == OWNER_PAYLOAD
@@ -0,0 +1,36 @@
+from importlib import metadata
+
+import pytest
+
+import notion_oauth_handler.entrypoints as entrypoints
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    entrypoints.clear_entrypoint_cache()
+    yield
+    entrypoints.clear_entrypoint_cache()
+
+
+def test_entrypoints_are_discovered_once(monkeypatch):
+    calls = []
+    entry_points = metadata.entry_points
+
+    def counting_entry_points(**kwargs):
+        calls.append(kwargs)
+        return entry_points(**kwargs)
+
+    monkeypatch.setattr(metadata, 'entry_points', counting_entry_points)
+    for _ in range(3):
+        assert entrypoints.get_consumer_cls('dummy') is DummyNotionOAuthConsumer
+        assert entrypoints.get_auth_view_cls('default') is DefaultNotionOAuthRedirectView
+    assert len(calls) == 2  # One per group
+    assert 'dummy' in entrypoints.list_entrypoint_item_names(entrypoints.CONSUMER_ENTRYPOINT_NAME)
+    assert len(calls) == 2
+
+
+def test_missing_entrypoint_lists_the_available_ones():
+    with pytest.raises(entrypoints.EntrypointNotFound, match='dummy'):
+        entrypoints.get_consumer_cls('missing')
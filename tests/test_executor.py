@@ -0,0 +1,55 @@
+import asyncio
+import os
+from pathlib import Path
+
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.dto import TokenResponseInfo
+from notion_oauth_handler.core.executor import ExecutorSettings, HookExecutor
+from notion_oauth_handler.core.resources import ResourceContainer
+
+from helpers import make_redirect_info
+
+
+class ProcessConsumer(DefaultNotionOAuthConsumer):
+    """Records its lifecycle in a file, so that the test process can see it"""
+
+    _resources: ResourceContainer
+
+    def _log(self, line: str) -> None:
+        with open(self.custom_settings['log_path'], 'a') as log_file:
+            log_file.write(f'{line}\n')
+
+    async def on_startup(self, resources: ResourceContainer) -> None:
+        self._resources = resources
+        resources.add('pid', os.getpid(), close=lambda pid: self._log(f'closed {pid}'))
+        self._log('startup')
+
+    async def on_cleanup(self, resources: ResourceContainer) -> None:
+        self._log('cleanup')
+
+    def consume_token_info(self, token_info: TokenResponseInfo, state_info: object) -> None:
+        self._log(f'consumed {self._resources["pid"]}')
+
+
+def test_process_workers_run_lifecycle_hooks(tmp_path: Path):
+    log_path = tmp_path / 'log'
+    consumer = ProcessConsumer(custom_settings={'log_path': str(log_path)})
+    executor = HookExecutor(settings=ExecutorSettings(process_workers=1), consumer=consumer)
+
+    async def run() -> None:
+        await executor.run(
+            'consume_token_info',
+            token_info=TokenResponseInfo(
+                access_token='secret', workspace_id='workspace', workspace_name=None, workspace_icon=None,
+                bot_id='bot', owner={'type': 'workspace'},
+            ),
+            state_info=make_redirect_info(),
+        )
+        await executor.shutdown()
+
+    asyncio.run(run())
+    lines = log_path.read_text().splitlines()
+    assert lines[0] == 'startup'
+    worker_pid = int(lines[1].split()[1])
+    assert worker_pid != os.getpid()
+    assert lines[1:] == [f'consumed {worker_pid}', 'cleanup', f'closed {worker_pid}']
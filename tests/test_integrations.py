@@ -0,0 +1,69 @@
+import asyncio
+
+import aiohttp
+import attr
+
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.metrics import MetricsRegistry
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+from notion_oauth_handler.server.app import Integration, make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+
+from helpers import serve
+
+
+@attr.s
+class RecordingConsumer(DefaultNotionOAuthConsumer):
+    consumed: list = attr.ib(init=False, factory=list)
+
+    async def consume_token_info(self, token_info, state_info) -> None:
+        self.consumed.append(token_info.access_token)
+
+
+class SettingsView(DefaultNotionOAuthRedirectView):
+    async def make_access_denied_response(self, error_text: str):
+        return self.make_response(text=self.custom_settings['name'], status=403)
+
+
+def test_integrations_have_their_own_credentials_consumers_and_settings():
+    main_consumer = RecordingConsumer(custom_settings={})
+    other_consumer = RecordingConsumer(custom_settings={})
+    registry = MetricsRegistry()
+
+    async def run():
+        # The mock only accepts the credentials of the other integration
+        mock_settings = MockSettings(client_id='other-id', client_secret='other-secret')
+        async with serve(make_mock_app(mock_settings)) as mock_url:
+            app = make_app(
+                consumer=main_consumer,
+                auth_view_cls=SettingsView,
+                notion_client_id='main-id',
+                notion_client_secret='main-secret',
+                notion_base_url=mock_url,
+                custom_settings={'name': 'main'},
+                metrics_registry=registry,
+                integrations=[Integration(
+                    name='other',
+                    consumer=other_consumer,
+                    auth_view_cls=SettingsView,
+                    notion_client_id='other-id',
+                    notion_client_secret='other-secret',
+                    auth_path='/other-auth',
+                    custom_settings={'name': 'other'},
+                )],
+            )
+            results = []
+            async with serve(app) as base_url, aiohttp.ClientSession() as session:
+                for path in ('/auth', '/other-auth'):
+                    async with session.get(f'{base_url}{path}?code=code-{path[1:]}') as response:
+                        results.append(response.status)
+                    async with session.get(f'{base_url}{path}?error=access_denied') as response:
+                        results.append(await response.text())
+            return results
+
+    assert asyncio.run(run()) == [400, 'main', 200, 'other']
+    assert main_consumer.consumed == []
+    assert len(other_consumer.consumed) == 1
+    metrics_lines = registry.render().splitlines()
+    assert 'notion_oauth_redirects_total{outcome="token_failed"} 1' in metrics_lines
+    assert 'notion_oauth_redirects_total{integration="other",outcome="ok"} 1' in metrics_lines
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.limiter import ConcurrencyLimiter, ConcurrencySettings
+
+
+def _make_limiter(**kwargs) -> ConcurrencyLimiter:
+    return ConcurrencyLimiter(settings=ConcurrencySettings(max_in_flight=1, **kwargs))
+
+
+def test_waiters_get_the_slot_in_order():
+    async def run():
+        limiter = _make_limiter()
+        order = []
+
+        async def operation(name: str) -> None:
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(operation(name) for name in 'abc'))
+        return order, limiter.in_flight, limiter.queue_depth
+
+    assert asyncio.run(run()) == (['a', 'b', 'c'], 0, 0)
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        limiter = _make_limiter(max_queue=1, retry_after=3)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(exc.HandlerOverloaded) as exc_info:
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        return exc_info.value.retry_after, limiter.in_flight
+
+    assert asyncio.run(run()) == (3, 1)
+
+
+def test_queue_timeout_is_rejected_and_frees_the_place():
+    async def run():
+        limiter = _make_limiter(queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(exc.HandlerOverloaded):
+            await limiter.acquire()
+        return limiter.queue_depth
+
+    assert asyncio.run(run()) == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        limiter = _make_limiter()
+        await limiter.acquire()
+        cancelled = asyncio.create_task(limiter.acquire())
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert limiter.queue_depth == 1
+        limiter.release()
+        await asyncio.wait_for(waiting, timeout=1)
+        limiter.release()
+        return limiter.in_flight, limiter.queue_depth
+
+    assert asyncio.run(run()) == (0, 0)
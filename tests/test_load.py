@@ -0,0 +1,26 @@
+import asyncio
+
+from notion_oauth_handler.bench.load import LoadBenchmark, LoadSettings
+
+
+REQUEST_DURATION = 0.05
+
+
+async def _drive(settings: LoadSettings):
+    async def make_request() -> str:
+        await asyncio.sleep(REQUEST_DURATION)
+        return '200'
+
+    return await LoadBenchmark(settings=settings)._drive(None, 'auth', make_request)
+
+
+def test_open_loop_latency_includes_time_queued_behind_the_limit():
+    # Scheduled every 10 ms, but only one at a time: each one waits for the ones before it
+    result = asyncio.run(_drive(LoadSettings(concurrency=1, requests=5, rate=100)))
+    assert result.statuses == {'200': 5}
+    assert max(result.latencies) >= 5 * REQUEST_DURATION - 4 * 0.01
+
+
+def test_closed_loop_latency_is_the_request_duration():
+    result = asyncio.run(_drive(LoadSettings(concurrency=1, requests=3)))
+    assert max(result.latencies) < 2 * REQUEST_DURATION
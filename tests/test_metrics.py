@@ -0,0 +1,56 @@
+import asyncio
+
+import aiohttp
+
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.core.metrics import MetricsRegistry
+from notion_oauth_handler.server.app import make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+
+from helpers import serve
+
+
+def test_metrics_are_rendered_in_the_text_format():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests by path', ('path',))
+    counter.inc(('/a"b',))
+    counter.inc(('/a"b',), amount=2)
+    histogram = registry.histogram('duration_seconds', 'Duration', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    registry.labeled(integration='other').counter('requests_total', 'Requests by path', ('path',)).inc(('/c',))
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests by path',
+        '# TYPE requests_total counter',
+        'requests_total{path="/a\\"b"} 3',
+        'requests_total{integration="other",path="/c"} 1',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{le="0.1"} 1',
+        'duration_seconds_bucket{le="1"} 2',
+        'duration_seconds_bucket{le="+Inf"} 2',
+        'duration_seconds_sum 0.55',
+        'duration_seconds_count 2',
+    ]
+
+
+def test_redirects_are_counted_on_the_metrics_endpoint():
+    async def run():
+        app = make_app(
+            consumer=DummyNotionOAuthConsumer(custom_settings={}),
+            auth_view_cls=DefaultNotionOAuthRedirectView,
+            notion_client_id='client-id',
+            notion_client_secret='client-secret',
+            custom_settings={},
+            metrics_path='/metrics',
+        )
+        async with serve(app) as base_url, aiohttp.ClientSession() as session:
+            async with session.get(f'{base_url}/auth?error=access_denied') as response:
+                assert response.status == 403
+            async with session.get(f'{base_url}/metrics') as response:
+                return response.headers['Content-Type'], await response.text()
+
+    content_type, text = asyncio.run(run())
+    assert content_type.startswith('text/plain; version=0.0.4')
+    assert 'notion_oauth_redirects_total{outcome="access_denied"} 1' in text.splitlines()
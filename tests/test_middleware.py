@@ -0,0 +1,54 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.server.middleware import (
+    CUSTOM_SETTINGS_REQUEST_KEY, OAUTH_HANDLER_REQUEST_KEY, IntegrationContext, notion_oauth_middleware_factory,
+)
+
+from helpers import serve
+
+
+async def _get_request_data(middleware) -> tuple:
+    seen = []
+
+    async def view(request: web.Request) -> web.Response:
+        seen.append((request[OAUTH_HANDLER_REQUEST_KEY].consumer, request[CUSTOM_SETTINGS_REQUEST_KEY]))
+        return web.Response()
+
+    app = web.Application(middlewares=[middleware])
+    app.router.add_get('/', view)
+    async with serve(app) as base_url, aiohttp.ClientSession() as session:
+        async with session.get(base_url) as response:
+            assert response.status == 200
+    return seen[0]
+
+
+def test_context_is_set_on_requests():
+    consumer = DummyNotionOAuthConsumer(custom_settings={'a': 1})
+    handler = NotionOAuthHandler(consumer=consumer, client_id='client-id', client_secret='secret')
+    middleware = notion_oauth_middleware_factory(
+        default_context=IntegrationContext(oauth_handler=handler, custom_settings={'a': 1}),
+    )
+    assert asyncio.run(_get_request_data(middleware)) == (consumer, {'a': 1})
+
+
+def test_deprecated_arguments_are_still_accepted():
+    consumer = DummyNotionOAuthConsumer(custom_settings={'a': 1})
+    with pytest.warns(DeprecationWarning):
+        middleware = notion_oauth_middleware_factory(
+            notion_client_id='client-id',
+            notion_client_secret='secret',
+            consumer=consumer,
+            custom_settings={'a': 1},
+        )
+    assert asyncio.run(_get_request_data(middleware)) == (consumer, {'a': 1})
+
+
+def test_context_or_credentials_are_required():
+    with pytest.raises(TypeError):
+        notion_oauth_middleware_factory(notion_client_id='client-id')
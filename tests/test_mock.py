@@ -0,0 +1,63 @@
+import asyncio
+import base64
+
+import aiohttp
+import pytest
+
+from notion_oauth_handler.mock.app import LATENCY_DISTRIBUTIONS, MockSettings, UsedCodeRegistry, make_mock_app
+
+from helpers import serve
+
+
+def _basic_auth(client_id: str, client_secret: str) -> str:
+    return 'Basic ' + base64.b64encode(f'{client_id}:{client_secret}'.encode()).decode()
+
+
+_AUTH = _basic_auth('client-id', 'client-secret')
+_BODY = {'grant_type': 'authorization_code', 'code': 'code', 'redirect_uri': 'http://localhost/auth'}
+
+
+async def _post_all(mock_settings: MockSettings, requests: list[tuple[str, dict]]) -> list[tuple]:
+    results = []
+    async with serve(make_mock_app(mock_settings)) as mock_url, aiohttp.ClientSession() as session:
+        for auth, body in requests:
+            async with session.post(f'{mock_url}/v1/oauth/token', json=body, headers={'Authorization': auth}) as response:
+                data = await response.json()
+                results.append((response.status, data.get('error'), response.headers.get('Retry-After')))
+    return results
+
+
+def test_codes_are_accepted_once_and_credentials_are_checked():
+    settings = MockSettings(client_id='client-id', client_secret='client-secret')
+    results = asyncio.run(_post_all(settings, [
+        (_AUTH, _BODY),
+        (_AUTH, _BODY),
+        (_basic_auth('client-id', 'wrong'), {**_BODY, 'code': 'other'}),
+        (_AUTH, {**_BODY, 'grant_type': 'password'}),
+    ]))
+    assert [(status, error) for status, error, _ in results] == [
+        (200, None), (400, 'invalid_grant'), (401, 'invalid_client'), (400, 'unsupported_grant_type'),
+    ]
+
+
+def test_rate_limit_fault_has_retry_after():
+    results = asyncio.run(_post_all(MockSettings(rate_limit_rate=1.0, retry_after=7), [(_AUTH, _BODY)]))
+    assert results == [(429, 'rate_limited', '7')]
+
+
+def test_used_codes_are_bounded():
+    registry = UsedCodeRegistry(max_size=2)
+    assert all(registry.use(code) for code in 'abc')
+    assert registry.use('a')  # Forgotten
+    assert not registry.use('c')
+
+
+@pytest.mark.parametrize('distribution', LATENCY_DISTRIBUTIONS)
+def test_latency_distributions_give_non_negative_delays(distribution):
+    settings = MockSettings(latency_distribution=distribution, delay=0.01, delay_spread=0.5)
+    assert all(settings.get_delay() >= 0 for _ in range(100))
+
+
+def test_unknown_latency_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        MockSettings(latency_distribution='normal')
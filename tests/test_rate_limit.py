@@ -0,0 +1,65 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.server.app import make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+from notion_oauth_handler.server.rate_limit import RateLimitSettings, TokenBucketLimiter, parse_networks
+
+from helpers import serve
+
+
+async def _get_statuses(rate_limit_settings: RateLimitSettings, headers_list: list[dict]) -> list[tuple[int, str]]:
+    app = make_app(
+        consumer=DummyNotionOAuthConsumer(custom_settings={}),
+        auth_view_cls=DefaultNotionOAuthRedirectView,
+        notion_client_id='id',
+        notion_client_secret='secret',
+        custom_settings={},
+        rate_limit_settings=rate_limit_settings,
+    )
+    results = []
+    async with serve(app) as base_url, aiohttp.ClientSession() as session:
+        for headers in headers_list:
+            async with session.get(f'{base_url}/auth?error=access_denied', headers=headers) as response:
+                results.append((response.status, response.headers.get('Retry-After', '')))
+    return results
+
+
+def test_requests_over_the_burst_get_429_with_retry_after():
+    settings = RateLimitSettings(enabled=True, auth_rate=0.5, auth_burst=2)
+    results = asyncio.run(_get_statuses(settings, [{}] * 3))
+    assert results == [(403, ''), (403, ''), (429, '2')]
+
+
+def test_forwarded_clients_are_limited_separately_behind_a_trusted_proxy():
+    settings = RateLimitSettings(
+        enabled=True, auth_rate=0.5, auth_burst=1, trusted_proxies=parse_networks('127.0.0.1'),
+    )
+    headers_list = [
+        {'X-Forwarded-For': '203.0.113.1'},
+        {'X-Forwarded-For': '203.0.113.2'},
+        # The client can not pass for another one by prepending an address
+        {'X-Forwarded-For': '203.0.113.2, 203.0.113.1'},
+    ]
+    statuses = [status for status, _ in asyncio.run(_get_statuses(settings, headers_list))]
+    assert statuses == [403, 403, 429]
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'auth_rate': 0},
+    {'document_rate': -1},
+    {'auth_burst': 0},
+    {'document_burst': 0},
+])
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        RateLimitSettings(**kwargs)
+
+
+def test_limiter_waits_for_the_next_token():
+    limiter = TokenBucketLimiter(rate=2, burst=1)
+    assert limiter.acquire('client') == 0
+    assert 0 < limiter.acquire('client') <= 0.5
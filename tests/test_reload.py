@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+from notion_oauth_handler.server.app import (
+    APP_PARTS_APP_KEY, MAIN_INTEGRATION_NAME, make_app_from_prepared, prepare_app_components,
+)
+from notion_oauth_handler.server.config import load_config_from_file
+from notion_oauth_handler.server.reload import ConfigReloader
+
+from helpers import make_redirect_info, serve
+
+
+CONFIG_TEMPLATE = """
+[notion_oauth_handler]
+consumer = dummy
+auth_view = default
+custom_section = my_application
+
+[notion_oauth_handler.server]
+auth_path = {auth_path}
+
+[notion_oauth_handler.notion]
+client_id = client-id
+client_secret = {client_secret}
+base_url = {base_url}
+
+[my_application]
+setting = {setting}
+"""
+
+
+def _write_config(
+        path, base_url: str, auth_path: str = '/auth', client_secret: str = 'secret', setting: str = 'a',
+) -> None:
+    path.write_text(CONFIG_TEMPLATE.format(
+        auth_path=auth_path, client_secret=client_secret, setting=setting, base_url=base_url,
+    ))
+
+
+def test_reload_applies_hot_changes_and_keeps_reporting_the_others(tmp_path, caplog):
+    config_path = tmp_path / 'config.ini'
+
+    async def reload_twice():
+        # The mock accepts only the new secret
+        mock_settings = MockSettings(client_id='client-id', client_secret='new-secret')
+        async with serve(make_mock_app(mock_settings)) as mock_url:
+            _write_config(config_path, base_url=mock_url)
+            config = load_config_from_file(str(config_path))
+            components = prepare_app_components(config)
+            app = make_app_from_prepared(config, components)
+            reloader = ConfigReloader(
+                app_parts=app[APP_PARTS_APP_KEY], filename=str(config_path), config=config, components=components,
+            )
+            context = app[APP_PARTS_APP_KEY].integrations[MAIN_INTEGRATION_NAME]
+            _write_config(
+                config_path, base_url=mock_url, auth_path='/other-auth', client_secret='new-secret', setting='b',
+            )
+            changed = [await reloader.reload()]
+            changed.append(await reloader.reload())
+            try:
+                token_info = await context.oauth_handler.handle_auth(redirect_info=make_redirect_info())
+            finally:
+                await context.oauth_handler.cleanup()
+            return changed, token_info.access_token, context
+
+    with caplog.at_level(logging.WARNING, logger='notion_oauth_handler.server.reload'):
+        changed, access_token, context = asyncio.run(reload_twice())
+
+    assert changed == [True, True]
+    assert access_token
+    assert context.custom_settings == {'setting': 'b'}
+    assert context.oauth_handler.consumer.custom_settings == {'setting': 'b'}
+    restart_warnings = [record.message for record in caplog.records if 'require a restart' in record.message]
+    assert len(restart_warnings) == 2
+    assert all('auth_path' in message for message in restart_warnings)
+    assert all('custom_settings' not in message for message in restart_warnings)
@@ -0,0 +1,79 @@
+import asyncio
+
+import aiohttp
+import attr
+
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.resources import ResourceContainer
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+from notion_oauth_handler.server.app import make_app
+from notion_oauth_handler.server.auth_view import DefaultNotionOAuthRedirectView
+
+from helpers import serve
+
+
+@attr.s
+class LifecycleConsumer(DefaultNotionOAuthConsumer):
+    events: list = attr.ib(init=False, factory=list)
+
+    async def on_startup(self, resources: ResourceContainer) -> None:
+        self.events.append('startup')
+
+        async def close_pool(pool: str) -> None:
+            self.events.append(f'close {pool}')
+
+        resources.add('pool', 'pool', close=close_pool)
+        resources.add('cache', 'cache', close=lambda cache: self.events.append(f'close {cache}'))
+
+    async def on_cleanup(self, resources: ResourceContainer) -> None:
+        self.events.append(f'cleanup with {resources["pool"]}')
+
+    async def consume_token_info(self, token_info, state_info) -> None:
+        self.events.append('consume')
+
+
+class ResourcesView(DefaultNotionOAuthRedirectView):
+    async def make_auth_response(self, token_info):
+        return self.make_response(text=self.resources['pool'])
+
+
+def test_hooks_and_resources_follow_the_app_lifecycle():
+    consumer = LifecycleConsumer(custom_settings={})
+
+    async def run():
+        async with serve(make_mock_app(MockSettings())) as mock_url:
+            app = make_app(
+                consumer=consumer,
+                auth_view_cls=ResourcesView,
+                notion_client_id='client-id',
+                notion_client_secret='client-secret',
+                notion_base_url=mock_url,
+                custom_settings={},
+            )
+            async with serve(app) as base_url, aiohttp.ClientSession() as session:
+                async with session.get(f'{base_url}/auth?code=code') as response:
+                    return await response.text()
+
+    assert asyncio.run(run()) == 'pool'
+    # The resources are closed after the consumer's cleanup, in the reverse order
+    assert consumer.events == ['startup', 'consume', 'cleanup with pool', 'close cache', 'close pool']
+
+
+def test_failed_close_does_not_stop_the_others():
+    closed = []
+
+    def fail(resource):
+        raise RuntimeError('Close failed')
+
+    async def run():
+        resources = ResourceContainer()
+        resources.add('a', 'a', close=closed.append)
+        resources.add('b', 'b', close=fail)
+        created = await resources.get_or_create('c', lambda: asyncio.sleep(0, 'c'), close=closed.append)
+        # Shared with another consumer instead of being created again
+        shared = await resources.get_or_create('c', lambda: asyncio.sleep(0, 'other'))
+        await resources.close()
+        return created, shared, 'a' in resources
+
+    assert asyncio.run(run()) == ('c', 'c', False)
+    assert closed == ['c', 'a']
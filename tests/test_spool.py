@@ -0,0 +1,81 @@
+import asyncio
+import os
+import stat
+
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.core.dto import TokenResponseInfo
+from notion_oauth_handler.core.spool import SpoolSettings, TokenSpool
+
+from helpers import make_redirect_info
+
+
+def _make_token_info(index: int) -> TokenResponseInfo:
+    return TokenResponseInfo(
+        access_token=f'secret_{index}',
+        workspace_id=f'workspace-{index}',
+        workspace_name='Workspace',
+        workspace_icon=None,
+        bot_id=f'bot-{index}',
+        owner={'type': 'workspace', 'workspace': True},
+    )
+
+
+def _make_spool(path, replayed: list, **settings_kwargs) -> TokenSpool:
+    consumer = DummyNotionOAuthConsumer(custom_settings={})
+
+    async def replay(token_info, state_info) -> None:
+        replayed.append((token_info, state_info))
+
+    return TokenSpool(
+        settings=SpoolSettings(path=str(path), replay_interval=0.01, **settings_kwargs),
+        replay=replay,
+        dump_state_info=consumer.dump_state_info,
+        load_state_info=consumer.load_state_info,
+    )
+
+
+async def _restart(path) -> list:
+    replayed: list = []
+    spool = _make_spool(path, replayed)
+    await spool.start()
+    await asyncio.sleep(0.05)
+    await spool.stop()
+    return replayed
+
+
+def test_pending_entries_are_replayed_after_restart(tmp_path):
+    path = tmp_path / 'tokens.spool'
+    state_info = make_redirect_info(code='code-1')
+
+    async def run() -> list:
+        spool = _make_spool(path, [])
+        await spool.start()
+        consumed_id = await spool.append(_make_token_info(0), state_info=make_redirect_info())
+        await spool.append(_make_token_info(1), state_info=state_info)
+        spool.ack(consumed_id)
+        await spool.stop()
+        return await _restart(path)
+
+    replayed = asyncio.run(run())
+    assert replayed == [(_make_token_info(1), state_info)]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_compaction_keeps_entries_that_are_being_appended(tmp_path):
+    path = tmp_path / 'tokens.spool'
+
+    async def run() -> list:
+        spool = _make_spool(path, [], compact_threshold=1, fsync_interval=0.01)
+        await spool.start()
+        consumed_id = await spool.append(_make_token_info(0), state_info=make_redirect_info())
+        pending_append = asyncio.create_task(spool.append(_make_token_info(1), state_info=make_redirect_info()))
+        await asyncio.sleep(0)  # The record is buffered, but not written yet
+        spool.ack(consumed_id)  # Starts a compaction right away
+        await pending_append
+        await asyncio.sleep(0.05)
+        await spool.stop()
+        return await _restart(path)
+
+    replayed = asyncio.run(run())
+    assert [token_info for token_info, _ in replayed] == [_make_token_info(1)]
+
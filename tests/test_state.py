@@ -0,0 +1,38 @@
+import pytest
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.state import StateCodec, parse_state_keys
+
+
+def _make_codec(keys: str = 'k1:secret', ttl: int = 600) -> StateCodec:
+    return StateCodec(keys=parse_state_keys(keys), ttl=ttl)
+
+
+def test_state_round_trips():
+    codec = _make_codec()
+    signed_state = codec.decode(codec.encode({'user_id': 'user-1'}))
+    assert signed_state.payload == {'user_id': 'user-1'}
+    assert signed_state.key_id == 'k1'
+
+
+def test_state_signed_with_a_rotated_key_is_accepted():
+    old_token = _make_codec('k1:old-secret').encode('payload')
+    assert _make_codec('k2:new-secret, k1:old-secret').decode(old_token).payload == 'payload'
+
+
+def _tamper_signature(token: str) -> str:
+    message, _, signature = token.rpartition('.')
+    return f'{message}.{"B" if signature[0] == "A" else "A"}{signature[1:]}'
+
+
+@pytest.mark.parametrize('make_token', [
+    lambda codec: _tamper_signature(codec.encode('payload')),
+    lambda codec: _make_codec('k1:other-secret').encode('payload'),
+    lambda codec: _make_codec('k3:secret').encode('payload'),  # Unknown key
+    lambda codec: codec.encode('payload', ttl=-1),  # Expired
+    lambda codec: 'garbage',
+])
+def test_untrusted_state_is_rejected(make_token):
+    codec = _make_codec()
+    with pytest.raises(exc.InvalidState):
+        codec.decode(make_token(codec))
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.consumer import DefaultNotionOAuthConsumer
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.core.timeouts import TimeoutSettings
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+
+from helpers import make_redirect_info, serve
+
+
+class SlowConsumer(DefaultNotionOAuthConsumer):
+    async def consume_token_info(self, token_info, state_info) -> None:
+        await asyncio.sleep(self.custom_settings['delay'])
+
+
+async def _handle_auth(mock_settings: MockSettings, timeouts: TimeoutSettings, consumer_delay: float = 0):
+    async with serve(make_mock_app(mock_settings)) as mock_url:
+        handler = NotionOAuthHandler(
+            consumer=SlowConsumer(custom_settings={'delay': consumer_delay}),
+            client_id='client-id',
+            client_secret='client-secret',
+            base_url=mock_url,
+            timeouts=timeouts,
+        )
+        try:
+            return await handler.handle_auth(redirect_info=make_redirect_info())
+        finally:
+            await handler.cleanup()
+
+
+def test_slow_token_request_times_out():
+    with pytest.raises(exc.OperationTimeout) as exc_info:
+        asyncio.run(_handle_auth(MockSettings(delay=1), TimeoutSettings(total=0.05)))
+    assert exc_info.value.operation == 'token_request'
+
+
+def test_slow_consumer_hook_times_out():
+    with pytest.raises(exc.OperationTimeout) as exc_info:
+        asyncio.run(_handle_auth(MockSettings(), TimeoutSettings(consumer=0.05), consumer_delay=1))
+    assert exc_info.value.operation == 'consume_token_info'
+    assert exc_info.value.timeout == 0.05
+
+
+def test_zero_disables_the_timeout():
+    token_info = asyncio.run(_handle_auth(MockSettings(), TimeoutSettings(consumer=0), consumer_delay=0.1))
+    assert token_info.access_token
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import notion_oauth_handler.core.exc as exc
+from notion_oauth_handler.core.consumer import DummyNotionOAuthConsumer
+from notion_oauth_handler.core.oauth_handler import NotionOAuthHandler
+from notion_oauth_handler.core.retry import RetryPolicy, RetrySettings
+from notion_oauth_handler.mock.app import MockSettings, make_mock_app
+
+from helpers import make_redirect_info, serve
+
+
+def _make_handler(base_url: str, **kwargs) -> NotionOAuthHandler:
+    return NotionOAuthHandler(
+        consumer=DummyNotionOAuthConsumer(custom_settings={}),
+        client_id='client-id',
+        client_secret='client-secret',
+        base_url=base_url,
+        retry_policy=RetryPolicy(settings=RetrySettings(max_attempts=2, base_delay=0, max_delay=0)),
+        **kwargs,
+    )
+
+
+async def _handle_auth(mock_settings: MockSettings, **handler_kwargs):
+    async with serve(make_mock_app(mock_settings)) as mock_url:
+        handler = _make_handler(mock_url, **handler_kwargs)
+        try:
+            return await handler.handle_auth(redirect_info=make_redirect_info()), handler
+        finally:
+            await handler.cleanup()
+
+
+def test_token_is_returned():
+    token_info, handler = asyncio.run(_handle_auth(MockSettings()))
+    assert token_info.access_token
+
+
+def test_connection_reset_is_reported_as_unavailable():
+    with pytest.raises(exc.NotionUnavailable):
+        asyncio.run(_handle_auth(MockSettings(reset_rate=1.0)))
+
+
+def test_persistent_upstream_errors_are_reported_as_unavailable():
+    with pytest.raises(exc.NotionUnavailable) as exc_info:
+        asyncio.run(_handle_auth(MockSettings(error_rate=1.0)))
+    assert not isinstance(exc_info.value, exc.CircuitOpen)
+
+
+def test_rejected_request_is_reported_as_failed():
+    # The mock rejects the wrong credentials with a 401
+    with pytest.raises(exc.TokenRequestFailed):
+        asyncio.run(_handle_auth(MockSettings(client_id='other-client-id')))
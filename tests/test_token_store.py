@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from notion_oauth_handler.core.dto import TokenResponseInfo
+from notion_oauth_handler.core.token_store import SQLiteTokenStore, TokenStoreSettings
+
+
+def _make_token_info(bot_id: str, workspace_id: str = 'workspace', user_id: str = 'user-1') -> TokenResponseInfo:
+    return TokenResponseInfo(
+        access_token=f'secret-{bot_id}', workspace_id=workspace_id, workspace_name=None, workspace_icon=None,
+        bot_id=bot_id, owner={'type': 'user', 'user': {'id': user_id}},
+    )
+
+
+def test_concurrent_saves_are_group_committed(tmp_path):
+    path = str(tmp_path / 'tokens.db')
+
+    async def run():
+        store = SQLiteTokenStore(settings=TokenStoreSettings(path=path))
+        write_sizes = []
+        write_rows = store._write_rows
+        first_write_started = asyncio.Event()
+        can_finish_first_write = threading.Event()
+        loop = asyncio.get_running_loop()
+
+        def counting_write_rows(rows):
+            write_sizes.append(len(rows))
+            if len(write_sizes) == 1:
+                loop.call_soon_threadsafe(first_write_started.set)
+                can_finish_first_write.wait(timeout=5)
+            write_rows(rows)
+
+        store._write_rows = counting_write_rows
+        first_save = asyncio.create_task(store.save(_make_token_info('bot-first')))
+        await first_write_started.wait()
+        other_saves = [asyncio.create_task(store.save(_make_token_info(f'bot-{i}'))) for i in range(9)]
+        await asyncio.sleep(0.01)
+        can_finish_first_write.set()
+        await asyncio.gather(first_save, *other_saves)
+        await store.close()
+        return write_sizes
+
+    write_sizes = asyncio.run(run())
+    # The saves that arrive while a transaction is being committed are committed together in the next one
+    assert write_sizes == [1, 9]
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM notion_tokens').fetchone() == (10,)
+
+
+def test_tokens_are_upserted_and_looked_up(tmp_path):
+    path = str(tmp_path / 'tokens.db')
+
+    async def run():
+        store = SQLiteTokenStore(settings=TokenStoreSettings(path=path))
+        await store.save(_make_token_info('bot-1', workspace_id='w1'))
+        await store.save(_make_token_info('bot-2', workspace_id='w2'))
+        await store.save(_make_token_info('bot-1', workspace_id='w3'))
+        await store.close()
+        # A new store has to read the database
+        reopened = SQLiteTokenStore(settings=TokenStoreSettings(path=path))
+        try:
+            return (
+                await reopened.get_by_bot_id('bot-1'),
+                await reopened.get_by_workspace_id('w1'),
+                await reopened.get_by_workspace_id('w2'),
+                [token_info.bot_id for token_info in await reopened.get_by_owner_user_id('user-1')],
+            )
+        finally:
+            await reopened.close()
+
+    by_bot, old_workspace, by_workspace, by_user = asyncio.run(run())
+    assert by_bot == _make_token_info('bot-1', workspace_id='w3')
+    assert old_workspace is None
+    assert by_workspace.bot_id == 'bot-2'
+    assert sorted(by_user) == ['bot-1', 'bot-2']
+
+
+def test_failed_commit_fails_all_of_its_saves(tmp_path):
+    async def run():
+        store = SQLiteTokenStore(settings=TokenStoreSettings(path=str(tmp_path / 'tokens.db')))
+
+        def fail(rows):
+            raise sqlite3.OperationalError('database is locked')
+
+        store._write_rows = fail
+        results = await asyncio.gather(
+            *(store.save(_make_token_info(f'bot-{i}')) for i in range(3)), return_exceptions=True,
+        )
+        await store.close()
+        return results
+
+    assert all(isinstance(result, sqlite3.OperationalError) for result in asyncio.run(run()))
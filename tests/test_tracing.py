@@ -0,0 +1,46 @@
+import asyncio
+import socket
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from notion_oauth_handler.core.tracing import InMemoryTracer
+
+from helpers import serve
+
+
+def _get_closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _request(tracer: InMemoryTracer, url: str) -> None:
+    async with aiohttp.ClientSession(trace_configs=[tracer.make_trace_config()]) as session:
+        async with session.get(url) as response:
+            await response.read()
+
+
+def test_request_and_connection_spans_are_reported():
+    async def run(tracer):
+        async with serve(web.Application()) as base_url:
+            await _request(tracer, f'{base_url}/missing')
+
+    tracer = InMemoryTracer()
+    asyncio.run(run(tracer))
+    [request_span] = tracer.find('http.client.request')
+    assert request_span.attributes['status'] == 404
+    [connection_span] = tracer.find('http.client.connect')
+    assert connection_span.error is None
+
+
+def test_failed_connection_span_is_ended():
+    tracer = InMemoryTracer()
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(_request(tracer, f'http://127.0.0.1:{_get_closed_port()}/'))
+    [connection_span] = tracer.find('http.client.connect')
+    assert connection_span.end_time is not None
+    assert isinstance(connection_span.error, aiohttp.ClientConnectionError)
+    [request_span] = tracer.find('http.client.request')
+    assert request_span.error is connection_span.error
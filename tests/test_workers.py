@@ -0,0 +1,28 @@
+import signal
+import time
+
+import pytest
+
+from notion_oauth_handler.server.workers import WorkerSupervisor
+
+
+def _failing_app_factory():
+    raise RuntimeError('Broken app')
+
+
+def test_supervisor_gives_up_on_workers_that_keep_crashing():
+    supervisor = WorkerSupervisor(
+        prepare_app_factory=lambda: _failing_app_factory,
+        host='127.0.0.1', port=0, workers=2,
+        poll_interval=0.01, restart_base_delay=0.01, restart_max_delay=0.05, max_restarts=5,
+    )
+    start = time.monotonic()
+    try:
+        with pytest.raises(SystemExit) as exc_info:
+            supervisor.run()
+    finally:
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL if signum != signal.SIGINT else signal.default_int_handler)
+
+    assert exc_info.value.code == 1
+    assert time.monotonic() - start < 10